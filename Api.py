@@ -1,7 +1,7 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import subprocess
+from pydantic import BaseModel
 import uuid
 import time
 import logging
@@ -11,9 +11,23 @@ import asyncio
 import os
 import random
 import json
-from typing import Optional, Dict, Any
+import shlex
+import signal
+import heapq
+import itertools
+import math
+import contextlib
+import contextvars
+import sqlite3
+import shutil
+import threading
+from typing import Optional, Dict, Any, List, Tuple, Set
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
+from email.utils import formatdate
 import concurrent.futures
+import anyio
+import yt_dlp
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -28,13 +42,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Thread pool
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=30)
-
 # Token storage
 download_tokens: Dict[str, Dict] = {}
 TOKEN_TTL = 300
-DOWNLOAD_CACHE: Dict[str, Dict] = {}
+TOKEN_SEEK_WINDOW = int(os.getenv("TOKEN_SEEK_WINDOW", "120"))  # seconds a used token keeps serving its player's seeks
+DOWNLOAD_CACHE: "OrderedDict[str, Dict]" = OrderedDict()  # least recently used first
+INFLIGHT_DOWNLOADS: Dict[Tuple[str, str], asyncio.Task] = {}
+GROWING_FILES: Dict[Tuple[str, str], Dict[str, Any]] = {}  # in-progress downloads that can be tailed: {path, complete}
+DOWNLOAD_PIPELINES: Dict[str, str] = {}  # work file -> how it was produced (copy/remux/transcode)
+FLIGHT_WAITERS: Dict[Tuple[str, str], int] = {}  # clients waiting on each in-flight download
+PINNED_FLIGHTS: Set[Tuple[str, str]] = set()  # downloads that run without waiters (prefetch)
+CANCELLED_FLIGHTS: Dict[Tuple[str, str], asyncio.Task] = {}  # abandoned downloads still shutting down
 CACHE_DIR = "cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
 
@@ -80,108 +98,1185 @@ def extract_video_id(url_or_id: str) -> str:
     match = re.search(r'([a-zA-Z0-9_-]{11})', url_or_id)
     return match.group(1) if match else url_or_id
 
-async def get_video_metadata(video_id: str) -> Dict[str, Any]:
-    """Get video metadata including title, duration, thumbnail, etc."""
-    cmd = [
-        "yt-dlp",
-        "--no-warnings",
-        "--quiet",
-        "--dump-json",
-        "--skip-download",
-        f"https://youtu.be/{video_id}"
-    ]
+# =============== REQUEST TRACING ===============
+# Every request gets a trace id (taken from an incoming X-Trace-Id or made up)
+# and timed spans for the stages it goes through: lane waits, extraction,
+# format probe, each strategy, each yt-dlp run with its exit code and stderr
+# class, yt-dlp's postprocessors (ffmpeg), cache writes and the first byte
+# sent. The id comes back in X-Trace-Id (spans finished by then also go into
+# Server-Timing) and finished traces are kept in a ring buffer behind
+# /debug/traces. Work done by a shared download flight is traced on the
+# request that started it; requests that join it get a join span.
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "10"))
+TRACE_MAX_SPANS = 200
+TRACE_SKIP_PATHS = ("/metrics", "/debug/")
+
+CURRENT_TRACE: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("current_trace", default=None)
+TRACES: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+
+def record_span(name: str, start: float, end: float, **attrs):
+    """Attach a finished span to the current request's trace, if any"""
+    trace = CURRENT_TRACE.get()
+    if trace is None or len(trace["spans"]) >= TRACE_MAX_SPANS:
+        return
+    trace["spans"].append({
+        "name": name,
+        "start_ms": round((start - trace["started"]) * 1000, 1),
+        "duration_ms": round((end - start) * 1000, 1),
+        **attrs
+    })
+
+@contextlib.contextmanager
+def trace_span(name: str, **attrs):
+    """Time a block as a span; the yielded dict takes extra attributes"""
+    start = time.time()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        record_span(name, start, time.time(), **attrs)
+
+def classify_stderr(lines: List[str]) -> str:
+    """Coarse reason for a failed yt-dlp run"""
+    text = "\n".join(lines)
+    if not text:
+        return "none"
+    if RATE_LIMIT_RE.search(text):
+        return "rate_limited"
+    if re.search(r"Video unavailable|Private video|has been removed|not available", text, re.I):
+        return "unavailable"
+    if re.search(r"ffmpeg|ffprobe|Postprocessing|Conversion failed", text, re.I):
+        return "postprocess"
+    if re.search(r"timed out|Connection|Unable to download|HTTP Error 5\d\d|Read timed out", text, re.I):
+        return "network"
+    return "other"
+
+class TraceMiddleware:
+    """Pure ASGI, so zero-copy/pathsend responses pass straight through"""
     
-    if HAS_COOKIES:
-        cmd.insert(5, "--cookies")
-        cmd.insert(6, COOKIE_FILE)
+    def __init__(self, app):
+        self.app = app
+        
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(TRACE_SKIP_PATHS):
+            await self.app(scope, receive, send)
+            return
+            
+        incoming = dict(scope.get("headers") or []).get(b"x-trace-id", b"").decode("latin-1")
+        trace = {
+            "trace_id": incoming if re.fullmatch(r"[\w-]{8,64}", incoming) else uuid.uuid4().hex[:16],
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "started": time.time(),
+            "status": None,
+            "duration_ms": None,
+            "spans": []
+        }
+        token = CURRENT_TRACE.set(trace)
+        first_byte = False
+        
+        async def traced_send(message):
+            nonlocal first_byte
+            if message["type"] == "http.response.start":
+                trace["status"] = message["status"]
+                timing = ", ".join(
+                    f"{re.sub(r'[^A-Za-z0-9_-]', '_', s['name'])};dur={s['duration_ms']}" for s in trace["spans"][:20]
+                )
+                headers = list(message.get("headers") or []) + [(b"x-trace-id", trace["trace_id"].encode())]
+                if timing:
+                    headers.append((b"server-timing", timing.encode()))
+                message = {**message, "headers": headers}
+            elif not first_byte:
+                first_byte = True
+                now = time.time()
+                record_span("first_byte", now, now)
+            await send(message)
+            
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            CURRENT_TRACE.reset(token)
+            duration = time.time() - trace["started"]
+            trace["duration_ms"] = round(duration * 1000, 1)
+            TRACES.append(trace)
+            if duration >= TRACE_SLOW_SECONDS:
+                slowest = sorted(trace["spans"], key=lambda s: -s["duration_ms"])[:3]
+                logger.warning(
+                    f"🐢 Slow request {trace['trace_id']} {trace['path']} {duration:.1f}s: "
+                    + ", ".join(f"{s['name']} {s['duration_ms'] / 1000:.1f}s" for s in slowest)
+                )
+
+app.add_middleware(TraceMiddleware)
+
+# =============== METRICS ===============
+# Prometheus text-format metrics, kept in a tiny in-process registry (no extra
+# dependency). Counters and histograms are updated where things happen; gauges
+# are read from the live state when /metrics is scraped.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300)
+
+class Metric:
+    """One counter or histogram family with labels"""
     
-    try:
-        result = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+    def __init__(self, name: str, help_text: str, kind: str = "counter", labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labels = labels
+        self.buckets = buckets
+        self.values: Dict[Tuple[str, ...], Any] = {}
+        METRICS.append(self)
+        
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+        
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+        
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+        
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.values.items():
+            labels = dict(zip(self.labels, key))
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{format_labels(labels)} {value}")
+                continue
+            for bound, count in zip(self.buckets, value["buckets"]):
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {value['count']}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {value['sum']}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {value['count']}")
+        return lines
+
+METRICS: List[Metric] = []
+
+def format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+def gauge_lines(name: str, help_text: str, samples: List[Tuple[Dict[str, Any], float]]) -> List[str]:
+    """A gauge family computed at scrape time"""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"] + [f"{name}{format_labels(labels)} {value}" for labels, value in samples]
+
+def counter_lines(name: str, help_text: str, samples: List[Tuple[Dict[str, Any], float]]) -> List[str]:
+    """A counter family whose running totals are kept elsewhere, read at scrape time"""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} counter"] + [f"{name}{format_labels(labels)} {value}" for labels, value in samples]
+
+STRATEGY_SECONDS = Metric("ytapi_strategy_duration_seconds", "Download strategy attempt duration", "histogram", ("media_type", "strategy", "outcome"))
+STRATEGY_ATTEMPTS = Metric("ytapi_strategy_attempts_total", "Download strategy attempts by cookie/proxy profile", "counter", ("media_type", "strategy", "profile", "outcome"))
+METADATA_SECONDS = Metric("ytapi_metadata_fetch_seconds", "Upstream metadata fetch duration", "histogram", ("status",))
+METADATA_REQUESTS = Metric("ytapi_metadata_requests_total", "Metadata lookups by cache result", "counter", ("cache",))
+CACHE_LOOKUPS = Metric("ytapi_cache_lookups_total", "Media cache lookups", "counter", ("media_type", "result"))
+BYTES_SERVED = Metric("ytapi_bytes_served_total", "Response body bytes sent, by source", "counter", ("source",))
+UPSTREAM_OUTCOMES = Metric("ytapi_upstream_jobs_total", "Extraction/download jobs per proxy and cookie profile", "counter", ("proxy", "cookies", "outcome"))
+LANE_SHED = Metric("ytapi_lane_shed_total", "Jobs rejected by a scheduler lane", "counter", ("lane", "status"))
+
+# =============== SUBPROCESS SUPERVISOR ===============
+# Child processes (yt-dlp downloads and the aria2c/ffmpeg they start) run
+# through asyncio instead of blocking a worker thread in subprocess.run. Each
+# child gets its own process group so a timeout or cancellation kills the whole
+# tree, and the number of concurrent children is capped per workload.
+
+YTDLP_COMMAND = shlex.split(os.getenv("YTDLP_COMMAND", "yt-dlp"))
+FFMPEG_COMMAND = shlex.split(os.getenv("FFMPEG_COMMAND", "ffmpeg"))
+SUBPROCESS_LIMITS = {
+    "audio": int(os.getenv("AUDIO_PROCESS_LIMIT", "12")),
+    "video": int(os.getenv("VIDEO_PROCESS_LIMIT", "4")),
+    "default": int(os.getenv("DEFAULT_PROCESS_LIMIT", "8")),
+}
+SUBPROCESS_KILL_GRACE = 2
+SUBPROCESS_OUTPUT_LINES = 200
+
+_subprocess_slots: Dict[str, asyncio.Semaphore] = {}
+RUNNING_PROCESSES: Dict[int, Dict[str, Any]] = {}
+
+def _subprocess_slot(workload: str) -> asyncio.Semaphore:
+    """Concurrency cap for one workload (created lazily, inside the running loop)"""
+    if workload not in _subprocess_slots:
+        _subprocess_slots[workload] = asyncio.Semaphore(SUBPROCESS_LIMITS.get(workload, SUBPROCESS_LIMITS["default"]))
+    return _subprocess_slots[workload]
+
+async def _kill_process_group(proc: asyncio.subprocess.Process):
+    """SIGTERM the child's process group, then SIGKILL if it doesn't exit"""
+    if proc.returncode is not None:
+        return
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(proc.wait(), SUBPROCESS_KILL_GRACE)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+async def _pump_lines(stream: asyncio.StreamReader, sink: deque, name: str, on_line):
+    """Read a child's output incrementally, splitting on \\n and \\r (progress bars)"""
+    pending = b""
+    while True:
+        data = await stream.read(4096)
+        if not data:
+            break
+        pending += data
+        *lines, pending = re.split(rb"[\r\n]", pending)
+        for raw in lines:
+            line = raw.decode(errors="replace").strip()
+            if line:
+                sink.append(line)
+                if on_line:
+                    on_line(name, line)
+    if pending.strip():
+        line = pending.decode(errors="replace").strip()
+        sink.append(line)
+        if on_line:
+            on_line(name, line)
+
+async def run_supervised(cmd: List[str], workload: str = "default", timeout: float = 60, on_line=None,
+                         env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Run a child process without tying up a thread.
+    
+    Returns returncode, the tail of stdout/stderr and the elapsed time. Raises
+    asyncio.TimeoutError after killing the process group if it runs too long;
+    cancelling the caller kills it too. env is added to our own environment.
+    """
+    async with _subprocess_slot(workload):
+        start_time = time.time()
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+            env={**os.environ, **env} if env else None
         )
+        RUNNING_PROCESSES[proc.pid] = {"workload": workload, "cmd": cmd[0], "started": start_time}
+        stdout_lines: deque = deque(maxlen=SUBPROCESS_OUTPUT_LINES)
+        stderr_lines: deque = deque(maxlen=SUBPROCESS_OUTPUT_LINES)
         
-        if result.returncode == 0 and result.stdout:
-            metadata = json.loads(result.stdout)
+        pumps = [
+            asyncio.create_task(_pump_lines(proc.stdout, stdout_lines, "stdout", on_line)),
+            asyncio.create_task(_pump_lines(proc.stderr, stderr_lines, "stderr", on_line)),
+        ]
+        
+        try:
+            await asyncio.wait_for(asyncio.wait(pumps + [asyncio.ensure_future(proc.wait())]), timeout)
+            for pump in pumps:
+                pump.result()
+        except BaseException:
+            # Timeout, cancellation or a failing callback: take the whole tree down
+            await asyncio.shield(_kill_process_group(proc))
+            raise
+        finally:
+            for pump in pumps:
+                pump.cancel()
+            RUNNING_PROCESSES.pop(proc.pid, None)
             
-            # Extract essential info
-            video_info = {
-                "video_id": video_id,
-                "title": metadata.get("title", "Unknown Title"),
-                "duration": metadata.get("duration", 0),
-                "duration_string": metadata.get("duration_string", "0:00"),
-                "uploader": metadata.get("uploader", "Unknown Uploader"),
-                "view_count": metadata.get("view_count", 0),
-                "like_count": metadata.get("like_count", 0),
-                "thumbnail": metadata.get("thumbnail", ""),
-                "description": metadata.get("description", "")[:200] + "..." if metadata.get("description") else "",
-                "categories": metadata.get("categories", []),
-                "tags": metadata.get("tags", [])[:5],
-                "upload_date": metadata.get("upload_date", ""),
-                "available_formats": [],
-                "status": "available"
-            }
-            
-            # Get available formats
-            formats_cmd = [
-                "yt-dlp",
-                "--no-warnings",
-                "--quiet",
-                "--list-formats",
-                f"https://youtu.be/{video_id}"
-            ]
-            
-            formats_result = await asyncio.get_event_loop().run_in_executor(
-                executor,
-                lambda: subprocess.run(formats_cmd, capture_output=True, text=True, timeout=10)
+        return {
+            "returncode": proc.returncode,
+            "stdout": list(stdout_lines),
+            "stderr": list(stderr_lines),
+            "elapsed": time.time() - start_time
+        }
+
+async def kill_running_processes():
+    """Kill every supervised child (shutdown)"""
+    for pid in list(RUNNING_PROCESSES):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+# =============== JOB SCHEDULER ===============
+# Work is admitted through separate lanes so one kind of load can't starve
+# another: cheap metadata lookups never queue behind video downloads. Each lane
+# has a fixed number of slots and a bounded wait queue ordered by priority
+# (lower runs first). A full queue is rejected at once with 429, and a job
+# that waits too long for a slot gives up with 503; both carry Retry-After.
+
+PRIORITY_INTERACTIVE = 0   # playback and single metadata lookups
+PRIORITY_DOWNLOAD = 5      # file downloads (/audio, /video)
+PRIORITY_BATCH = 10        # /api/metadata/batch
+PRIORITY_BACKGROUND = 20   # stale refreshes
+
+def _lane_config(name: str, slots: int, queue: int, wait: float) -> Dict[str, Any]:
+    prefix = f"LANE_{name.upper()}_"
+    return {
+        "slots": int(os.getenv(prefix + "SLOTS", str(slots))),
+        "queue": int(os.getenv(prefix + "QUEUE", str(queue))),
+        "wait": float(os.getenv(prefix + "WAIT", str(wait))),
+    }
+
+LANE_CONFIG = {
+    "metadata": _lane_config("metadata", int(os.getenv("EXTRACT_WORKERS", "16")), 200, 10),
+    "audio": _lane_config("audio", 12, 50, 30),
+    "video": _lane_config("video", 3, 10, 60),
+    "prefetch": _lane_config("prefetch", 2, 1000, 0),  # 0 = wait as long as it takes
+    "transcode": _lane_config("transcode", 4, 8, 10),
+}
+
+class LaneSaturated(Exception):
+    """A lane can't take more work right now"""
+    def __init__(self, lane: str, status_code: int, retry_after: int):
+        super().__init__(f"{lane} lane is saturated")
+        self.lane = lane
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class SchedulerLane:
+    """Fixed worker slots plus a bounded, priority-ordered wait queue"""
+    
+    def __init__(self, name: str, slots: int, queue: int, wait: float):
+        self.name = name
+        self.slots = max(slots, 1)
+        self.max_queue = queue
+        self.max_wait = wait or None
+        self.active = 0
+        self.waiting: List[list] = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self.service_time = 5.0  # moving average of seconds per job, for Retry-After
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        
+    def retry_after(self) -> int:
+        """Rough time until a new job would get a slot"""
+        return max(1, math.ceil(self.service_time * (len(self.waiting) + 1) / self.slots))
+        
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        if self.active < self.slots and not self.waiting:
+            self.active += 1
+            return
+        if len(self.waiting) >= self.max_queue:
+            self.rejected += 1
+            LANE_SHED.inc(lane=self.name, status=429)
+            raise LaneSaturated(self.name, 429, self.retry_after())
+            
+        entry = [priority, next(self._seq), asyncio.get_event_loop().create_future()]
+        heapq.heappush(self.waiting, entry)
+        try:
+            with trace_span(f"lane_wait:{self.name}", priority=priority):
+                await asyncio.wait_for(asyncio.shield(entry[2]), self.max_wait)
+        except BaseException as e:
+            if entry[2].done() and not entry[2].cancelled():
+                # The slot was handed to us just as we gave up: pass it on
+                self.release()
+            else:
+                entry[2].cancel()
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                LANE_SHED.inc(lane=self.name, status=503)
+                raise LaneSaturated(self.name, 503, self.retry_after())
+            raise
+            
+    def release(self):
+        # Hand the slot straight to the best waiter, if any
+        while self.waiting:
+            future = heapq.heappop(self.waiting)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+        
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE):
+        await self.acquire(priority)
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.service_time = 0.8 * self.service_time + 0.2 * (time.time() - started)
+            self.completed += 1
+            self.release()
+            
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "queued": len(self.waiting),
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_service_time": round(self.service_time, 2)
+        }
+
+LANES: Dict[str, SchedulerLane] = {name: SchedulerLane(name, **config) for name, config in LANE_CONFIG.items()}
+
+async def run_in_lane(lane: str, priority: int, func, *args):
+    """Run func(*args) once the lane grants a slot"""
+    async with LANES[lane].slot(priority):
+        return await func(*args)
+
+@app.exception_handler(LaneSaturated)
+async def lane_saturated_handler(request: Request, exc: LaneSaturated):
+    logger.warning(f"🚦 {exc.lane} lane saturated ({exc.status_code}), retry after {exc.retry_after}s")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "status": "busy",
+            "error": f"Server busy ({exc.lane}), try again later",
+            "retry_after": exc.retry_after
+        },
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# =============== DOWNLOAD PROGRESS ===============
+# yt-dlp children are asked for machine-readable progress lines, and aria2c
+# (when yt-dlp hands a download to it) prints its console readout into the
+# same pipe. Both are parsed into one progress record per in-flight download,
+# together with the strategy currently being tried.
+
+YTDLP_PROGRESS_ARGS = [
+    "--progress", "--newline",
+    "--progress-template",
+    "download:[progress] %(progress.downloaded_bytes)s %(progress.total_bytes)s "
+    "%(progress.total_bytes_estimate)s %(progress.speed)s %(progress.eta)s",
+    "--progress-template", "postprocess:[postprocess] %(progress.status)s %(progress.postprocessor)s",
+]
+ARIA2_PROGRESS_RE = re.compile(
+    r"\[#\w+\s+([\d.]+\w*B)/([\d.]+\w*B)\((\d+)%\).*?DL:([\d.]+\w*B)(?:\s+ETA:(\w+))?"
+)
+SIZE_UNITS = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+DOWNLOAD_PROGRESS: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+def _parse_size(text: str) -> Optional[int]:
+    match = re.fullmatch(r"([\d.]+)(\w*B)", text)
+    if not match or match.group(2) not in SIZE_UNITS:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+def _parse_eta(text: Optional[str]) -> Optional[int]:
+    # aria2c style: 1h2m3s / 4m51s / 9s
+    if not text:
+        return None
+    parts = re.findall(r"(\d+)([hms])", text)
+    return sum(int(n) * {"h": 3600, "m": 60, "s": 1}[unit] for n, unit in parts) if parts else None
+
+def _number(text: str) -> Optional[float]:
+    try:
+        return float(text)
+    except ValueError:
+        return None  # "NA"
+
+def parse_progress_line(line: str) -> Optional[Dict[str, Any]]:
+    """Bytes done/total, speed and ETA from a yt-dlp template or aria2c readout line"""
+    if line.startswith("[progress]"):
+        fields = line.split()[1:]
+        if len(fields) != 5:
+            return None
+        downloaded, total, estimate, speed, eta = (_number(f) for f in fields)
+        return {
+            "downloaded_bytes": int(downloaded) if downloaded is not None else None,
+            "total_bytes": int(total or estimate) if (total or estimate) else None,
+            "speed": speed,
+            "eta": int(eta) if eta is not None else None,
+        }
+        
+    match = ARIA2_PROGRESS_RE.search(line)
+    if match:
+        return {
+            "downloaded_bytes": _parse_size(match.group(1)),
+            "total_bytes": _parse_size(match.group(2)),
+            "speed": _parse_size(match.group(4)),
+            "eta": _parse_eta(match.group(5)),
+        }
+    return None
+
+def set_download_stage(video_id: str, media_type: str, stage: str):
+    """Record which strategy an in-flight download is on (resets the byte counters)"""
+    progress = DOWNLOAD_PROGRESS.get((video_id, media_type))
+    if progress is not None:
+        progress.update(stage=stage, downloaded_bytes=None, total_bytes=None, speed=None, eta=None, percent=None)
+
+def update_progress(flight_key: Tuple[str, str], line: str):
+    """on_line callback for supervised yt-dlp children"""
+    progress = DOWNLOAD_PROGRESS.get(flight_key)
+    parsed = parse_progress_line(line) if progress is not None else None
+    if not parsed:
+        return
+    progress.update(parsed)
+    if parsed["downloaded_bytes"] is not None and parsed["total_bytes"]:
+        progress["percent"] = round(100 * parsed["downloaded_bytes"] / parsed["total_bytes"], 1)
+    progress["updated_at"] = time.time()
+
+# =============== PROXY POOL ===============
+# Extraction and downloads are spread over PROXIES instead of all leaving from
+# one IP. Every proxy keeps moving averages of success rate, latency and
+# throughput; each job goes to the best-scoring healthy proxy, discounted by
+# how many jobs it is already carrying. Proxies that keep failing or get
+# rate-limited are ejected for a while (longer each time), and a background
+# probe keeps the latency numbers fresh and spots dead proxies early.
+# YouTube media URLs are bound to the IP that extracted them, so a download
+# always goes through the proxy its info dict was extracted with. Opt-in with
+# USE_PROXIES=1. Proxy URLs carry credentials, so download children get theirs
+# through the environment (readable only by our own user), never in argv.
+
+USE_PROXIES = os.getenv("USE_PROXIES", "0") == "1"
+PROXY_LIST = [p.strip() for p in os.getenv("PROXY_LIST", "").split(",") if p.strip()] or PROXIES
+PROXY_PROBE_URL = os.getenv("PROXY_PROBE_URL", "https://www.youtube.com/generate_204")
+PROXY_PROBE_INTERVAL = int(os.getenv("PROXY_PROBE_INTERVAL", "60"))
+PROXY_PROBE_TIMEOUT = 10
+PROXY_EJECT_FAILURES = 3
+PROXY_EJECT_SECONDS = 300
+PROXY_MAX_EJECT_SECONDS = 3600
+PROXY_EWMA_ALPHA = 0.2
+
+RATE_LIMIT_RE = re.compile(r"HTTP Error 429|Too Many Requests|HTTP Error 403|confirm you.re not a bot|rate.?limit", re.I)
+
+class ProxyState:
+    """Health and performance of one proxy"""
+    
+    def __init__(self, url: str):
+        self.url = url
+        self.label = url.rsplit("@", 1)[-1]  # host:port, without credentials
+        self.success_rate = 1.0
+        self.latency: Optional[float] = None
+        self.throughput: Optional[float] = None  # bytes/s
+        self.active = 0
+        self.jobs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        
+    def healthy(self) -> bool:
+        return time.time() >= self.ejected_until
+        
+    def score(self) -> float:
+        latency = self.latency if self.latency is not None else 1.0
+        throughput_bonus = 1 + math.log1p((self.throughput or 0) / (1024 * 1024))
+        return self.success_rate * throughput_bonus / (latency + 0.5) / (1 + self.active)
+        
+    def record(self, ok: bool, latency: Optional[float] = None, throughput: Optional[float] = None, rate_limited: bool = False):
+        self.success_rate += PROXY_EWMA_ALPHA * ((1.0 if ok else 0.0) - self.success_rate)
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + PROXY_EWMA_ALPHA * (latency - self.latency)
+        if throughput:
+            self.throughput = throughput if self.throughput is None else self.throughput + PROXY_EWMA_ALPHA * (throughput - self.throughput)
+        if ok:
+            self.consecutive_failures = 0
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if rate_limited or self.consecutive_failures >= PROXY_EJECT_FAILURES:
+            self.eject("rate limited" if rate_limited else f"{self.consecutive_failures} failures in a row")
+            
+    def eject(self, reason: str):
+        seconds = min(PROXY_EJECT_SECONDS * 2 ** self.ejections, PROXY_MAX_EJECT_SECONDS)
+        self.ejections += 1
+        self.consecutive_failures = 0
+        self.ejected_until = time.time() + seconds
+        logger.warning(f"🚫 Proxy {self.label} out of rotation for {seconds}s ({reason})")
+        
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "proxy": self.label,
+            "healthy": self.healthy(),
+            "score": round(self.score(), 3),
+            "success_rate": round(self.success_rate, 3),
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "throughput": int(self.throughput) if self.throughput else None,
+            "active": self.active,
+            "jobs": self.jobs,
+            "failures": self.failures,
+            "ejections": self.ejections
+        }
+
+PROXY_POOL: Dict[str, ProxyState] = {url: ProxyState(url) for url in PROXY_LIST} if USE_PROXIES else {}
+
+def choose_proxy() -> Optional[str]:
+    """Best-scoring healthy proxy (ties broken at random), or None to go direct"""
+    healthy = [p for p in PROXY_POOL.values() if p.healthy()]
+    if not healthy:
+        return None
+    return max(healthy, key=lambda p: (p.score(), random.random())).url
+
+def proxy_started(proxy: Optional[str]):
+    state = PROXY_POOL.get(proxy)
+    if state:
+        state.active += 1
+        state.jobs += 1
+
+def proxy_finished(proxy: Optional[str], ok: Optional[bool], latency: Optional[float] = None, throughput: Optional[float] = None, rate_limited: bool = False):
+    """Release a proxy after a job; ok=None records no verdict (e.g. the job was cancelled)"""
+    state = PROXY_POOL.get(proxy)
+    if ok is not None:
+        outcome = "rate_limited" if rate_limited else "success" if ok else "failure"
+        UPSTREAM_OUTCOMES.inc(proxy=state.label if state else "direct", cookies="yes" if HAS_COOKIES else "no", outcome=outcome)
+    if state:
+        state.active = max(state.active - 1, 0)
+        if ok is not None:
+            state.record(ok, latency, throughput, rate_limited)
+
+async def probe_proxies():
+    """Background health probes for every proxy in the pool"""
+    while PROXY_POOL:
+        timeout = aiohttp.ClientTimeout(total=PROXY_PROBE_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async def probe(state: ProxyState):
+                start_time = time.time()
+                try:
+                    async with session.get(PROXY_PROBE_URL, proxy=state.url) as response:
+                        await response.read()
+                        ok = response.status < 400
+                        state.record(ok, time.time() - start_time if ok else None, rate_limited=response.status == 429)
+                except Exception:
+                    state.record(False)
+                    
+            await asyncio.gather(*(probe(state) for state in PROXY_POOL.values()))
+            
+        healthy = sum(1 for state in PROXY_POOL.values() if state.healthy())
+        logger.info(f"🌐 Proxy probe: {healthy}/{len(PROXY_POOL)} healthy")
+        await asyncio.sleep(PROXY_PROBE_INTERVAL)
+
+# =============== IN-PROCESS EXTRACTION ENGINE ===============
+# Extraction runs inside this process through the YoutubeDL API and reuses
+# warm YoutubeDL instances (one idle pool per cookie/proxy profile), so the
+# extractor imports and player JS caches survive between requests. Downloads
+# are handed the extracted info dict (--load-info-json) and run as supervised
+# children, so they skip extraction but can still be timed out and killed.
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "16"))
+extract_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=EXTRACT_WORKERS, thread_name_prefix="extract"
+)
+EXTRACT_QUEUE = {"waiting": 0}  # extractions submitted but not yet picked up by a thread
+EXTRACT_QUEUE_LOCK = threading.Lock()
+
+def _leave_extract_queue(job: Dict[str, bool]):
+    """Count a job out of the queue once, whether a thread started it or it was abandoned"""
+    with EXTRACT_QUEUE_LOCK:
+        if not job["dequeued"]:
+            job["dequeued"] = True
+            EXTRACT_QUEUE["waiting"] -= 1
+
+def _queued_extract(job: Dict[str, bool], video_id: str, proxy: Optional[str]) -> Dict[str, Any]:
+    """Executor entry point for one extraction"""
+    _leave_extract_queue(job)
+    return _extract_info_sync(video_id, proxy)
+
+YDL_POOL: Dict[Tuple[Optional[str], Optional[str]], List[yt_dlp.YoutubeDL]] = {}
+YDL_POOL_LOCK = threading.Lock()
+
+EXTRACT_ARGS = [
+    "--no-warnings",
+    "--quiet",
+    "--no-playlist",
+    "--force-ipv4",
+    "--socket-timeout", "15",
+    "--skip-download",
+]
+
+def profile_args(proxy: Optional[str] = None) -> List[str]:
+    """yt-dlp arguments for the cookie/proxy profile (in-process options only:
+    child processes get the proxy from proxy_env)"""
+    args = []
+    if HAS_COOKIES:
+        args += ["--cookies", COOKIE_FILE]
+    if proxy:
+        args += ["--proxy", proxy]
+    return args
+
+def proxy_env(proxy: Optional[str]) -> Dict[str, str]:
+    """Environment that routes a child (yt-dlp and the aria2c it starts) through a proxy"""
+    if not proxy:
+        return {}
+    return {name: proxy for name in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "http_proxy", "https_proxy", "all_proxy")}
+
+def ydl_opts_from_args(args: List[str], proxy: Optional[str] = None) -> Dict[str, Any]:
+    """Translate yt-dlp command line arguments into YoutubeDL params"""
+    return yt_dlp.parse_options(profile_args(proxy) + args).ydl_opts
+
+def _acquire_ydl(proxy: Optional[str]) -> Tuple[Tuple[Optional[str], Optional[str]], yt_dlp.YoutubeDL]:
+    """Check out an idle YoutubeDL for this profile, or build a new one"""
+    profile = (COOKIE_FILE if HAS_COOKIES else None, proxy)
+    with YDL_POOL_LOCK:
+        idle = YDL_POOL.setdefault(profile, [])
+        if idle:
+            return profile, idle.pop()
+    opts = ydl_opts_from_args(EXTRACT_ARGS, proxy)
+    opts["ignoreerrors"] = False  # raise DownloadError instead of returning None
+    return profile, yt_dlp.YoutubeDL(opts)
+
+def _release_ydl(profile: Tuple[Optional[str], Optional[str]], ydl: yt_dlp.YoutubeDL):
+    """Return a YoutubeDL to its profile pool"""
+    with YDL_POOL_LOCK:
+        YDL_POOL.setdefault(profile, []).append(ydl)
+
+def _extract_info_sync(video_id: str, proxy: Optional[str] = None) -> Dict[str, Any]:
+    """Run extraction on a pooled YoutubeDL (worker thread)"""
+    profile, ydl = _acquire_ydl(proxy)
+    try:
+        info = ydl.extract_info(f"https://youtu.be/{video_id}", download=False)
+        return ydl.sanitize_info(info, remove_private_keys=True)
+    finally:
+        _release_ydl(profile, ydl)
+
+async def extract_info(video_id: str, timeout: float = 15, proxy: Optional[str] = None) -> Dict[str, Any]:
+    """Extract the full info dict for a video through the configured backend"""
+    return await BACKEND.extract(video_id, timeout, proxy)
+
+# =============== EXTRACTION BACKENDS ===============
+# Everything that talks to YouTube goes through one backend object: extraction
+# (metadata and the info dict the downloads are fed) and the yt-dlp download
+# children. EXTRACT_BACKEND picks it:
+#   live    the real thing (default)
+#   record  live, plus every extracted info dict and downloaded media file is
+#           saved under FIXTURE_DIR (info/{id}.json, media/{id}.{format}.{ext})
+#   replay  no network at all: recordings are served back after
+#           REPLAY_EXTRACT_LATENCY / REPLAY_DOWNLOAD_LATENCY seconds, media at
+#           REPLAY_RATE bytes/s (0 = disk speed). With REPLAY_FALLBACK_ID set,
+#           unknown ids are answered from that recording, so one recorded
+#           video can stand in for any number of distinct ones under load.
+
+EXTRACT_BACKEND = os.getenv("EXTRACT_BACKEND", "live")
+FIXTURE_DIR = os.getenv("FIXTURE_DIR", "fixtures")
+REPLAY_EXTRACT_LATENCY = float(os.getenv("REPLAY_EXTRACT_LATENCY", "0"))
+REPLAY_DOWNLOAD_LATENCY = float(os.getenv("REPLAY_DOWNLOAD_LATENCY", "0"))
+REPLAY_RATE = float(os.getenv("REPLAY_RATE", "0"))
+REPLAY_FALLBACK_ID = os.getenv("REPLAY_FALLBACK_ID") or None
+REPLAY_CHUNK_SIZE = 1024 * 1024
+
+def _option_value(args: List[str], flag: str) -> Optional[str]:
+    """Value after a command line flag (last one wins, like yt-dlp)"""
+    values = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == flag]
+    return values[-1] if values else None
+
+def fixture_media_name(video_id: str, format_spec: Optional[str], ext: str) -> str:
+    """File name a recorded download is stored under"""
+    return f"{video_id}.{re.sub(r'[^A-Za-z0-9+.-]', '_', format_spec or 'default')}.{ext}"
+
+class LiveBackend:
+    """yt-dlp against YouTube: in-process extraction, supervised yt-dlp children for downloads"""
+    
+    name = "live"
+    online = True
+    
+    async def extract(self, video_id: str, timeout: float, proxy: Optional[str]) -> Dict[str, Any]:
+        job = {"dequeued": False}
+        with EXTRACT_QUEUE_LOCK:
+            EXTRACT_QUEUE["waiting"] += 1
+        try:
+            return await asyncio.wait_for(
+                asyncio.get_event_loop().run_in_executor(extract_executor, _queued_extract, job, video_id, proxy),
+                timeout
             )
+        finally:
+            _leave_extract_queue(job)
+        
+    async def download(self, video_id: str, info_file: str, args: List[str], proxy: Optional[str],
+                       workload: str, timeout: float, on_line) -> Dict[str, Any]:
+        """Run one download; returns run_supervised's result"""
+        # Progress flags go last so they override the strategies' --no-progress
+        cmd = YTDLP_COMMAND + profile_args() + ["--load-info-json", info_file] + args + YTDLP_PROGRESS_ARGS
+        return await run_supervised(cmd, workload=workload, timeout=timeout, on_line=on_line, env=proxy_env(proxy))
+        
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name}
+
+class RecordBackend(LiveBackend):
+    """Live, saving what it fetches into the fixture store"""
+    
+    name = "record"
+    
+    def __init__(self, fixture_dir: str):
+        self.fixture_dir = fixture_dir
+        self.recorded = {"info": 0, "media": 0}
+        os.makedirs(os.path.join(fixture_dir, "info"), exist_ok=True)
+        os.makedirs(os.path.join(fixture_dir, "media"), exist_ok=True)
+        
+    async def extract(self, video_id: str, timeout: float, proxy: Optional[str]) -> Dict[str, Any]:
+        info = await super().extract(video_id, timeout, proxy)
+        path = os.path.join(self.fixture_dir, "info", f"{video_id}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(info, f)
+        os.replace(path + ".tmp", path)
+        self.recorded["info"] += 1
+        return info
+        
+    async def download(self, video_id: str, info_file: str, args: List[str], proxy: Optional[str],
+                       workload: str, timeout: float, on_line) -> Dict[str, Any]:
+        result = await super().download(video_id, info_file, args, proxy, workload, timeout, on_line)
+        output_file = _option_value(args, "-o")
+        if result["returncode"] == 0 and output_file and os.path.exists(output_file):
+            ext = os.path.splitext(output_file)[1].lstrip(".")
+            path = os.path.join(self.fixture_dir, "media", fixture_media_name(video_id, _option_value(args, "-f"), ext))
+            # A hard link costs nothing and survives the work file being moved into the cache
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            try:
+                os.link(output_file, path)
+            except OSError:
+                await asyncio.to_thread(shutil.copyfile, output_file, path)
+            self.recorded["media"] += 1
+        return result
+        
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "fixture_dir": self.fixture_dir, "recorded": dict(self.recorded)}
+
+class ReplayBackend:
+    """Serves recordings back with configurable latency; never touches the network"""
+    
+    name = "replay"
+    online = False
+    
+    def __init__(self, fixture_dir: str):
+        self.fixture_dir = fixture_dir
+        self.info_text: Dict[str, str] = {}  # raw JSON, parsed per call so callers get their own dict
+        self.served = {"info": 0, "media": 0, "missing": 0}
+        
+    def _recording_id(self, video_id: str) -> Optional[str]:
+        """The recording that answers for a video id, if any"""
+        if os.path.exists(os.path.join(self.fixture_dir, "info", f"{video_id}.json")):
+            return video_id
+        return REPLAY_FALLBACK_ID
+        
+    async def extract(self, video_id: str, timeout: float, proxy: Optional[str]) -> Dict[str, Any]:
+        await asyncio.sleep(REPLAY_EXTRACT_LATENCY)
+        recording_id = self._recording_id(video_id)
+        if recording_id not in self.info_text:
+            path = os.path.join(self.fixture_dir, "info", f"{recording_id}.json")
+            if recording_id is None or not os.path.exists(path):
+                self.served["missing"] += 1
+                raise yt_dlp.utils.DownloadError(f"ERROR: [replay] {video_id}: Video unavailable (no recording)")
+            with open(path) as f:
+                self.info_text[recording_id] = f.read()
+        info = json.loads(self.info_text[recording_id])
+        info["id"] = video_id
+        self.served["info"] += 1
+        return info
+        
+    def _media_for(self, video_id: str, format_spec: Optional[str], ext: str) -> Optional[str]:
+        """Recorded file for this download: same format if recorded, else any with the same extension"""
+        recording_id = self._recording_id(video_id)
+        if recording_id is None:
+            return None
+        media_dir = os.path.join(self.fixture_dir, "media")
+        exact = os.path.join(media_dir, fixture_media_name(recording_id, format_spec, ext))
+        if os.path.exists(exact):
+            return exact
+        prefix = f"{recording_id}."
+        candidates = sorted(n for n in os.listdir(media_dir) if n.startswith(prefix) and n.endswith(f".{ext}")) if os.path.isdir(media_dir) else []
+        return os.path.join(media_dir, candidates[0]) if candidates else None
+        
+    async def download(self, video_id: str, info_file: str, args: List[str], proxy: Optional[str],
+                       workload: str, timeout: float, on_line) -> Dict[str, Any]:
+        start_time = time.time()
+        output_file = _option_value(args, "-o")
+        source = output_file and self._media_for(video_id, _option_value(args, "-f"), os.path.splitext(output_file)[1].lstrip("."))
+        if not source:
+            self.served["missing"] += 1
+            return {"returncode": 1, "stdout": [], "stderr": [f"ERROR: [replay] {video_id}: no recorded media for {args}"[:300]],
+                    "elapsed": time.time() - start_time}
+                    
+        progress = await asyncio.wait_for(self._copy(source, output_file, "--no-part" in args, on_line), timeout)
+        self.served["media"] += 1
+        return {"returncode": 0, "stdout": [progress], "stderr": [], "elapsed": time.time() - start_time}
+        
+    async def _copy(self, source: str, output_file: str, no_part: bool, on_line) -> str:
+        """Write the recording out like a yt-dlp download would; returns the last progress line"""
+        await asyncio.sleep(REPLAY_DOWNLOAD_LATENCY)
+        target = output_file if no_part else output_file + ".part"
+        total = os.path.getsize(source)
+        written = 0
+        started = time.time()
+        progress = f"[progress] 0 {total} NA NA NA"
+        try:
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                while chunk := src.read(REPLAY_CHUNK_SIZE):
+                    dst.write(chunk)
+                    dst.flush()
+                    written += len(chunk)
+                    speed = written / max(time.time() - started, 1e-6)
+                    progress = f"[progress] {written} {total} NA {speed:.0f} {int((total - written) / speed)}"
+                    if on_line:
+                        on_line("stdout", progress)
+                    await asyncio.sleep(len(chunk) / REPLAY_RATE if REPLAY_RATE else 0)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(target)
+            raise
+        if target != output_file:
+            os.replace(target, output_file)
+        return progress
             
-            if formats_result.returncode == 0:
-                lines = formats_result.stdout.split('\n')
-                video_formats = []
-                audio_formats = []
-                
-                for line in lines:
-                    if 'video only' in line.lower() or ('mp4' in line.lower() and 'audio only' not in line.lower()):
-                        parts = line.split()
-                        if len(parts) > 1 and parts[0].isdigit():
-                            video_formats.append({
-                                "format_id": parts[0],
-                                "resolution": parts[1] if len(parts) > 1 else "unknown",
-                                "note": line[line.find(parts[1]) + len(parts[1]):].strip()[:50]
-                            })
-                    elif 'audio only' in line.lower():
-                        parts = line.split()
-                        if len(parts) > 1 and parts[0].isdigit():
-                            audio_formats.append({
-                                "format_id": parts[0],
-                                "ext": "m4a" if 'm4a' in line.lower() else "webm" if 'webm' in line.lower() else "opus",
-                                "note": line[line.find(parts[1]) + len(parts[1]):].strip()[:50]
-                            })
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "fixture_dir": self.fixture_dir, "served": dict(self.served)}
+
+EXTRACTION_BACKENDS = {"live": LiveBackend, "record": RecordBackend, "replay": ReplayBackend}
+if EXTRACT_BACKEND not in EXTRACTION_BACKENDS:
+    raise ValueError(f"EXTRACT_BACKEND must be one of {list(EXTRACTION_BACKENDS)}, got {EXTRACT_BACKEND!r}")
+BACKEND = LiveBackend() if EXTRACT_BACKEND == "live" else EXTRACTION_BACKENDS[EXTRACT_BACKEND](FIXTURE_DIR)
+
+# Extracted info dicts, shared by metadata and every download strategy so a
+# cold download does a single upstream extraction. The dicts are large (every
+# format with its URL), so the cache is an LRU bounded by entry count; expired
+# entries are swept by the cleanup loop, and concurrent misses for one video
+# share a single extraction.
+INFO_CACHE: "OrderedDict[str, Dict]" = OrderedDict()  # least recently used first
+INFO_CACHE_TTL = 1800
+INFO_CACHE_MAX_ENTRIES = int(os.getenv("INFO_CACHE_MAX_ENTRIES", "512"))
+INFO_FLIGHTS: Dict[str, asyncio.Task] = {}
+
+async def get_video_info_entry(video_id: str, timeout: float = 15) -> Dict[str, Any]:
+    """Cached {info, proxy, timestamp} for a video, extracting through the proxy pool if needed"""
+    cached = INFO_CACHE.get(video_id)
+    if cached and time.time() - cached["timestamp"] < INFO_CACHE_TTL:
+        INFO_CACHE.move_to_end(video_id)
+        return cached
+    
+    task = INFO_FLIGHTS.get(video_id)
+    if task is None:
+        task = asyncio.create_task(_extract_info_entry(video_id, timeout))
+        INFO_FLIGHTS[video_id] = task
+        
+        def _flight_done(t: asyncio.Task):
+            if INFO_FLIGHTS.get(video_id) is t:
+                del INFO_FLIGHTS[video_id]
+            if not t.cancelled():
+                t.exception()  # retrieved by the callers; don't warn if they all left
                 
-                video_info["video_formats"] = video_formats[:5]
-                video_info["audio_formats"] = audio_formats[:3]
-            
-            return video_info
+        task.add_done_callback(_flight_done)
+    else:
+        logger.info(f"🔗 Joining in-flight extraction: {video_id}")
+    # Shielded: one caller giving up must not fail the others
+    return await asyncio.shield(task)
+
+async def _extract_info_entry(video_id: str, timeout: float) -> Dict[str, Any]:
+    """Extract one video (the single flight behind get_video_info_entry) and cache the result"""
+    proxy = choose_proxy() if BACKEND.online else None
+    proxy_started(proxy)
+    start_time = time.time()
+    try:
+        with trace_span("extract", proxy=PROXY_POOL[proxy].label if proxy else "direct"):
+            info = await extract_info(video_id, timeout=timeout, proxy=proxy)
+    except yt_dlp.utils.DownloadError as e:
+        # Rate limits and network errors count against the proxy; unavailable/private
+        # videos and other content errors are not its fault, so they get no verdict
+        reason = classify_stderr(str(e).splitlines())
+        proxy_finished(proxy, False if reason in ("rate_limited", "network") else None, rate_limited=reason == "rate_limited")
+        raise
+    except asyncio.TimeoutError:
+        proxy_finished(proxy, False)
+        raise
+    except BaseException:
+        proxy_finished(proxy, None)
+        raise
+    proxy_finished(proxy, True, latency=time.time() - start_time)
+    
+    entry = {"info": info, "proxy": proxy, "timestamp": time.time()}
+    INFO_CACHE[video_id] = entry
+    INFO_CACHE.move_to_end(video_id)
+    while len(INFO_CACHE) > INFO_CACHE_MAX_ENTRIES:
+        INFO_CACHE.popitem(last=False)
+    return entry
+
+def prune_info_cache() -> int:
+    """Drop expired info dicts (their media URLs are stale anyway)"""
+    now = time.time()
+    expired = [video_id for video_id, entry in INFO_CACHE.items() if now - entry["timestamp"] >= INFO_CACHE_TTL]
+    for video_id in expired:
+        del INFO_CACHE[video_id]
+    return len(expired)
+
+async def get_video_info(video_id: str, timeout: float = 15) -> Dict[str, Any]:
+    """Return the info dict for a video, extracting it only if not cached"""
+    return (await get_video_info_entry(video_id, timeout))["info"]
+
+# Bytes per second of media, for reserving cache space when the info dict has no sizes
+EXPECTED_BYTES_PER_SECOND = {"audio": 16 * 1024, "video": 256 * 1024}
+
+def expected_download_size(info: Dict[str, Any], format_spec: Optional[str], workload: str) -> int:
+    """Best guess at what a format selection will write: the listed sizes of the
+    first fully known "a+b/c" alternative, else an estimate from the duration"""
+    formats = {str(f.get("format_id")): f for f in info.get("formats") or []}
+    for alternative in (format_spec or "").split("/"):
+        chosen = [formats.get(part) for part in alternative.split("+")]
+        sizes = [f and (f.get("filesize") or f.get("filesize_approx")) for f in chosen]
+        if sizes and all(sizes):
+            return int(sum(sizes))
+    return int((info.get("duration") or 0) * EXPECTED_BYTES_PER_SECOND.get(workload, EXPECTED_BYTES_PER_SECOND["video"]))
+
+async def ytdlp_download(video_id: str, args: List[str], timeout: float, workload: str = "audio") -> int:
+    """Download through the backend (a supervised yt-dlp child) fed the shared info dict. Returns yt-dlp's retcode."""
+    start_time = time.time()
+    entry = await get_video_info_entry(video_id, timeout=timeout)
+    info, proxy = entry["info"], entry.get("proxy")
+    remaining = max(timeout - (time.time() - start_time), 1)
+    
+    info_file = os.path.join(CACHE_DIR, f"{video_id}.{workload}.{uuid.uuid4().hex[:8]}{WORK_FILE_MARKER}info.json")
+    with open(info_file, "w") as f:
+        json.dump(info, f)
+    
+    flight_key = (video_id, workload)
+    postprocess_started: Dict[str, float] = {}
+    
+    def on_line(name: str, line: str):
+        if not line.startswith("[postprocess]"):
+            update_progress(flight_key, line)
+            return
+        # "[postprocess] started|finished <PostProcessor>": time ffmpeg & co. as their own spans
+        fields = line.split()
+        if len(fields) == 3 and fields[1] == "started":
+            postprocess_started[fields[2]] = time.time()
+        elif len(fields) == 3 and fields[1] == "finished" and fields[2] in postprocess_started:
+            record_span(f"postprocess:{fields[2]}", postprocess_started.pop(fields[2]), time.time())
+    
+    span_start = time.time()
+    span = {"workload": workload, "format": args[args.index("-f") + 1] if "-f" in args else None}
+    attempt = STRATEGY_ATTEMPT.get()
+    if attempt is not None:
+        attempt.setdefault("proxy", proxy)  # the profile this strategy attempt ran under
+        attempt.setdefault("download_started", time.time())  # the hedge clock starts here, not during extraction
+    proxy_started(proxy)
+    try:
+        with cache_reservation(expected_download_size(info, span["format"], workload), _option_value(args, "-o")):
+            result = await BACKEND.download(video_id, info_file, args, proxy, workload, remaining, on_line)
+    except asyncio.TimeoutError:
+        proxy_finished(proxy, False)
+        record_span("ytdlp", span_start, time.time(), exit_code=None, stderr_class="timeout", **span)
+        raise
+    except BaseException as e:
+        proxy_finished(proxy, None)  # cancelled, not the proxy's fault
+        record_span("ytdlp", span_start, time.time(), exit_code=None, error=type(e).__name__, **span)
+        raise
+    finally:
+        os.remove(info_file)
+    
+    record_span("ytdlp", span_start, time.time(), exit_code=result["returncode"],
+                stderr_class=classify_stderr(result["stderr"]) if result["returncode"] else "none", **span)
+    if result["returncode"] != 0:
+        stderr = "\n".join(result["stderr"])
+        proxy_finished(proxy, False, rate_limited=bool(RATE_LIMIT_RE.search(stderr)))
+        logger.error(f"yt-dlp exit {result['returncode']} for {video_id}: {(result['stderr'] or ['no output'])[-1][:150]}")
+        # Media URLs may have expired; make the next strategy re-extract (maybe through another proxy)
+        INFO_CACHE.pop(video_id, None)
+    else:
+        progress = next(filter(None, map(parse_progress_line, reversed(result["stdout"]))), None)
+        downloaded = progress and progress["downloaded_bytes"]
+        proxy_finished(proxy, True, throughput=downloaded / result["elapsed"] if downloaded and result["elapsed"] > 0 else None)
+    return result["returncode"]
+
+def audio_formats_from_info(info: Dict[str, Any]) -> Dict[str, str]:
+    """Map audio-only format ids to their container (m4a/webm/opus)"""
+    formats = {}
+    for f in info.get("formats") or []:
+        format_id = str(f.get("format_id", ""))
+        if not format_id.isdigit() or f.get("vcodec") != "none" or f.get("acodec") in (None, "none"):
+            continue
+        ext = f.get("ext", "")
+        if ext in ("m4a", "mp4"):
+            formats[format_id] = "m4a"
+        elif ext == "webm":
+            formats[format_id] = "webm"
         else:
-            return {
-                "video_id": video_id,
-                "title": "Video Unavailable",
-                "status": "unavailable",
-                "error": result.stderr[:100] if result.stderr else "Unknown error"
-            }
-            
-    except subprocess.TimeoutExpired:
+            formats[format_id] = "opus"
+    return formats
+
+def _format_note(f: Dict[str, Any]) -> str:
+    """Short human readable description of a format"""
+    parts = [
+        f.get("ext"),
+        f.get("format_note"),
+        f"{f['fps']}fps" if f.get("fps") else None,
+        f"{int(f['tbr'])}k" if f.get("tbr") else None,
+        f.get("vcodec") if f.get("vcodec") not in (None, "none") else None,
+        f.get("acodec") if f.get("acodec") not in (None, "none") else None,
+    ]
+    return " ".join(str(p) for p in parts if p)[:50]
+
+async def get_video_metadata(video_id: str) -> Dict[str, Any]:
+    """Get video metadata including title, duration, thumbnail, etc."""
+    try:
+        metadata = await get_video_info(video_id, timeout=15)
+        
+        # Extract essential info
+        video_info = {
+            "video_id": video_id,
+            "title": metadata.get("title", "Unknown Title"),
+            "duration": metadata.get("duration", 0),
+            "duration_string": metadata.get("duration_string", "0:00"),
+            "uploader": metadata.get("uploader", "Unknown Uploader"),
+            "view_count": metadata.get("view_count", 0),
+            "like_count": metadata.get("like_count", 0),
+            "thumbnail": metadata.get("thumbnail", ""),
+            "description": metadata.get("description", "")[:200] + "..." if metadata.get("description") else "",
+            "categories": metadata.get("categories", []),
+            "tags": (metadata.get("tags") or [])[:5],
+            "upload_date": metadata.get("upload_date", ""),
+            "available_formats": [],
+            "status": "available"
+        }
+        
+        # Available formats come straight from the info dict
+        video_formats = []
+        audio_formats = []
+        audio_exts = audio_formats_from_info(metadata)
+        
+        for f in metadata.get("formats") or []:
+            format_id = str(f.get("format_id", ""))
+            if not format_id.isdigit():
+                continue
+            if format_id in audio_exts:
+                audio_formats.append({
+                    "format_id": format_id,
+                    "ext": audio_exts[format_id],
+                    "note": _format_note(f)
+                })
+            elif f.get("vcodec") not in (None, "none"):
+                video_formats.append({
+                    "format_id": format_id,
+                    "resolution": f.get("resolution") or "unknown",
+                    "note": _format_note(f)
+                })
+                
+        video_info["video_formats"] = video_formats[:5]
+        video_info["audio_formats"] = audio_formats[:3]
+        
+        return video_info
+        
+    except asyncio.TimeoutError:
         return {
             "video_id": video_id,
             "status": "timeout",
             "error": "Request timed out"
         }
-    except json.JSONDecodeError:
+    except yt_dlp.utils.DownloadError as e:
+        # Only the video itself being gone is worth remembering. A rate limit or
+        # a network/proxy failure says nothing about it, and "error" isn't cached
+        reason = classify_stderr(str(e).splitlines())
+        if reason != "unavailable":
+            return {
+                "video_id": video_id,
+                "status": "error",
+                "reason": reason,
+                "error": str(e)[:100]
+            }
         return {
             "video_id": video_id,
-            "status": "error",
-            "error": "Invalid response from YouTube"
+            "title": "Video Unavailable",
+            "status": "unavailable",
+            "error": str(e)[:100]
         }
     except Exception as e:
         return {
@@ -192,47 +1287,55 @@ async def get_video_metadata(video_id: str) -> Dict[str, Any]:
 
 async def check_available_formats(video_id: str) -> Dict:
     """Check which audio formats are available for a video"""
-    cmd = [
-        "yt-dlp",
-        "--no-warnings",
-        "--quiet",
-        "--list-formats",
-        f"https://youtu.be/{video_id}"
-    ]
-    
     try:
-        result = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=15)
-        )
-        
-        formats = {}
-        if result.returncode == 0:
-            lines = result.stdout.split('\n')
-            for line in lines:
-                if 'audio only' in line.lower():
-                    # Extract format code
-                    parts = line.split()
-                    if len(parts) > 0 and parts[0].isdigit():
-                        format_code = parts[0]
-                        if 'm4a' in line.lower() or 'mp4' in line.lower():
-                            formats[format_code] = 'm4a'
-                        elif 'webm' in line.lower():
-                            formats[format_code] = 'webm'
-                        elif 'opus' in line.lower():
-                            formats[format_code] = 'opus'
-        
-        return formats
-    except:
+        with trace_span("format_probe"):
+            info = await get_video_info(video_id, timeout=15)
+        return audio_formats_from_info(info)
+    except Exception:
         return {}
 
-async def download_audio_smart(video_id: str) -> Optional[str]:
+FIXUP_TIMEOUT = 60
+
+async def fixup_dash_m4a(video_id: str, format_id: str, file_path: str) -> Optional[str]:
+    """Remux a DASH m4a into a plain one, as yt-dlp's FixupM4a would have.
+    
+    Progressive downloads run with --fixup never so the file their readers
+    follow is never swapped out; the copy that gets cached is fixed up here
+    instead, into a new file. Returns the file to cache, None on failure.
+    """
+    info = await get_video_info(video_id)
+    fmt = next((f for f in info.get("formats") or [] if str(f.get("format_id")) == format_id), {})
+    if fmt.get("container") != "m4a_dash":
+        return file_path
+        
+    fixed_file = work_path_for(video_id, "audio", "smart_audio_fixup", "m4a")
+    cmd = FFMPEG_COMMAND + [
+        "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", file_path, "-map", "0", "-dn", "-ignore_unknown", "-c", "copy",
+        "-f", "mp4", "-movflags", "+faststart", fixed_file,
+    ]
+    start_time = time.time()
+    try:
+        result = await run_supervised(cmd, workload="audio", timeout=FIXUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        result = None
+    record_span("postprocess:FixupM4a", start_time, time.time())
+    
+    if not result or result["returncode"] != 0 or not os.path.exists(fixed_file):
+        logger.error(f"❌ m4a fixup failed for {video_id}: {((result or {}).get('stderr') or ['timeout'])[-1][:150]}")
+        remove_work_files(video_id, "audio", "smart_audio_fixup")
+        return None
+    # Readers still tailing the DASH file keep their descriptor
+    os.remove(file_path)
+    return fixed_file
+
+async def download_audio_smart(video_id: str, progressive: bool = False) -> Optional[str]:
     """SMART AUDIO DOWNLOAD - CHECK FORMATS FIRST"""
     start_time = time.time()
     
-    output_file = os.path.join(CACHE_DIR, f"{video_id}_audio_{int(time.time())}.m4a")
+    output_file = work_path_for(video_id, "audio", "smart_audio", "m4a")
     
-    # First check available formats
+    # First check available formats (from the shared info dict, no extra extraction)
     formats = await check_available_formats(video_id)
     
     # PREFER DIRECT m4a FORMATS (140, 139, 256, etc.)
@@ -242,15 +1345,21 @@ async def download_audio_smart(video_id: str) -> Optional[str]:
     for code, fmt_type in formats.items():
         if fmt_type == 'm4a':
             preferred_formats.append(code)
-    
-    # If direct m4a formats available, use them
-    if preferred_formats:
+            
+    # If direct m4a formats available, use them (unless that keeps failing lately)
+    preferred_formats.sort()
+    if preferred_formats and strategy_enabled("audio", "smart_direct", video_id, preferred_formats[0]):
         # Try the smallest format code first (usually 140)
-        preferred_formats.sort()
         format_to_use = preferred_formats[0]
         
-        cmd = [
-            "yt-dlp",
+        if progressive:
+            # Sequential download straight into the output file, so readers can tail it.
+            # No fixups: they replace the file with a new one behind the readers' backs
+            downloader_args = ["--no-part", "--http-chunk-size", "10M", "--fixup", "never"]
+        else:
+            downloader_args = ["--downloader", "aria2c", "--downloader-args", "aria2c:-x 16 -s 16 -k 4M"]
+        
+        args = [
             "--no-warnings",
             "--quiet",
             "--no-progress",
@@ -258,39 +1367,49 @@ async def download_audio_smart(video_id: str) -> Optional[str]:
             "--force-ipv4",
             "--socket-timeout", "15",
             "--retries", "2",
-            "--downloader", "aria2c",
-            "--downloader-args", "aria2c:-x 16 -s 16 -k 4M",
+            *downloader_args,
             "-f", format_to_use,
             "-o", output_file,
-            f"https://youtu.be/{video_id}"
         ]
         
-        if HAS_COOKIES:
-            cmd.insert(5, "--cookies")
-            cmd.insert(6, COOKIE_FILE)
-        
         try:
-            logger.info(f"🎵 SMART DIRECT AUDIO download (format {format_to_use}): {video_id}")
+            logger.info(f"🎵 SMART DIRECT AUDIO download (format {format_to_use}{', progressive' if progressive else ''}): {video_id}")
             
-            timeout = 30
+            # A progressive download is already feeding clients, so give it longer
+            timeout = 180 if progressive else 30
             
-            result = await asyncio.get_event_loop().run_in_executor(
-                executor,
-                lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-            )
+            growing = {"path": output_file, "complete": False}
+            if progressive:
+                GROWING_FILES[(video_id, "audio")] = growing
+            try:
+                retcode = await ytdlp_download(video_id, args, timeout)
+            except asyncio.TimeoutError:
+                retcode = None
+            finally:
+                GROWING_FILES.pop((video_id, "audio"), None)
+                
+            if retcode == 0 and os.path.exists(output_file):
+                # Everyone tailing the file can drain it to the end now
+                growing["complete"] = True
+                if progressive:
+                    # ...and may leave before it's cached: the bytes are paid for, finish the job
+                    PINNED_FLIGHTS.add((video_id, "audio"))
+                    output_file = await fixup_dash_m4a(video_id, format_to_use, output_file)
+            ok = retcode == 0 and output_file is not None
+            record_strategy("audio", "smart_direct", ok, time.time() - start_time, attempt_proxy(), format_to_use)
             
             elapsed = time.time() - start_time
             
-            if result.returncode == 0 and os.path.exists(output_file):
+            if ok and os.path.exists(output_file):
                 file_size = os.path.getsize(output_file)
                 logger.info(f"🎯 DIRECT AUDIO success ({elapsed:.2f}s): {output_file} ({file_size/1024/1024:.1f}MB)")
                 return output_file
-        except:
+        except Exception:
             pass
-    
+            
     # If no direct m4a format or it failed, use bestaudio with extraction
-    cmd = [
-        "yt-dlp",
+    output_file = work_path_for(video_id, "audio", "smart_audio", "m4a")
+    args = [
         "--no-warnings",
         "--quiet",
         "--no-progress",
@@ -305,33 +1424,25 @@ async def download_audio_smart(video_id: str) -> Optional[str]:
         "--audio-quality", "0",
         "--postprocessor-args", "-vn -c:a copy -movflags +faststart",
         "-o", output_file,
-        f"https://youtu.be/{video_id}"
     ]
     
-    if HAS_COOKIES:
-        cmd.insert(5, "--cookies")
-        cmd.insert(6, COOKIE_FILE)
-    
     try:
         logger.info(f"🎵 SMART EXTRACT AUDIO download: {video_id}")
         
         timeout = 45
         
-        result = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-        )
+        retcode = await ytdlp_download(video_id, args, timeout)
         
         elapsed = time.time() - start_time
         
-        if result.returncode == 0 and os.path.exists(output_file):
+        if retcode == 0 and os.path.exists(output_file):
             file_size = os.path.getsize(output_file)
             logger.info(f"✅ EXTRACT AUDIO success ({elapsed:.2f}s): {output_file} ({file_size/1024/1024:.1f}MB)")
             return output_file
-        
+            
         return None
         
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         logger.error(f"⏰ Audio timeout for {video_id}")
         return None
     except Exception as e:
@@ -342,197 +1453,1283 @@ async def download_audio_fast_fallback(video_id: str) -> Optional[str]:
     """FAST FALLBACK FOR AUDIO - SIMPLE AND RELIABLE"""
     start_time = time.time()
     
-    output_file = os.path.join(CACHE_DIR, f"{video_id}_fallback_{int(time.time())}.m4a")
+    output_file = work_path_for(video_id, "audio", "fast_fallback", "m4a")
     
     # SIMPLE AND RELIABLE COMMAND
-    cmd = [
-        "yt-dlp",
+    args = [
         "--no-warnings",
         "--quiet",
         "-f", "bestaudio",
         "--extract-audio",
         "--audio-format", "m4a",
         "-o", output_file,
-        f"https://youtu.be/{video_id}"
     ]
     
-    if HAS_COOKIES:
-        cmd.insert(3, "--cookies")
-        cmd.insert(4, COOKIE_FILE)
+    try:
+        logger.info(f"⚡ FAST FALLBACK AUDIO download: {video_id}")
+        
+        timeout = 60
+        
+        retcode = await ytdlp_download(video_id, args, timeout)
+        
+        elapsed = time.time() - start_time
+        
+        if retcode == 0 and os.path.exists(output_file):
+            file_size = os.path.getsize(output_file)
+            logger.info(f"✅ FALLBACK AUDIO success ({elapsed:.2f}s): {output_file}")
+            return output_file
+            
+        return None
+        
+    except Exception as e:
+        logger.error(f"FALLBACK AUDIO error: {str(e)[:100]}")
+        return None
+
+# Video formats that play in a browser <video> as MP4 without re-encoding
+VIDEO_MAX_HEIGHT = int(os.getenv("VIDEO_MAX_HEIGHT", "720"))
+FASTSTART_ARGS = "-movflags +faststart"
+VIDEO_PIPELINE_STATS = {"copy": 0, "remux": 0, "transcode": 0}
+# Download timeouts grow with the file: slowest transfer rate still worth waiting for, and a hard cap
+VIDEO_MIN_RATE = int(os.getenv("VIDEO_MIN_RATE", str(1024 * 1024)))  # bytes/s
+VIDEO_MAX_TIMEOUT = float(os.getenv("VIDEO_MAX_TIMEOUT", "1800"))
+
+def _is_h264(f: Dict[str, Any]) -> bool:
+    return (f.get("vcodec") or "").startswith("avc1") and f.get("ext") == "mp4"
+
+def _is_aac(f: Dict[str, Any]) -> bool:
+    return (f.get("acodec") or "").startswith("mp4a") and f.get("ext") in ("m4a", "mp4")
+
+def choose_video_pipeline(info: Dict[str, Any]) -> Tuple[str, str]:
+    """Pick (format spec, pipeline) so that ffmpeg only copies streams when it can.
+    
+    remux: H.264 video-only + AAC audio merged with stream copy
+    copy: a progressive H.264/AAC MP4 downloaded as-is
+    transcode: nothing compatible, re-encode to MP4
+    """
+    formats = [f for f in info.get("formats") or [] if f.get("protocol") in ("https", "http", "http_dash_segments", "m3u8_native")]
+    fits = lambda f: (f.get("height") or 0) <= VIDEO_MAX_HEIGHT
+    
+    video_only = [f for f in formats if _is_h264(f) and f.get("acodec") in (None, "none") and fits(f)]
+    audio_only = [f for f in formats if _is_aac(f) and f.get("vcodec") in (None, "none")]
+    if video_only and audio_only:
+        video = max(video_only, key=lambda f: ((f.get("height") or 0), f.get("tbr") or 0))
+        audio = max(audio_only, key=lambda f: f.get("abr") or 0)
+        return f"{video['format_id']}+{audio['format_id']}", "remux"
+        
+    progressive = [f for f in formats if _is_h264(f) and _is_aac(f) and fits(f)]
+    if progressive:
+        return str(max(progressive, key=lambda f: f.get("height") or 0)["format_id"]), "copy"
+        
+    return f"best[height<={VIDEO_MAX_HEIGHT}]/best", "transcode"
+
+def video_download_timeout(info: Dict[str, Any], format_spec: str, pipeline: str) -> float:
+    """Seconds to allow a video download: a base, plus the expected size at
+    VIDEO_MIN_RATE, plus roughly real time when ffmpeg has to re-encode"""
+    timeout = 180 if pipeline == "transcode" else 90
+    timeout += expected_download_size(info, format_spec, "video") / VIDEO_MIN_RATE
+    if pipeline == "transcode":
+        timeout += info.get("duration") or 0
+    return min(timeout, VIDEO_MAX_TIMEOUT)
+
+async def download_video_fast(video_id: str) -> Optional[str]:
+    """FAST VIDEO DOWNLOAD - stream copy into MP4, re-encode only as a last option"""
+    start_time = time.time()
+    
+    output_file = work_path_for(video_id, "video", "fast_video", "mp4")
+    
+    try:
+        info = await get_video_info(video_id, timeout=30)
+        format_spec, pipeline = choose_video_pipeline(info)
+    except Exception as e:
+        logger.error(f"❌ Video error: {str(e)[:100]}")
+        return None
+        
+    if pipeline == "remux":
+        pipeline_args = ["--merge-output-format", "mp4", "--postprocessor-args", f"Merger+ffmpeg_o:{FASTSTART_ARGS}"]
+    elif pipeline == "copy":
+        pipeline_args = []
+    else:
+        pipeline_args = ["--recode-video", "mp4", "--postprocessor-args", f"VideoConvertor+ffmpeg_o:{FASTSTART_ARGS}"]
+        
+    args = [
+        "--no-warnings",
+        "--quiet",
+        "--no-progress",
+        "--no-playlist",
+        "--force-ipv4",
+        "--socket-timeout", "30",
+        "--retries", "3",
+        "--fragment-retries", "3",
+        "--skip-unavailable-fragments",
+        "--concurrent-fragments", "4",
+        "-f", format_spec,
+        *pipeline_args,
+        "-o", output_file,
+    ]
+    
+    try:
+        logger.info(f"🎬 FAST VIDEO download ({pipeline}, format {format_spec}): {video_id}")
+        
+        # Long videos need longer, a re-encode longest
+        timeout = video_download_timeout(info, format_spec, pipeline)
+        
+        retcode = await ytdlp_download(video_id, args, timeout, workload="video")
+        
+        elapsed = time.time() - start_time
+        
+        if retcode == 0 and os.path.exists(output_file):
+            file_size = os.path.getsize(output_file)
+            logger.info(f"✅ VIDEO success ({pipeline}, {elapsed:.2f}s): {output_file} ({file_size/1024/1024:.1f}MB)")
+            VIDEO_PIPELINE_STATS[pipeline] += 1
+            DOWNLOAD_PIPELINES[output_file] = pipeline
+            return output_file
+            
+        return None
+        
+    except asyncio.TimeoutError:
+        logger.error(f"⏰ Video timeout for {video_id}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ Video error: {str(e)[:100]}")
+        return None
+
+# =============== PERSISTENT CACHE INDEX ===============
+# Finished downloads live under deterministic names
+# ({video_id}.{media_type}.{format}.{ext}) and are tracked in a SQLite index
+# (WAL mode). DOWNLOAD_CACHE is the in-memory view of that index and both are
+# rebuilt from CACHE_DIR at startup, so a restart keeps the cache hot. Index
+# writes are queued to one writer thread (in order, off the event loop), and
+# the access times and hit counts of cache hits are batched in memory and
+# written by the cleanup loop.
+#
+# The cache is bounded by bytes, not age: when an admission pushes it over the
+# high watermark, entries are evicted until it is back under the low
+# watermark. Victims come from the least recently used end of DOWNLOAD_CACHE;
+# within that tail the entry with the fewest hits goes first, so popular tracks
+# survive a burst of one-off downloads. Hits decay (halved every
+# CACHE_HIT_HALF_LIFE seconds without an access) so yesterday's hit doesn't
+# pin its file forever, and downloads in progress reserve their expected size
+# up front so a burst of cold downloads can't overshoot the budget.
+
+CACHE_INDEX_PATH = os.path.join(CACHE_DIR, "index.sqlite3")
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "0"))  # optional hard age limit in seconds, 0 = off
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(4 * 1024 ** 3)))
+CACHE_HIGH_WATERMARK = float(os.getenv("CACHE_HIGH_WATERMARK", "0.95"))
+CACHE_LOW_WATERMARK = float(os.getenv("CACHE_LOW_WATERMARK", "0.85"))
+CACHE_MIN_FREE_BYTES = int(os.getenv("CACHE_MIN_FREE_BYTES", str(512 * 1024 ** 2)))
+CACHE_EVICTION_SAMPLE = 8
+CACHE_HIT_HALF_LIFE = float(os.getenv("CACHE_HIT_HALF_LIFE", str(24 * 3600)))
+CACHE_STATS = {"bytes": 0, "reserved": 0, "evictions": 0, "evicted_bytes": 0}
+CACHE_RESERVATIONS: List[Dict[str, Any]] = []  # {size, path} of the downloads in progress
+CACHE_FILE_RE = re.compile(r'^([a-zA-Z0-9_-]{11})\.(audio|video)\.([a-zA-Z0-9_-]+)\.([a-z0-9]+)$')
+LEGACY_CACHE_FILE_RE = re.compile(r'^([a-zA-Z0-9_-]{11})_(audio|fallback|last|video)_(\d+)\.(m4a|mp4)$')
+WORK_FILE_MARKER = ".work."
+TEE_FILE_MARKER = ".tee."
+
+cache_db: Optional[sqlite3.Connection] = None
+CACHE_DB_LOCK = threading.Lock()
+cache_db_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-db")
+CACHE_ACCESS_DIRTY: Set[str] = set()  # keys hit since the last flush
+
+def cache_key_for(video_id: str, media_type: str, fmt: str = "default") -> str:
+    """Deterministic content key: video_id + media type + format"""
+    return f"{video_id}.{media_type}.{fmt}"
+
+def cache_path_for(video_id: str, media_type: str, fmt: str = "default", ext: str = "") -> str:
+    """Final location of a cached file"""
+    ext = ext or ("m4a" if media_type == "audio" else "mp4")
+    return os.path.join(CACHE_DIR, f"{cache_key_for(video_id, media_type, fmt)}.{ext}")
+
+def work_path_for(video_id: str, media_type: str, method: str, ext: str) -> str:
+    """Scratch output path for one download strategy; renamed into place on success"""
+    path = os.path.join(CACHE_DIR, f"{video_id}.{media_type}.{method}{WORK_FILE_MARKER}{ext}")
+    # Never let yt-dlp treat a leftover partial file as already downloaded
+    if os.path.exists(path):
+        os.remove(path)
+    return path
+
+def tee_path_for(video_id: str, media_type: str, method: str, ext: str) -> str:
+    """Scratch path for a copy written alongside a response; unique per response
+    and outside remove_work_files' reach, since no download owns it"""
+    return os.path.join(CACHE_DIR, f"{video_id}.{media_type}.{method}{TEE_FILE_MARKER}{uuid.uuid4().hex[:8]}.{ext}")
+
+def remove_work_files(video_id: str, media_type: str, method: Optional[str] = None) -> int:
+    """Delete the scratch files (and yt-dlp .part files) of an abandoned download or strategy"""
+    prefix = f"{video_id}.{media_type}.{method + WORK_FILE_MARKER if method else ''}"
+    removed = 0
+    for file in os.listdir(CACHE_DIR):
+        if file.startswith(prefix) and WORK_FILE_MARKER in file:
+            try:
+                os.remove(os.path.join(CACHE_DIR, file))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+def _cache_db_execute(sql: str, params: tuple = ()):
+    """Run one statement against the cache index"""
+    with CACHE_DB_LOCK:
+        if cache_db is None:
+            return []
+        return cache_db.execute(sql, params).fetchall()
+
+def _cache_db_executemany(sql: str, rows: List[tuple]):
+    """Run one statement for many rows in a single transaction"""
+    with CACHE_DB_LOCK:
+        if cache_db is None:
+            return
+        cache_db.execute("BEGIN")
+        try:
+            cache_db.executemany(sql, rows)
+        except BaseException:
+            cache_db.execute("ROLLBACK")
+            raise
+        cache_db.execute("COMMIT")
+
+def _cache_db_write_done(future: concurrent.futures.Future):
+    if future.exception():
+        logger.error(f"Cache index write error: {future.exception()}")
+
+def _cache_db_write(fn, *args):
+    """Queue an index write for the writer thread"""
+    cache_db_writer.submit(fn, *args).add_done_callback(_cache_db_write_done)
+
+def flush_cache_access() -> int:
+    """Queue the batched access times and hit counts for writing"""
+    rows = [(DOWNLOAD_CACHE[key]["last_access"], DOWNLOAD_CACHE[key]["hits"], key) for key in CACHE_ACCESS_DIRTY if key in DOWNLOAD_CACHE]
+    CACHE_ACCESS_DIRTY.clear()
+    if rows:
+        _cache_db_write(_cache_db_executemany, "UPDATE media SET last_access = ?, hits = ? WHERE key = ?", rows)
+    return len(rows)
+
+def _cache_row_to_entry(row) -> Dict[str, Any]:
+    """Convert an index row into a DOWNLOAD_CACHE entry"""
+    key, video_id, media_type, fmt, path, size, method, created_at, last_access, hits = row
+    return {
+        "video_id": video_id,
+        "media_type": media_type,
+        "format": fmt,
+        "path": path,
+        "size": size,
+        "method": method,
+        "timestamp": created_at,
+        "last_access": last_access,
+        "hits": hits
+    }
+
+def _cache_upsert(key: str, entry: Dict[str, Any]):
+    """Insert or replace an entry as the most recently used one"""
+    old = DOWNLOAD_CACHE.pop(key, None)
+    if old:
+        CACHE_STATS["bytes"] -= old["size"]
+    DOWNLOAD_CACHE[key] = entry
+    CACHE_STATS["bytes"] += entry["size"]
+    CACHE_ACCESS_DIRTY.discard(key)
+    _cache_db_write(
+        _cache_db_execute,
+        "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (key, entry["video_id"], entry["media_type"], entry["format"], entry["path"], entry["size"],
+         entry["method"], entry["timestamp"], entry["last_access"], entry["hits"])
+    )
+
+def cache_drop(key: str, remove_file: bool = True):
+    """Forget a cache entry (and delete its file)"""
+    entry = DOWNLOAD_CACHE.pop(key, None)
+    if entry:
+        CACHE_STATS["bytes"] -= entry["size"]
+    CACHE_ACCESS_DIRTY.discard(key)
+    _cache_db_write(_cache_db_execute, "DELETE FROM media WHERE key = ?", (key,))
+    if remove_file and entry and os.path.exists(entry["path"]):
+        try:
+            os.remove(entry["path"])
+        except OSError as e:
+            logger.error(f"Cache remove error: {e}")
+
+def cache_lookup(video_id: str, media_type: str, fmt: str = "default") -> Optional[str]:
+    """Return the cached file for this content key, if present and fresh"""
+    key = cache_key_for(video_id, media_type, fmt)
+    entry = DOWNLOAD_CACHE.get(key)
+    if not entry:
+        CACHE_LOOKUPS.inc(media_type=media_type, result="miss")
+        return None
+    
+    now = time.time()
+    expired = CACHE_MAX_AGE and now - entry["timestamp"] >= CACHE_MAX_AGE
+    if expired or not os.path.exists(entry["path"]):
+        cache_drop(key)
+        CACHE_LOOKUPS.inc(media_type=media_type, result="miss")
+        return None
+    
+    CACHE_LOOKUPS.inc(media_type=media_type, result="hit")
+    DOWNLOAD_CACHE.move_to_end(key)
+    entry["hits"] = decayed_hits(entry, now) + 1
+    entry["last_access"] = now
+    CACHE_ACCESS_DIRTY.add(key)
+    return entry["path"]
+
+def cache_store(video_id: str, media_type: str, file_path: str, method: str, fmt: str = "default") -> str:
+    """Move a finished download to its deterministic path and index it"""
+    ext = os.path.splitext(file_path)[1].lstrip(".") or ("m4a" if media_type == "audio" else "mp4")
+    final_path = cache_path_for(video_id, media_type, fmt, ext)
+    start_time = time.time()
+    if os.path.abspath(file_path) != os.path.abspath(final_path):
+        os.replace(file_path, final_path)
+    
+    now = time.time()
+    _cache_upsert(cache_key_for(video_id, media_type, fmt), {
+        "video_id": video_id,
+        "media_type": media_type,
+        "format": fmt,
+        "path": final_path,
+        "size": os.path.getsize(final_path),
+        "method": method,
+        "timestamp": now,
+        "last_access": now,
+        "hits": 0
+    })
+    enforce_cache_budget(keep=cache_key_for(video_id, media_type, fmt))
+    record_span("cache_store", start_time, time.time(), method=method)
+    return final_path
+
+def _reservation_written(reservation: Dict[str, Any]) -> int:
+    """Bytes of its reservation a download has already put on disk"""
+    path = reservation["path"]
+    for candidate in (path, path + ".part") if path else ():
+        try:
+            return min(os.path.getsize(candidate), reservation["size"])
+        except OSError:
+            continue
+    return 0
+
+def cache_budget_bytes() -> int:
+    """Byte budget: CACHE_MAX_BYTES, shrunk if the disk itself is running out"""
+    try:
+        free = shutil.disk_usage(CACHE_DIR).free
+    except OSError:
+        return CACHE_MAX_BYTES
+    # Free space already lacks what running downloads wrote, which "reserved" counts too
+    written = sum(_reservation_written(reservation) for reservation in CACHE_RESERVATIONS)
+    return max(min(CACHE_MAX_BYTES, CACHE_STATS["bytes"] + written + free - CACHE_MIN_FREE_BYTES), 0)
+
+def decayed_hits(entry: Dict[str, Any], now: float) -> float:
+    """Hit count, halved for every CACHE_HIT_HALF_LIFE since the last access"""
+    return entry["hits"] * 0.5 ** (max(now - entry["last_access"], 0) / CACHE_HIT_HALF_LIFE)
+
+@contextlib.contextmanager
+def cache_reservation(size: int, path: Optional[str] = None):
+    """Count a download's expected size against the budget while it runs (path
+    is where it writes, so the bytes already on disk aren't counted twice)"""
+    reservation = {"size": size, "path": path}
+    CACHE_RESERVATIONS.append(reservation)
+    CACHE_STATS["reserved"] += size
+    try:
+        if size:
+            enforce_cache_budget()
+        yield
+    finally:
+        CACHE_STATS["reserved"] -= size
+        CACHE_RESERVATIONS.remove(reservation)
+
+def _pick_eviction_victim(keep: Optional[str]) -> Optional[str]:
+    """Least-hit entry among the least recently used few"""
+    now = time.time()
+    victim = None
+    victim_hits = 0.0
+    sampled = 0
+    for key, entry in DOWNLOAD_CACHE.items():
+        if key == keep:
+            continue
+        hits = decayed_hits(entry, now)
+        if victim is None or hits < victim_hits:
+            victim, victim_hits = key, hits
+        sampled += 1
+        if sampled >= CACHE_EVICTION_SAMPLE:
+            break
+    return victim
+
+def enforce_cache_budget(keep: Optional[str] = None) -> int:
+    """Evict down to the low watermark once the high watermark is crossed"""
+    budget = cache_budget_bytes()
+    if CACHE_STATS["bytes"] + CACHE_STATS["reserved"] <= budget * CACHE_HIGH_WATERMARK:
+        return 0
+    
+    evicted = 0
+    target = budget * CACHE_LOW_WATERMARK
+    while CACHE_STATS["bytes"] + CACHE_STATS["reserved"] > target:
+        victim = _pick_eviction_victim(keep)
+        if victim is None:
+            break
+        size = DOWNLOAD_CACHE[victim]["size"]
+        cache_drop(victim)
+        CACHE_STATS["evictions"] += 1
+        CACHE_STATS["evicted_bytes"] += size
+        evicted += 1
+    
+    if evicted:
+        logger.info(f"🧹 Evicted {evicted} cache entries ({CACHE_STATS['bytes']/1024/1024:.1f}MB used, "
+                    f"{CACHE_STATS['reserved']/1024/1024:.1f}MB reserved, of {budget/1024/1024:.1f}MB)")
+    return evicted
+
+def init_cache_index():
+    """Open the SQLite index and reconcile it with the files in CACHE_DIR"""
+    global cache_db
+    with CACHE_DB_LOCK:
+        cache_db = sqlite3.connect(CACHE_INDEX_PATH, check_same_thread=False, isolation_level=None)
+        cache_db.execute("PRAGMA journal_mode=WAL")
+        cache_db.execute("PRAGMA synchronous=NORMAL")
+        cache_db.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                key TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                format TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                method TEXT,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cache_db.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                video_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+    
+    DOWNLOAD_CACHE.clear()
+    CACHE_STATS["bytes"] = 0
+    for row in _cache_db_execute("SELECT * FROM media ORDER BY last_access"):
+        entry = _cache_row_to_entry(row)
+        if os.path.exists(entry["path"]):
+            DOWNLOAD_CACHE[row[0]] = entry
+            CACHE_STATS["bytes"] += entry["size"]
+        else:
+            _cache_db_execute("DELETE FROM media WHERE key = ?", (row[0],))
+    
+    adopted = 0
+    for file in sorted(os.listdir(CACHE_DIR)):
+        file_path = os.path.join(CACHE_DIR, file)
+        if not os.path.isfile(file_path):
+            continue
+        
+        # Partial output of a download that was interrupted by the restart
+        if WORK_FILE_MARKER in file or TEE_FILE_MARKER in file or file.endswith(".part") or file.endswith(".ytdl"):
+            os.remove(file_path)
+            continue
+        
+        # Files from before the deterministic naming scheme
+        legacy = LEGACY_CACHE_FILE_RE.match(file)
+        if legacy:
+            video_id, kind, _, ext = legacy.groups()
+            media_type = "video" if kind == "video" or ext == "mp4" else "audio"
+            target = cache_path_for(video_id, media_type, ext=ext)
+            os.replace(file_path, target)  # sorted by timestamp, so the newest wins
+            file, file_path = os.path.basename(target), target
+        
+        match = CACHE_FILE_RE.match(file)
+        if not match:
+            continue
+        video_id, media_type, fmt, _ = match.groups()
+        key = cache_key_for(video_id, media_type, fmt)
+        entry = DOWNLOAD_CACHE.get(key)
+        if entry and os.path.abspath(entry["path"]) == os.path.abspath(file_path):
+            continue
+        
+        mtime = os.path.getmtime(file_path)
+        _cache_upsert(key, {
+            "video_id": video_id,
+            "media_type": media_type,
+            "format": fmt,
+            "path": file_path,
+            "size": os.path.getsize(file_path),
+            "method": "recovered",
+            "timestamp": mtime,
+            "last_access": mtime,
+            "hits": 0
+        })
+        adopted += 1
+    
+    logger.info(f"🗂️ Cache index: {len(DOWNLOAD_CACHE)} entries ({adopted} recovered from {CACHE_DIR})")
+    enforce_cache_budget()
+
+# =============== METADATA CACHE ===============
+# /api/metadata answers from memory (backed by the SQLite index) for
+# METADATA_TTL seconds. After that, entries are served stale for up to
+# METADATA_STALE_TTL while one background refresh runs. Concurrent misses for
+# the same id share one fetch. Unavailable videos are remembered briefly so
+# they don't hammer upstream. SQLite reads and writes run in a worker thread,
+# never on the event loop, and the cleanup loop prunes rows past any use.
+
+METADATA_TTL = int(os.getenv("METADATA_TTL", "3600"))
+METADATA_STALE_TTL = int(os.getenv("METADATA_STALE_TTL", "86400"))
+METADATA_NEGATIVE_TTL = int(os.getenv("METADATA_NEGATIVE_TTL", "300"))
+METADATA_CACHE_ENTRIES = int(os.getenv("METADATA_CACHE_ENTRIES", "10000"))
+
+METADATA_CACHE: "OrderedDict[str, Dict]" = OrderedDict()
+METADATA_FLIGHTS: Dict[str, asyncio.Task] = {}
+
+def _metadata_keep(video_id: str, metadata: Dict[str, Any], fetched_at: float):
+    """Keep a metadata result in memory (bounded LRU)"""
+    METADATA_CACHE[video_id] = {"metadata": metadata, "fetched_at": fetched_at}
+    METADATA_CACHE.move_to_end(video_id)
+    while len(METADATA_CACHE) > METADATA_CACHE_ENTRIES:
+        METADATA_CACHE.popitem(last=False)
+
+def _metadata_db_load(video_id: str) -> Optional[Tuple[Dict[str, Any], float]]:
+    """(metadata, fetched_at) from the on-disk copy (worker thread)"""
+    rows = _cache_db_execute("SELECT data, fetched_at FROM metadata WHERE video_id = ?", (video_id,))
+    return (json.loads(rows[0][0]), rows[0][1]) if rows else None
+
+async def _metadata_remember(video_id: str, metadata: Dict[str, Any], fetched_at: float):
+    """Keep a metadata result in memory and on disk"""
+    _metadata_keep(video_id, metadata, fetched_at)
+    await asyncio.to_thread(
+        _cache_db_execute,
+        "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+        (video_id, json.dumps(metadata), fetched_at)
+    )
+
+async def _metadata_lookup(video_id: str) -> Optional[Dict]:
+    """Memory first, then the on-disk copy"""
+    entry = METADATA_CACHE.get(video_id)
+    if entry:
+        METADATA_CACHE.move_to_end(video_id)
+        return entry
+    stored = await asyncio.to_thread(_metadata_db_load, video_id)
+    if not stored:
+        return None
+    _metadata_keep(video_id, *stored)
+    return METADATA_CACHE[video_id]
+
+async def prune_metadata_rows() -> int:
+    """Delete on-disk metadata too old to be served even stale"""
+    cutoff = time.time() - max(METADATA_TTL, METADATA_NEGATIVE_TTL) - METADATA_STALE_TTL
+    
+    def _prune() -> int:
+        count = _cache_db_execute("SELECT COUNT(*) FROM metadata WHERE fetched_at < ?", (cutoff,))
+        _cache_db_execute("DELETE FROM metadata WHERE fetched_at < ?", (cutoff,))
+        return count[0][0] if count else 0
+        
+    return await asyncio.to_thread(_prune)
+
+def _metadata_fresh_for(metadata: Dict[str, Any]) -> int:
+    """How long a result stays fresh: full TTL for real metadata, short for unavailable"""
+    return METADATA_TTL if metadata.get("status") == "available" else METADATA_NEGATIVE_TTL
+
+async def _fetch_metadata(video_id: str, priority: int) -> Dict[str, Any]:
+    """Fetch upstream (through the metadata lane) and cache the result if it is worth keeping"""
+    async with LANES["metadata"].slot(priority):
+        start_time = time.time()
+        metadata = await get_video_metadata(video_id)
+        METADATA_SECONDS.observe(time.time() - start_time, status=metadata.get("status"))
+    if metadata.get("status") in ("available", "unavailable"):
+        await _metadata_remember(video_id, metadata, time.time())
+    return metadata
+
+def _metadata_flight(video_id: str, priority: int = PRIORITY_INTERACTIVE) -> asyncio.Task:
+    """Single-flight metadata fetch"""
+    task = METADATA_FLIGHTS.get(video_id)
+    if task is None:
+        task = asyncio.create_task(_fetch_metadata(video_id, priority))
+        METADATA_FLIGHTS[video_id] = task
+        
+        def _flight_done(t):
+            METADATA_FLIGHTS.pop(video_id, None)
+            if not t.cancelled():
+                t.exception()  # background refreshes may be shed with nobody awaiting them
+                
+        task.add_done_callback(_flight_done)
+    return task
+
+async def get_video_metadata_cached(video_id: str, limiter: Optional[asyncio.Semaphore] = None, priority: int = PRIORITY_INTERACTIVE) -> Tuple[Dict[str, Any], str]:
+    """Metadata with stale-while-revalidate. Returns (metadata, HIT|STALE|MISS).
+    
+    Only an upstream fetch waits for the optional limiter and the metadata
+    lane; cache answers never do. Raises LaneSaturated when the lane sheds it.
+    """
+    entry = await _metadata_lookup(video_id)
+    if entry:
+        age = time.time() - entry["fetched_at"]
+        fresh_for = _metadata_fresh_for(entry["metadata"])
+        if age < fresh_for:
+            METADATA_REQUESTS.inc(cache="HIT")
+            return entry["metadata"], "HIT"
+        if age < fresh_for + METADATA_STALE_TTL and entry["metadata"].get("status") == "available":
+            _metadata_flight(video_id, PRIORITY_BACKGROUND)  # refresh in the background
+            METADATA_REQUESTS.inc(cache="STALE")
+            return entry["metadata"], "STALE"
+            
+    METADATA_REQUESTS.inc(cache="MISS")
+    if limiter is None:
+        return await asyncio.shield(_metadata_flight(video_id, priority)), "MISS"
+    async with limiter:
+        return await asyncio.shield(_metadata_flight(video_id, priority)), "MISS"
+
+def start_download(video_id: str, media_type: str, progressive: bool = False, pinned: bool = False, priority: int = PRIORITY_INTERACTIVE) -> asyncio.Task:
+    """Single-flight: concurrent callers for the same video share one download task.
     
+    The download runs in its media type's lane. Pinned flights (prefetch)
+    keep running when nobody is waiting for them.
+    """
+    flight_key = (video_id, media_type)
+    task = INFLIGHT_DOWNLOADS.get(flight_key)
+    if task is None:
+        task = asyncio.create_task(_run_flight(CANCELLED_FLIGHTS.get(flight_key), video_id, media_type, progressive, priority))
+        INFLIGHT_DOWNLOADS[flight_key] = task
+        DOWNLOAD_PROGRESS[flight_key] = {"stage": "queued", "started_at": time.time(), "updated_at": None}
+        set_download_stage(video_id, media_type, "queued")
+        
+        def _flight_done(t):
+            if CANCELLED_FLIGHTS.get(flight_key) is t:
+                del CANCELLED_FLIGHTS[flight_key]
+            if INFLIGHT_DOWNLOADS.get(flight_key, t) is t:
+                # Unless a newer flight for the same key has taken over
+                INFLIGHT_DOWNLOADS.pop(flight_key, None)
+                DOWNLOAD_PROGRESS.pop(flight_key, None)
+                PINNED_FLIGHTS.discard(flight_key)
+            if t.cancelled():
+                removed = remove_work_files(video_id, media_type)
+                logger.info(f"🧹 Download cancelled: {video_id} ({media_type}), removed {removed} partial files")
+            
+        task.add_done_callback(_flight_done)
+    else:
+        logger.info(f"🔗 Joining in-flight download: {video_id} ({media_type})")
+        record_span("join_flight", time.time(), time.time(), media_type=media_type)
+    if pinned:
+        PINNED_FLIGHTS.add(flight_key)
+    return task
+
+async def _run_flight(cancelled: Optional[asyncio.Task], video_id: str, media_type: str, progressive: bool, priority: int) -> Optional[str]:
+    """One download flight. A cancelled predecessor is waited out first: it is
+    still killing its children and will delete this key's work files when done."""
+    if cancelled is not None and not cancelled.done():
+        await asyncio.wait([cancelled])
+    return await run_in_lane(media_type, priority, run_download_strategies, video_id, media_type, progressive)
+
+def acquire_flight(flight_key: Tuple[str, str]):
+    """Register interest in an in-flight download"""
+    FLIGHT_WAITERS[flight_key] = FLIGHT_WAITERS.get(flight_key, 0) + 1
+
+def release_flight(flight_key: Tuple[str, str], task: asyncio.Task):
+    """Drop interest; the last waiter leaving cancels an unpinned download"""
+    waiters = FLIGHT_WAITERS.get(flight_key, 0) - 1
+    if waiters > 0:
+        FLIGHT_WAITERS[flight_key] = waiters
+        return
+    FLIGHT_WAITERS.pop(flight_key, None)
+    if not task.done() and flight_key not in PINNED_FLIGHTS:
+        logger.info(f"🛑 No clients left, cancelling download: {flight_key[0]} ({flight_key[1]})")
+        # Shutting down takes seconds (children get a grace period); a request
+        # arriving meanwhile must start a new flight, not join this one
+        if INFLIGHT_DOWNLOADS.get(flight_key) is task:
+            del INFLIGHT_DOWNLOADS[flight_key]
+            CANCELLED_FLIGHTS[flight_key] = task
+        task.cancel()
+
+class ClientDisconnected(Exception):
+    """The client went away before the download finished"""
+
+async def wait_for_disconnect(request: Request):
+    """Return once the client has gone away"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def await_download(video_id: str, media_type: str, task: asyncio.Task, request: Optional[Request] = None) -> Optional[str]:
+    """Wait for a shared download as one of its waiters.
+    
+    Raises ClientDisconnected if the client goes away first; the download is
+    cancelled when that leaves it with no waiters.
+    """
+    flight_key = (video_id, media_type)
+    acquire_flight(flight_key)
+    try:
+        if request is None:
+            with trace_span("wait_download", media_type=media_type):
+                return await asyncio.shield(task)
+            
+        disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+        try:
+            with trace_span("wait_download", media_type=media_type):
+                await asyncio.wait([task, disconnect], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+        if not task.done():
+            logger.info(f"🔌 Client disconnected while waiting: {video_id} ({media_type})")
+            raise ClientDisconnected(video_id)
+        return None if task.cancelled() else task.result()
+    finally:
+        release_flight(flight_key, task)
+
+async def download_last_resort(video_id: str, media_type: str) -> Optional[str]:
+    """LAST RESORT - plain best format, no tuning"""
+    if media_type == "audio":
+        output_file = work_path_for(video_id, media_type, "last_resort", "m4a")
+        args = ["--quiet", "-f", "bestaudio", "--extract-audio", "--audio-format", "m4a", "-o", output_file]
+    else:
+        output_file = work_path_for(video_id, media_type, "last_resort", "mp4")
+        args = ["--quiet", "-f", "best", "-o", output_file]
+        
+    try:
+        retcode = await ytdlp_download(video_id, args, 180, workload=media_type)
+        
+        if retcode == 0 and os.path.exists(output_file):
+            return output_file
+    except Exception:
+        pass
+    return None
+
+# Strategy name -> coroutine(video_id, progressive) returning a work file path or None
+DOWNLOAD_STRATEGIES = {
+    "audio": {
+        "smart_audio": lambda video_id, progressive: download_audio_smart(video_id, progressive),
+        "fast_fallback": lambda video_id, progressive: download_audio_fast_fallback(video_id),
+        "last_resort": lambda video_id, progressive: download_last_resort(video_id, "audio"),
+    },
+    "video": {
+        "fast_video": lambda video_id, progressive: download_video_fast(video_id),
+        "last_resort": lambda video_id, progressive: download_last_resort(video_id, "video"),
+    },
+}
+
+async def run_download_strategies(video_id: str, media_type: str, progressive: bool = False) -> Optional[str]:
+    """Run the download strategies, best-performing first, and record the result in the cache.
+    
+    If the running strategy has been downloading for its hedge delay and shows
+    no progress, the next one is started alongside it; the first valid file wins.
+    """
+    flight_key = (video_id, media_type)
+    plan = plan_strategies(media_type, video_id)
+    logger.info(f"🚀 Starting download: {video_id} ({media_type}), plan: {' → '.join(plan)}")
+    
+    remaining = list(plan)
+    running: Dict[asyncio.Task, Tuple[str, float, Dict[str, Any]]] = {}
+    
+    def launch(hedge: bool = False):
+        strategy = remaining.pop(0)
+        if hedge:
+            DOWNLOAD_PROGRESS.get(flight_key, {})["stage"] = "+".join([s for s, *_ in running.values()] + [strategy])
+        else:
+            set_download_stage(video_id, media_type, strategy)
+        attempt: Dict[str, Any] = {}
+        task = asyncio.create_task(run_strategy_attempt(attempt, DOWNLOAD_STRATEGIES[media_type][strategy](video_id, progressive)))
+        running[task] = (strategy, time.time(), attempt)
+        if hedge:
+            ACTIVE_HEDGES["count"] += 1
+            ACTIVE_HEDGES["started"] += 1
+            task.add_done_callback(hedge_finished)
+            
+    launch()
+    try:
+        while running:
+            can_hedge = HEDGING and remaining and len(running) == 1 and ACTIVE_HEDGES["count"] < HEDGE_MAX_PARALLEL
+            delay = None
+            if can_hedge:
+                strategy, _, attempt = next(iter(running.values()))
+                deadline = hedge_deadline(media_type, strategy, attempt, video_id)
+                delay = max(deadline - time.time(), HEDGE_POLL_SECONDS) if deadline else HEDGE_POLL_SECONDS
+            done, _ = await asyncio.wait(running, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            
+            if not done:
+                deadline = hedge_deadline(media_type, strategy, attempt, video_id)
+                if not deadline or time.time() < deadline or not download_stalled(flight_key):
+                    continue
+                logger.info(f"🏁 Hedging {video_id} ({media_type}): {remaining[0]} alongside {strategy}")
+                launch(hedge=True)
+                continue
+                
+            for task in done:
+                strategy, started, attempt = running.pop(task)
+                file_path = None if task.exception() else task.result()
+                record_strategy(media_type, strategy, bool(file_path), time.time() - started, attempt.get("proxy"))
+                record_span(f"strategy:{strategy}", started, time.time(), ok=bool(file_path))
+                if not file_path:
+                    logger.info(f"↪️ {strategy} failed for {video_id} ({media_type})")
+                    continue
+                    
+                # Winner: stop the others and throw away what they wrote
+                for loser, (loser_strategy, loser_started, loser_attempt) in list(running.items()):
+                    loser.cancel()
+                    await asyncio.gather(loser, return_exceptions=True)
+                    remove_work_files(video_id, media_type, loser_strategy)
+                    record_span(f"strategy:{loser_strategy}", loser_started, time.time(), ok=False, lost_race=True)
+                    if loser_started < started:
+                        # It was the stalled one we hedged against, and the hedge paid off
+                        record_strategy(media_type, loser_strategy, False, time.time() - loser_started, loser_attempt.get("proxy"))
+                        ACTIVE_HEDGES["won"] += 1
+                    logger.info(f"🏆 {strategy} beat {loser_strategy} for {video_id} ({media_type})")
+                running.clear()
+                pipeline = DOWNLOAD_PIPELINES.pop(file_path, None)
+                return cache_store(video_id, media_type, file_path, f"{strategy}:{pipeline}" if pipeline else strategy)
+                
+            if not running and remaining:
+                launch()
+    finally:
+        # Only left over when we are being cancelled: take the children down with us
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        
+    logger.error(f"❌ All download methods failed for {video_id}")
+    return None
+
+# =============== ADAPTIVE STRATEGY ORDER ===============
+# Every strategy attempt is recorded (outcome and time taken) in a rolling
+# window, per strategy and per cookie/proxy/format profile. The chain is
+# ordered by expected time per success (mean attempt time / success rate,
+# both smoothed towards a per-strategy prior), which is the optimal order for
+# trying independent alternatives one after another. Strategies that keep
+# failing are skipped except for an occasional probe, the runner-up gets the
+# first try now and then, and old samples age out, so the order recovers by
+# itself when upstream changes again.
+
+STRATEGY_WINDOW = 50
+STRATEGY_WINDOW_SECONDS = int(os.getenv("STRATEGY_WINDOW_SECONDS", "1800"))
+STRATEGY_MIN_SAMPLES = 5
+STRATEGY_SKIP_RATE = 0.1
+STRATEGY_EXPLORE = 0.05
+STRATEGY_PRIOR_WEIGHT = 2
+# Expected seconds per attempt before anything has been observed
+STRATEGY_PRIOR_COST = {"smart_direct": 8, "smart_audio": 12, "fast_fallback": 20, "fast_video": 60, "last_resort": 60}
+
+STRATEGY_STATS: Dict[Tuple[str, str, str], deque] = {}
+# Set inside each strategy task; ytdlp_download notes the proxy the attempt used
+# (failures drop the cached info dict, so it can't be looked up afterwards)
+STRATEGY_ATTEMPT: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("strategy_attempt", default=None)
+
+async def run_strategy_attempt(attempt: Dict[str, Any], coro):
+    """Run one strategy with its attempt record in context"""
+    STRATEGY_ATTEMPT.set(attempt)
+    return await coro
+
+def attempt_proxy() -> Optional[str]:
+    """Proxy the current strategy attempt downloaded through"""
+    return (STRATEGY_ATTEMPT.get() or {}).get("proxy")
+
+def profile_label(proxy: Optional[str], fmt: Optional[str] = None) -> str:
+    """Cookie/proxy(/format) profile for downloads through this proxy"""
+    state = PROXY_POOL.get(proxy)
+    profile = f"{'cookies' if HAS_COOKIES else 'anon'}@{state.label if state else 'direct'}"
+    return f"{profile}/{fmt}" if fmt else profile
+
+def strategy_profile(video_id: str, fmt: Optional[str] = None) -> str:
+    """Profile the next strategy for this video would run under"""
+    return profile_label((INFO_CACHE.get(video_id) or {}).get("proxy"), fmt)
+
+def record_strategy(media_type: str, strategy: str, ok: bool, elapsed: float, proxy: Optional[str], fmt: Optional[str] = None):
+    """Remember one attempt, both for the profile it ran under and for the strategy overall"""
+    sample = (time.time(), ok, elapsed)
+    for profile in (profile_label(proxy, fmt), "*"):
+        STRATEGY_STATS.setdefault((media_type, strategy, profile), deque(maxlen=STRATEGY_WINDOW)).append(sample)
+    outcome = "success" if ok else "failure"
+    STRATEGY_SECONDS.observe(elapsed, media_type=media_type, strategy=strategy, outcome=outcome)
+    STRATEGY_ATTEMPTS.inc(media_type=media_type, strategy=strategy, profile=profile_label(proxy), outcome=outcome)
+
+def _strategy_samples(media_type: str, strategy: str, video_id: str, fmt: Optional[str] = None) -> List[tuple]:
+    """Recent samples for the current profile, or for the strategy overall if those are too few"""
+    cutoff = time.time() - STRATEGY_WINDOW_SECONDS
+    for profile in (strategy_profile(video_id, fmt), "*"):
+        samples = [s for s in STRATEGY_STATS.get((media_type, strategy, profile), ()) if s[0] >= cutoff]
+        if len(samples) >= STRATEGY_MIN_SAMPLES:
+            return samples
+    return samples
+
+def strategy_cost(media_type: str, strategy: str, video_id: str) -> float:
+    """Expected seconds spent per success if this strategy is tried"""
+    samples = _strategy_samples(media_type, strategy, video_id)
+    prior = STRATEGY_PRIOR_COST.get(strategy, 30)
+    successes = sum(1 for s in samples if s[1])
+    success_rate = (successes + 0.5 * STRATEGY_PRIOR_WEIGHT) / (len(samples) + STRATEGY_PRIOR_WEIGHT)
+    mean_time = (sum(s[2] for s in samples) + prior * STRATEGY_PRIOR_WEIGHT) / (len(samples) + STRATEGY_PRIOR_WEIGHT)
+    return mean_time / success_rate
+
+def strategy_enabled(media_type: str, strategy: str, video_id: str, fmt: Optional[str] = None) -> bool:
+    """False while a strategy is failing almost every time (it still gets the odd probe)"""
+    samples = _strategy_samples(media_type, strategy, video_id, fmt)
+    if len(samples) < STRATEGY_MIN_SAMPLES or random.random() < STRATEGY_EXPLORE:
+        return True
+    return sum(1 for s in samples if s[1]) / len(samples) >= STRATEGY_SKIP_RATE
+
+def plan_strategies(media_type: str, video_id: str) -> List[str]:
+    """Strategy names in the order to try them; the cheapest is always kept"""
+    ranked = sorted(DOWNLOAD_STRATEGIES[media_type], key=lambda name: strategy_cost(media_type, name, video_id))
+    if len(ranked) > 1 and random.random() < STRATEGY_EXPLORE:
+        # Now and then give the runner-up the first try, so a recovered strategy gets noticed
+        ranked[0], ranked[1] = ranked[1], ranked[0]
+    plan = [name for name in ranked if strategy_enabled(media_type, name, video_id)]
+    return plan or ranked[:1]
+
+# Hedging: a stalled strategy gets company from the next one in the plan
+HEDGING = os.getenv("HEDGING", "1") == "1"
+HEDGE_MAX_PARALLEL = int(os.getenv("HEDGE_MAX_PARALLEL", "8"))  # hedges running at once, service-wide
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "10"))
+HEDGE_MIN_DELAY = 2
+HEDGE_STALL_SECONDS = 3  # no progress line for this long counts as stalled
+HEDGE_POLL_SECONDS = 1
+
+ACTIVE_HEDGES = {"count": 0, "started": 0, "won": 0}
+
+def hedge_delay(media_type: str, strategy: str, video_id: str) -> float:
+    """How long to give a strategy before hedging: the p90 of its recent successes"""
+    times = sorted(s[2] for s in _strategy_samples(media_type, strategy, video_id) if s[1])
+    if len(times) < STRATEGY_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return max(times[int(0.9 * (len(times) - 1))], HEDGE_MIN_DELAY)
+
+def hedge_deadline(media_type: str, strategy: str, attempt: Dict[str, Any], video_id: str) -> Optional[float]:
+    """When a running strategy may get a hedge: its hedge delay after its download
+    child started. None while it is still extracting, which a hedge would only join."""
+    download_started = attempt.get("download_started")
+    return download_started + hedge_delay(media_type, strategy, video_id) if download_started else None
+
+def hedge_finished(task: asyncio.Task):
+    """Done callback of a hedged strategy task, however it ended"""
+    ACTIVE_HEDGES["count"] -= 1
+
+def download_stalled(flight_key: Tuple[str, str]) -> bool:
+    """True unless the flight has reported progress in the last few seconds"""
+    progress = DOWNLOAD_PROGRESS.get(flight_key) or {}
+    updated_at = progress.get("updated_at")
+    return not updated_at or time.time() - updated_at > HEDGE_STALL_SECONDS
+
+def strategy_stats() -> Dict[str, Any]:
+    """Overall window per strategy, for /status"""
+    cutoff = time.time() - STRATEGY_WINDOW_SECONDS
+    stats = {}
+    for (media_type, strategy, profile), window in STRATEGY_STATS.items():
+        samples = [s for s in window if s[0] >= cutoff]
+        if profile != "*" or not samples:
+            continue
+        times = sorted(s[2] for s in samples)
+        stats[f"{media_type}/{strategy}"] = {
+            "attempts": len(samples),
+            "success_rate": round(sum(1 for s in samples if s[1]) / len(samples), 3),
+            "avg_time": round(sum(times) / len(times), 2),
+            "p90_time": round(times[int(0.9 * (len(times) - 1))], 2)
+        }
+    return stats
+
+# =============== MEDIA FILE SERVING ===============
+# Cached files are handed to the server with the ASGI zerocopysend / pathsend
+# extensions when it advertises them (the server then uses sendfile). Other
+# servers get large pread() chunks from a worker thread instead of a sync
+# generator that Starlette has to iterate one 64 KiB chunk per thread hop.
+
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024)))
+
+async def read_file_range(file_path: str, start: int = 0, end: Optional[int] = None, chunk_size: int = MEDIA_CHUNK_SIZE):
+    """Yield bytes start..end (inclusive) of a file without blocking the event loop"""
+    fd = os.open(file_path, os.O_RDONLY)
     try:
-        logger.info(f"⚡ FAST FALLBACK AUDIO download: {video_id}")
-        
-        timeout = 60
+        if end is None:
+            end = os.fstat(fd).st_size - 1
+        offset = start
+        while offset <= end:
+            chunk = await anyio.to_thread.run_sync(os.pread, fd, min(chunk_size, end - offset + 1), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+    finally:
+        os.close(fd)
+
+class MediaFileResponse(Response):
+    """Serves one byte range of a file (the whole file by default)"""
+    
+    def __init__(
+        self,
+        path: str,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_size: int = MEDIA_CHUNK_SIZE
+    ):
+        self.path = path
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.file_size = os.path.getsize(path)
+        self.start = start
+        self.end = self.file_size - 1 if end is None else end
+        self.chunk_size = chunk_size
+        self.init_headers(headers)
         
-        result = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-        )
+    async def __call__(self, scope, receive, send):
+        extensions = scope.get("extensions") or {}
+        whole_file = self.start == 0 and self.end == self.file_size - 1
         
-        elapsed = time.time() - start_time
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
         
-        if result.returncode == 0 and os.path.exists(output_file):
-            file_size = os.path.getsize(output_file)
-            logger.info(f"✅ FALLBACK AUDIO success ({elapsed:.2f}s): {output_file}")
-            return output_file
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.start,
+                    "count": self.end - self.start + 1,
+                    "more_body": False
+                })
+            BYTES_SERVED.inc(self.end - self.start + 1, source="file")
+        elif "http.response.pathsend" in extensions and whole_file:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            BYTES_SERVED.inc(self.file_size, source="file")
+        else:
+            async with anyio.create_task_group() as task_group:
+                async def stream_body():
+                    async for chunk in read_file_range(self.path, self.start, self.end, self.chunk_size):
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                        BYTES_SERVED.inc(len(chunk), source="file")
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                    task_group.cancel_scope.cancel()
+                    
+                async def listen_for_disconnect():
+                    while (await receive())["type"] != "http.disconnect":
+                        pass
+                    task_group.cancel_scope.cancel()
+                    
+                task_group.start_soon(stream_body)
+                await listen_for_disconnect()
+
+class ManagedStreamingResponse(StreamingResponse):
+    """StreamingResponse that runs on_close however the response ends.
+    
+    A body generator's finally only runs once the generator has started, and
+    Starlette never starts it when the client is gone before the first chunk.
+    Whatever the body holds (flight waiters, lane slots, child processes,
+    upstream connections) is released in on_close instead.
+    """
+    
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
         
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            result = self.on_close()
+            if asyncio.iscoroutine(result):
+                await asyncio.shield(result)
+
+# =============== HTTP RANGE SUPPORT ===============
+MAX_RANGES = 16
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a 'bytes=' Range header into sorted, merged (start, end) pairs (inclusive).
+    
+    Returns None when the header should be ignored (not bytes, malformed, too
+    many ranges) and [] when no range is satisfiable.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
         return None
         
-    except Exception as e:
-        logger.error(f"FALLBACK AUDIO error: {str(e)[:100]}")
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" not in part:
+            return None
+        first, _, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        try:
+            if first == "":
+                # Suffix range: the last N bytes
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(file_size - suffix, 0), file_size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else file_size - 1
+                if last and end < start:
+                    return None
+                end = min(end, file_size - 1)
+        except ValueError:
+            return None
+        if start < file_size:
+            ranges.append((start, end))
+            
+    if len(ranges) > MAX_RANGES:
         return None
+        
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
 
-async def download_video_fast(video_id: str) -> Optional[str]:
-    """FAST VIDEO DOWNLOAD"""
-    start_time = time.time()
-    
-    output_file = os.path.join(CACHE_DIR, f"{video_id}_video_{int(time.time())}.mp4")
-    
-    cmd = [
-        "yt-dlp",
-        "--no-warnings",
-        "--quiet",
-        "--no-progress",
-        "--no-playlist",
-        "--force-ipv4",
-        "--socket-timeout", "30",
-        "--retries", "3",
-        "--fragment-retries", "3",
-        "--skip-unavailable-fragments",
-        "--concurrent-fragments", "4",
-        "-f", "best[height<=720]/best[height<=480]/best",
-        "--merge-output-format", "mp4",
-        "--recode-video", "mp4",
-        "-o", output_file,
-        f"https://youtu.be/{video_id}"
-    ]
+async def _multipart_byteranges(file_path: str, ranges: List[Tuple[int, int]], boundary: str, content_type: str, file_size: int):
+    """Body of a multipart/byteranges response"""
+    for start, end in ranges:
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+        ).encode()
+        async for chunk in read_file_range(file_path, start, end):
+            BYTES_SERVED.inc(len(chunk), source="file")
+            yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+def media_file_response(request: Request, file_path: str, content_type: str, disposition: str):
+    """Serve a cached media file with Range / If-Range / 206 / 416 handling"""
+    stat = os.stat(file_path)
+    file_size = stat.st_size
+    etag = f'"{int(stat.st_mtime):x}-{file_size:x}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
     
-    if HAS_COOKIES:
-        cmd.insert(5, "--cookies")
-        cmd.insert(6, COOKIE_FILE)
+    headers = {
+        "Content-Disposition": disposition,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=3600",
+        "ETag": etag,
+        "Last-Modified": last_modified
+    }
     
-    try:
-        logger.info(f"🎬 FAST VIDEO download: {video_id}")
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() not in (etag, last_modified):
+        # The client's copy is stale: send the whole current file
+        range_header = None
         
-        timeout = 180
+    ranges = parse_range_header(range_header, file_size) if range_header else None
+    
+    if ranges is None:
+        headers["Content-Length"] = str(file_size)
+        return MediaFileResponse(file_path, media_type=content_type, headers=headers)
         
-        result = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    if not ranges:
+        return Response(
+            status_code=416,
+            headers={"Content-Range": f"bytes */{file_size}", "Accept-Ranges": "bytes"}
         )
         
-        elapsed = time.time() - start_time
-        
-        if result.returncode == 0 and os.path.exists(output_file):
-            file_size = os.path.getsize(output_file)
-            logger.info(f"✅ VIDEO success ({elapsed:.2f}s): {output_file} ({file_size/1024/1024:.1f}MB)")
-            return output_file
-        
-        return None
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return MediaFileResponse(
+            file_path,
+            status_code=206,
+            media_type=content_type,
+            headers=headers,
+            start=start,
+            end=end
+        )
         
-    except subprocess.TimeoutExpired:
-        logger.error(f"⏰ Video timeout for {video_id}")
-        return None
-    except Exception as e:
-        logger.error(f"❌ Video error: {str(e)[:100]}")
-        return None
+    boundary = uuid.uuid4().hex
+    content_length = sum(
+        len(f"--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{file_size}\r\n\r\n")
+        + (end - start + 1) + 2
+        for start, end in ranges
+    ) + len(f"--{boundary}--\r\n")
+    headers["Content-Length"] = str(content_length)
+    return StreamingResponse(
+        _multipart_byteranges(file_path, ranges, boundary, content_type, file_size),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers
+    )
 
-async def fast_download(video_id: str, media_type: str = "audio") -> Optional[str]:
-    """Main download function - SMART AUDIO DOWNLOAD"""
-    video_id = extract_video_id(video_id)
-    
-    # Cache check
-    cache_key = f"{video_id}_{media_type}"
-    if cache_key in DOWNLOAD_CACHE:
-        cache_data = DOWNLOAD_CACHE[cache_key]
-        cache_age = datetime.now().timestamp() - cache_data["timestamp"]
-        max_age = 1200  # 20 minutes cache
-        if cache_age < max_age and os.path.exists(cache_data["path"]):
-            logger.info(f"⚡ Cache hit: {video_id} ({media_type})")
-            return cache_data["path"]
+# =============== PROGRESSIVE STREAMING ===============
+# On a cache miss, audio clients don't wait for the whole download: the direct
+# format is fetched sequentially into its output file and every reader of that
+# flight tails the growing file. The descriptor stays valid through the
+# renames into the cache (and the fixup that replaces a DASH m4a with a new
+# file), so a reader simply drains the rest once that download completes.
+
+PROGRESSIVE_STREAMING = os.getenv("PROGRESSIVE_STREAMING", "1") == "1"
+TAIL_POLL_INTERVAL = 0.2
+
+async def tail_follow_generator(flight_key: Tuple[str, str], growing: Dict[str, Any]):
+    """Yield a file as it grows until its download completes.
     
-    logger.info(f"🚀 Starting download: {video_id} ({media_type})")
+    growing is the strategy's GROWING_FILES record ({path, complete}).
+    """
+    loop = asyncio.get_event_loop()
+    with open(growing["path"], 'rb') as f:
+        while True:
+            # Checked before reading: an empty read after completion is the end of the file
+            complete = growing["complete"]
+            chunk = await loop.run_in_executor(None, f.read, MEDIA_CHUNK_SIZE)
+            if chunk:
+                BYTES_SERVED.inc(len(chunk), source="progressive")
+                yield chunk
+                continue
+            if complete:
+                return
+            if growing["complete"]:
+                continue  # finished during that read: drain what landed meanwhile
+            if GROWING_FILES.get(flight_key) is not growing:
+                # The strategy we were following gave up; whatever comes next writes another file
+                raise RuntimeError(f"Progressive download of {growing['path']} was abandoned")
+            await asyncio.sleep(TAIL_POLL_INTERVAL)
+
+async def serve_media(request: Request, video_id: str, media_type: str, content_type: str, disposition: str, error_detail: str, priority: int = PRIORITY_INTERACTIVE):
+    """Serve from cache, tail an in-progress download, or download then serve"""
+    video_id = extract_video_id(video_id)
     
-    if media_type == "audio":
-        # SMART AUDIO STRATEGY
-        # STRATEGY 1: SMART AUDIO DOWNLOAD (checks formats first)
-        file_path = await download_audio_smart(video_id)
-        if file_path:
-            DOWNLOAD_CACHE[cache_key] = {
-                "path": file_path,
-                "timestamp": datetime.now().timestamp(),
-                "size": os.path.getsize(file_path),
-                "method": "smart_audio"
-            }
-            return file_path
+    cached_path = cache_lookup(video_id, media_type)
+    if cached_path:
+        logger.info(f"⚡ Cache hit: {video_id} ({media_type})")
+        return media_file_response(request, cached_path, content_type, disposition)
         
-        # STRATEGY 2: FAST FALLBACK
-        file_path = await download_audio_fast_fallback(video_id)
-        if file_path:
-            DOWNLOAD_CACHE[cache_key] = {
-                "path": file_path,
-                "timestamp": datetime.now().timestamp(),
-                "size": os.path.getsize(file_path),
-                "method": "fast_fallback"
-            }
-            return file_path
-    
-    else:
-        # VIDEO
-        file_path = await download_video_fast(video_id)
-        if file_path:
-            DOWNLOAD_CACHE[cache_key] = {
-                "path": file_path,
-                "timestamp": datetime.now().timestamp(),
-                "size": os.path.getsize(file_path),
-                "method": "fast_video"
-            }
-            return file_path
-    
-    # LAST RESORT
-    logger.info(f"🆘 LAST RESORT: {video_id} ({media_type})")
-    
-    timestamp = int(time.time())
-    if media_type == "audio":
-        output_file = os.path.join(CACHE_DIR, f"{video_id}_last_{timestamp}.m4a")
-        cmd = ["yt-dlp", "--quiet", "-f", "bestaudio", "--extract-audio", "--audio-format", "m4a", "-o", output_file, f"https://youtu.be/{video_id}"]
-    else:
-        output_file = os.path.join(CACHE_DIR, f"{video_id}_last_{timestamp}.mp4")
-        cmd = ["yt-dlp", "--quiet", "-f", "best", "-o", output_file, f"https://youtu.be/{video_id}"]
-    
-    if HAS_COOKIES:
-        cmd.insert(1, "--cookies")
-        cmd.insert(2, COOKIE_FILE)
+    range_header = request.headers.get("range", "").replace(" ", "")
+    progressive = PROGRESSIVE_STREAMING and media_type == "audio" and range_header in ("", "bytes=0-")
+    task = start_download(video_id, media_type, progressive, priority=priority)
+    flight_key = (video_id, media_type)
     
+    if progressive:
+        # Wait for either the first bytes of a growing file or the end of the download
+        acquire_flight(flight_key)
+        handed_off = False
+        try:
+            while not task.done():
+                growing = GROWING_FILES.get(flight_key)
+                if growing and os.path.exists(growing["path"]) and os.path.getsize(growing["path"]) > 0:
+                    logger.info(f"📡 Progressive stream: {video_id} ({media_type})")
+                    handed_off = True
+                    # The waiter is handed to the response, which drops it however it ends
+                    return ManagedStreamingResponse(
+                        tail_follow_generator(flight_key, growing),
+                        on_close=lambda: release_flight(flight_key, task),
+                        media_type=content_type,
+                        headers={
+                            "Content-Disposition": disposition,
+                            "Accept-Ranges": "none",
+                            "Cache-Control": "public, max-age=3600"
+                        }
+                    )
+                if await request.is_disconnected():
+                    logger.info(f"🔌 Client disconnected while waiting: {video_id} ({media_type})")
+                    return Response(status_code=499)
+                await asyncio.sleep(TAIL_POLL_INTERVAL)
+        finally:
+            if not handed_off:
+                release_flight(flight_key, task)
+                
     try:
-        result = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=180)
-        )
+        file_path = await await_download(video_id, media_type, task, request)
+    except ClientDisconnected:
+        # Nobody left to answer
+        return Response(status_code=499)
         
-        if result.returncode == 0 and os.path.exists(output_file):
-            DOWNLOAD_CACHE[cache_key] = {
-                "path": output_file,
-                "timestamp": datetime.now().timestamp(),
-                "size": os.path.getsize(output_file),
-                "method": "last_resort"
-            }
-            return output_file
-    except:
-        pass
-    
-    logger.error(f"❌ All download methods failed for {video_id}")
-    return None
-
-def file_stream_generator(file_path: str):
-    """Stream file content"""
-    try:
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(65536):
-                yield chunk
-    except Exception as e:
-        logger.error(f"Stream error: {e}")
+    if not file_path or not os.path.exists(file_path):
+        raise HTTPException(500, error_detail)
+        
+    return media_file_response(request, file_path, content_type, disposition)
 
 # =============== UPDATED HOMEPAGE - ONLY METADATA FETCH ===============
 @app.get("/")
@@ -1925,8 +4122,73 @@ async def get_video_metadata_api(url: str = Query(..., description="YouTube URL"
             }
         )
     
-    metadata = await get_video_metadata(video_id)
-    return JSONResponse(content=metadata)
+    metadata, cache_state = await get_video_metadata_cached(video_id)
+    return JSONResponse(content=metadata, headers={"X-Cache": cache_state})
+
+METADATA_BATCH_MAX_ITEMS = int(os.getenv("METADATA_BATCH_MAX_ITEMS", "1000"))
+METADATA_BATCH_CONCURRENCY = int(os.getenv("METADATA_BATCH_CONCURRENCY", "16"))
+METADATA_BATCH_MAX_CONCURRENCY = int(os.getenv("METADATA_BATCH_MAX_CONCURRENCY", "64"))
+
+class MetadataBatchRequest(BaseModel):
+    urls: List[str]
+    concurrency: Optional[int] = None
+    stream: bool = False
+
+@app.post("/api/metadata/batch")
+async def get_video_metadata_batch(batch: MetadataBatchRequest):
+    """Metadata for many URLs/IDs: deduplicated, cached ones answered at once, the rest fetched in parallel"""
+    if len(batch.urls) > METADATA_BATCH_MAX_ITEMS:
+        return JSONResponse(status_code=400, content={
+            "status": "error",
+            "error": f"Too many items ({len(batch.urls)}), maximum is {METADATA_BATCH_MAX_ITEMS}"
+        })
+    
+    start_time = time.time()
+    concurrency = min(max(batch.concurrency or METADATA_BATCH_CONCURRENCY, 1), METADATA_BATCH_MAX_CONCURRENCY)
+    limiter = asyncio.Semaphore(concurrency)
+    
+    # Normalise and deduplicate, remembering which inputs map to each id
+    inputs_by_id: Dict[str, List[str]] = OrderedDict()
+    invalid = []
+    for url in batch.urls:
+        video_id = extract_video_id(url.strip())
+        if not video_id or len(video_id) != 11:
+            invalid.append({"input": url, "status": "error", "error": "Invalid YouTube URL or Video ID"})
+            continue
+        inputs_by_id.setdefault(video_id, []).append(url)
+        
+    async def resolve(video_id: str) -> Dict[str, Any]:
+        try:
+            metadata, cache_state = await get_video_metadata_cached(video_id, limiter, PRIORITY_BATCH)
+        except LaneSaturated as e:
+            metadata, cache_state = {"video_id": video_id, "status": "busy", "retry_after": e.retry_after}, "SHED"
+        return {"video_id": video_id, "inputs": inputs_by_id[video_id], "cache": cache_state, "metadata": metadata}
+    
+    tasks = [asyncio.create_task(resolve(video_id)) for video_id in inputs_by_id]
+    
+    if batch.stream:
+        async def ndjson():
+            # Results in completion order, one JSON object per line
+            try:
+                for item in invalid:
+                    yield json.dumps(item) + "\n"
+                for next_done in asyncio.as_completed(tasks):
+                    yield json.dumps(await next_done) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+                    
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    
+    results = await asyncio.gather(*tasks)
+    return JSONResponse(content={
+        "status": "ok",
+        "count": len(batch.urls),
+        "unique": len(inputs_by_id),
+        "invalid": invalid,
+        "results": results,
+        "elapsed": round(time.time() - start_time, 3)
+    })
 
 # =============== ALL BACKEND DOWNLOAD ENDPOINTS STILL WORKING ===============
 # (But not shown in frontend)
@@ -1968,6 +4230,7 @@ async def youtube_download_token(
 
 @app.get("/stream/{video_id}")
 async def youtube_stream(
+    request: Request,
     video_id: str,
     type: str = Query("audio", description="Stream type: audio or video"),
     token: Optional[str] = Query(None, description="Download token")
@@ -1977,84 +4240,683 @@ async def youtube_stream(
     if type not in ["audio", "video"]:
         raise HTTPException(400, "Type must be 'audio' or 'video'")
     
-    # Validate token
+    # Validate token. A used token only serves ranges that continue its own
+    # session (a player seeking): same video and client, a non-zero start, and
+    # within TOKEN_SEEK_WINDOW of the session's last request
     if token:
         token_data = download_tokens.get(token)
-        if not token_data or token_data.get("used", False) or datetime.now() > token_data.get("expires_at"):
+        now = datetime.now()
+        if not token_data or now > token_data.get("expires_at"):
             raise HTTPException(401, "Invalid or expired token")
-        download_tokens[token]["used"] = True
+        client = request.client.host if request.client else None
+        if token_data.get("used", False):
+            range_start = re.match(r"bytes=(\d+)-", request.headers.get("range", "").replace(" ", ""))
+            seeking = (
+                range_start is not None and int(range_start.group(1)) > 0
+                and token_data.get("video_id") == extract_video_id(video_id)
+                and token_data.get("type") == type
+                and token_data.get("client") == client
+                and (now - token_data["last_used_at"]).total_seconds() <= TOKEN_SEEK_WINDOW
+            )
+            if not seeking:
+                raise HTTPException(401, "Invalid or expired token")
+        token_data.setdefault("client", client)
+        token_data.update(used=True, last_used_at=now)
     
-    # Download file
+    # Download (or tail the in-progress download) and stream file
     logger.info(f"📥 Stream request: {video_id} ({type})")
-    file_path = await fast_download(video_id, type)
-    
-    if not file_path or not os.path.exists(file_path):
-        raise HTTPException(500, f"Could not download {type}")
-    
-    # Stream file
-    file_size = os.path.getsize(file_path)
     
     if type == "audio":
         content_type = "audio/mp4"
+        ext = "m4a"
     else:
         content_type = "video/mp4"
+        ext = "mp4"
     
-    return StreamingResponse(
-        file_stream_generator(file_path),
-        media_type=content_type,
-        headers={
-            "Content-Type": content_type,
-            "Content-Length": str(file_size),
-            "Content-Disposition": f'inline; filename="{os.path.basename(file_path)}"',
-            "Accept-Ranges": "bytes",
-            "Cache-Control": "public, max-age=3600"
-        }
+    return await serve_media(
+        request,
+        video_id,
+        type,
+        content_type,
+        f'inline; filename="{extract_video_id(video_id)}.{ext}"',
+        f"Could not download {type}"
     )
 
 @app.get("/audio/{video_id}")
-async def direct_audio_stream(video_id: str):
+async def direct_audio_stream(
+    request: Request,
+    video_id: str,
+    codec: Optional[str] = Query(None, description="Transcode to: opus, aac or mp3"),
+    bitrate: str = Query("128k", description="Rendition bitrate, e.g. 64k or 96k")
+):
     """Direct audio download endpoint"""
-    logger.info(f"🎵 Audio request: {video_id}")
-    
-    # Download audio
-    file_path = await fast_download(video_id, "audio")
+    logger.info(f"🎵 Audio request: {video_id}{f' ({codec} {bitrate})' if codec else ''}")
     
-    if not file_path or not os.path.exists(file_path):
-        raise HTTPException(500, "Audio download failed")
+    if codec:
+        return await serve_rendition(request, extract_video_id(video_id), codec, bitrate)
     
-    # Return file
-    return FileResponse(
-        file_path,
-        media_type="audio/mp4",
-        filename=f"{video_id}.m4a",
-        headers={
-            "Content-Disposition": f'attachment; filename="{video_id}.m4a"',
-            "Cache-Control": "public, max-age=3600"
-        }
+    # Download audio (audio is streamed while it downloads) and return file
+    return await serve_media(
+        request,
+        video_id,
+        "audio",
+        "audio/mp4",
+        f'attachment; filename="{video_id}.m4a"',
+        "Audio download failed",
+        PRIORITY_DOWNLOAD
     )
 
 @app.get("/video/{video_id}")
-async def direct_video_stream(video_id: str):
+async def direct_video_stream(request: Request, video_id: str):
     """Direct video download endpoint"""
     logger.info(f"🎬 Video request: {video_id}")
     
-    # Download video
-    file_path = await fast_download(video_id, "video")
+    # Download video (audio is streamed while it downloads) and return file
+    return await serve_media(
+        request,
+        video_id,
+        "video",
+        "video/mp4",
+        f'attachment; filename="{video_id}.mp4"',
+        "Video download failed",
+        PRIORITY_DOWNLOAD
+    )
+
+# =============== CACHE PREFETCH ===============
+# Known upcoming tracks (playlists, chart lists) are downloaded ahead of time so
+# the first listener gets a cache hit. Jobs wait for a slot in the prefetch
+# lane, which caps how many run at once, and only then join the normal
+# download flight at background priority, pinned so it survives without
+# waiters. A live request for the same video meanwhile just starts or joins
+# the download as usual.
+
+PREFETCH_LIST_FILE = os.getenv("PREFETCH_LIST_FILE", "prefetch.txt")
+PREFETCH_MAX_ITEMS = int(os.getenv("PREFETCH_MAX_ITEMS", "1000"))
+PREFETCH_MAX_JOBS = int(os.getenv("PREFETCH_MAX_JOBS", "5000"))
+PREFETCH_RETRIES = 3
+
+PREFETCH_JOBS: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+_prefetch_tasks: Set[asyncio.Task] = set()
+
+async def _prefetch_job(job: Dict[str, Any]):
+    """Download one prefetch item unless it is already cached"""
+    video_id, media_type = job["video_id"], job["media_type"]
+    try:
+        async with LANES["prefetch"].slot(PRIORITY_BACKGROUND):
+            for attempt in range(PREFETCH_RETRIES):
+                if DOWNLOAD_CACHE.get(cache_key_for(video_id, media_type)):
+                    job["status"] = "cached"
+                    return
+                job["status"] = "running"
+                try:
+                    file_path = await asyncio.shield(start_download(video_id, media_type, pinned=True, priority=PRIORITY_BACKGROUND))
+                    break
+                except LaneSaturated as e:
+                    # Live traffic has the lane; back off and try again
+                    job["status"] = "deferred"
+                    await asyncio.sleep(e.retry_after)
+            else:
+                job.update(status="failed", error="download lane busy")
+                return
+                
+        if file_path:
+            job["status"] = "done"
+            logger.info(f"🔥 Prefetched: {video_id} ({media_type})")
+        else:
+            job.update(status="failed", error="all download methods failed")
+    except LaneSaturated:
+        job.update(status="rejected", error="prefetch queue full")
+    except Exception as e:
+        job.update(status="failed", error=str(e)[:100])
+    finally:
+        job["finished_at"] = time.time()
+
+def queue_prefetch(video_id: str, media_type: str = "audio") -> Dict[str, Any]:
+    """Queue a prefetch (or report the existing job). Returns the job status."""
+    key = (video_id, media_type)
+    job = PREFETCH_JOBS.get(key)
+    if job and job["status"] in ("queued", "running", "deferred"):
+        return job
+        
+    job = {"video_id": video_id, "media_type": media_type, "status": "queued", "queued_at": time.time(), "finished_at": None, "error": None}
+    PREFETCH_JOBS[key] = job
+    PREFETCH_JOBS.move_to_end(key)
+    while len(PREFETCH_JOBS) > PREFETCH_MAX_JOBS:
+        PREFETCH_JOBS.popitem(last=False)
+        
+    if DOWNLOAD_CACHE.get(cache_key_for(video_id, media_type)):
+        job.update(status="cached", finished_at=time.time())
+        return job
+        
+    task = asyncio.create_task(_prefetch_job(job))
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+    return job
+
+def load_prefetch_list(path: str) -> int:
+    """Queue every entry of a list file: one URL or ID per line, optionally followed by audio|video"""
+    if not os.path.exists(path):
+        return 0
+    queued = 0
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            media_type = parts[1] if len(parts) > 1 and parts[1] in ("audio", "video") else "audio"
+            video_id = extract_video_id(parts[0])
+            if video_id and len(video_id) == 11:
+                queue_prefetch(video_id, media_type)
+                queued += 1
+    return queued
+
+class PrefetchRequest(BaseModel):
+    urls: List[str]
+    media_type: str = "audio"
+
+@app.post("/prefetch")
+async def prefetch(batch: PrefetchRequest):
+    """Warm the cache for a list of URLs/IDs at background priority"""
+    if batch.media_type not in ("audio", "video"):
+        return JSONResponse(status_code=400, content={"status": "error", "error": "media_type must be audio or video"})
+    if len(batch.urls) > PREFETCH_MAX_ITEMS:
+        return JSONResponse(status_code=400, content={
+            "status": "error",
+            "error": f"Too many items ({len(batch.urls)}), maximum is {PREFETCH_MAX_ITEMS}"
+        })
+        
+    items = []
+    for url in batch.urls:
+        video_id = extract_video_id(url.strip())
+        if not video_id or len(video_id) != 11:
+            items.append({"input": url, "status": "error", "error": "Invalid YouTube URL or Video ID"})
+            continue
+        job = queue_prefetch(video_id, batch.media_type)
+        items.append({"input": url, **job})
+        
+    return JSONResponse(content={"status": "ok", "count": len(items), "items": items})
+
+@app.get("/prefetch")
+async def prefetch_status(video_id: Optional[str] = None, media_type: str = "audio"):
+    """Status of one prefetch job, or a summary of all of them"""
+    if video_id:
+        job = PREFETCH_JOBS.get((extract_video_id(video_id), media_type))
+        if not job:
+            raise HTTPException(404, "No prefetch job for this video")
+        return job
+        
+    counts: Dict[str, int] = {}
+    for job in PREFETCH_JOBS.values():
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    return {"status": "ok", "jobs": len(PREFETCH_JOBS), "by_status": counts, "items": list(PREFETCH_JOBS.values())[-100:]}
+
+# =============== DOWNLOAD JOBS ===============
+# Long downloads don't have to hold a request open: POST /jobs starts (or
+# joins) the download and returns at once, GET /jobs/{id} polls it, and
+# GET /jobs/{id}/events pushes progress as Server-Sent Events with regular
+# heartbeats so idle-timeout proxies keep the connection. Job downloads are
+# pinned, since nobody is attached to them while they run.
+
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+JOB_EVENT_INTERVAL = 1
+JOB_HEARTBEAT_INTERVAL = 15
+
+DOWNLOAD_JOBS: Dict[str, Dict[str, Any]] = {}
+
+class JobRequest(BaseModel):
+    url: str
+    type: str = "audio"
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public job state, with live progress while it runs"""
+    view = {k: v for k, v in job.items() if k != "task"}
+    if job["status"] == "running":
+        view["progress"] = dict(DOWNLOAD_PROGRESS.get((job["video_id"], job["type"]), {}))
+    return view
+
+async def _run_job(job: Dict[str, Any], task: asyncio.Task):
+    """Follow a job's download to the end"""
+    try:
+        file_path = await asyncio.shield(task)
+        if file_path and os.path.exists(file_path):
+            job.update(status="done", stream_url=f"/stream/{job['video_id']}?type={job['type']}")
+        else:
+            job.update(status="failed", error=f"Could not download {job['type']}")
+    except LaneSaturated as e:
+        job.update(status="failed", error="Server busy, try again later", retry_after=e.retry_after)
+    except Exception as e:
+        job.update(status="failed", error=str(e)[:100])
+    finally:
+        job["finished_at"] = time.time()
+        job.pop("task", None)
+
+@app.post("/jobs", status_code=202)
+async def create_job(body: JobRequest):
+    """Start a download job; returns its id right away"""
+    if body.type not in ("audio", "video"):
+        raise HTTPException(400, "Type must be 'audio' or 'video'")
+    video_id = extract_video_id(body.url.strip())
+    if not video_id or len(video_id) != 11:
+        raise HTTPException(400, "Invalid YouTube URL or Video ID")
+        
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "video_id": video_id,
+        "type": body.type,
+        "status": "running",
+        "created_at": time.time(),
+        "finished_at": None,
+        "stream_url": None,
+        "error": None
+    }
+    DOWNLOAD_JOBS[job_id] = job
     
-    if not file_path or not os.path.exists(file_path):
-        raise HTTPException(500, "Video download failed")
-    
-    # Return file
-    return FileResponse(
-        file_path,
-        media_type="video/mp4",
-        filename=f"{video_id}.mp4",
-        headers={
-            "Content-Disposition": f'attachment; filename="{video_id}.mp4"',
-            "Cache-Control": "public, max-age=3600"
-        }
+    if cache_lookup(video_id, body.type):
+        job.update(status="done", finished_at=time.time(), stream_url=f"/stream/{video_id}?type={body.type}")
+    else:
+        job["task"] = asyncio.create_task(_run_job(job, start_download(video_id, body.type, pinned=True)))
+        
+    logger.info(f"🧾 Job {job_id[:8]}: {video_id} ({body.type}) {job['status']}")
+    return {**_job_view(job), "status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Current state of a download job"""
+    job = DOWNLOAD_JOBS.get(job_id)
+    if not job:
+        raise HTTPException(404, "Unknown or expired job")
+    return _job_view(job)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events: 'progress' while running, then one 'done' or 'failed'"""
+    job = DOWNLOAD_JOBS.get(job_id)
+    if not job:
+        raise HTTPException(404, "Unknown or expired job")
+        
+    async def events():
+        last_view = None
+        last_sent = 0.0
+        while True:
+            view = _job_view(job)
+            if view != last_view:
+                event = "progress" if job["status"] == "running" else job["status"]
+                yield f"event: {event}\ndata: {json.dumps(view)}\n\n"
+                last_view, last_sent = view, time.time()
+            elif time.time() - last_sent >= JOB_HEARTBEAT_INTERVAL:
+                yield ": heartbeat\n\n"
+                last_sent = time.time()
+            if job["status"] != "running":
+                return
+            await asyncio.sleep(JOB_EVENT_INTERVAL)
+            
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# =============== DISKLESS RELAY ===============
+# /relay skips the download-to-disk step for plain progressive formats (itag
+# 140 audio, itag 18 video): the direct googlevideo URL is resolved once,
+# remembered until it expires, and the upstream bytes are piped to the client
+# through one pooled aiohttp session, Range headers included. Audio relays
+# can optionally tee a full response into a cache entry of their own: itag 140
+# arrives as raw DASH, which /audio only serves after a fixup.
+
+RELAY_MAX_CONNECTIONS = int(os.getenv("RELAY_MAX_CONNECTIONS", "100"))
+RELAY_TEE = os.getenv("RELAY_TEE", "0") == "1"
+RELAY_URL_MARGIN = 60  # stop using a URL this long before it expires
+RELAY_AUDIO_FORMATS = ["140", "139"]
+RELAY_VIDEO_FORMATS = ["18"]
+RELAY_CACHE_FORMAT = "relay"
+
+RELAY_URLS: Dict[Tuple[str, str], Dict[str, Any]] = {}
+RELAY_FLIGHTS: Dict[Tuple[str, str], asyncio.Task] = {}
+RELAY_TEES: Set[str] = set()  # videos currently being teed into the cache
+relay_session: Optional[aiohttp.ClientSession] = None
+
+def get_relay_session() -> aiohttp.ClientSession:
+    """Shared upstream session (keep-alive pool across all relays)"""
+    global relay_session
+    if relay_session is None or relay_session.closed:
+        relay_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=RELAY_MAX_CONNECTIONS, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30),
+            auto_decompress=False
+        )
+    return relay_session
+
+def _relay_format(info: Dict[str, Any], media_type: str) -> Optional[Dict[str, Any]]:
+    """A single-file https format that can be piped as-is"""
+    preferred = RELAY_AUDIO_FORMATS if media_type == "audio" else RELAY_VIDEO_FORMATS
+    formats = {str(f.get("format_id")): f for f in info.get("formats") or [] if f.get("protocol") in ("https", "http") and f.get("url")}
+    for format_id in preferred:
+        if format_id in formats:
+            return formats[format_id]
+    return None
+
+async def _resolve_relay_url(video_id: str, media_type: str) -> Optional[Dict[str, Any]]:
+    async with LANES["metadata"].slot(PRIORITY_INTERACTIVE):
+        entry = await get_video_info_entry(video_id)
+    fmt = _relay_format(entry["info"], media_type)
+    if not fmt:
+        return None
+    expire = re.search(r"[?&]expire=(\d+)", fmt["url"])
+    resolved = {
+        "url": fmt["url"],
+        "headers": fmt.get("http_headers") or {},
+        "proxy": entry.get("proxy"),
+        "format_id": str(fmt["format_id"]),
+        "expires_at": (int(expire.group(1)) if expire else entry["timestamp"] + INFO_CACHE_TTL) - RELAY_URL_MARGIN
+    }
+    RELAY_URLS[(video_id, media_type)] = resolved
+    return resolved
+
+async def resolve_relay_url(video_id: str, media_type: str) -> Optional[Dict[str, Any]]:
+    """Direct media URL for a relay, cached until it expires; single-flight"""
+    key = (video_id, media_type)
+    cached = RELAY_URLS.get(key)
+    if cached and time.time() < cached["expires_at"]:
+        return cached
+        
+    task = RELAY_FLIGHTS.get(key)
+    if task is None:
+        task = asyncio.create_task(_resolve_relay_url(video_id, media_type))
+        RELAY_FLIGHTS[key] = task
+        task.add_done_callback(lambda t: RELAY_FLIGHTS.pop(key, None))
+    return await asyncio.shield(task)
+
+def prune_relay_urls() -> int:
+    """Drop resolved URLs past their expiry"""
+    now = time.time()
+    expired = [key for key, resolved in RELAY_URLS.items() if now >= resolved["expires_at"]]
+    for key in expired:
+        del RELAY_URLS[key]
+    return len(expired)
+
+def forget_relay_url(video_id: str, media_type: str):
+    """Drop a URL upstream refused, and the info dict it came from"""
+    RELAY_URLS.pop((video_id, media_type), None)
+    INFO_CACHE.pop(video_id, None)
+
+async def _relay_body(upstream: aiohttp.ClientResponse, tee_path: Optional[str], video_id: str, media_type: str):
+    """Pipe upstream to the client, optionally writing a copy for the cache.
+    The response itself releases upstream and drops an unfinished copy."""
+    tee = open(tee_path, "wb") if tee_path else None
+    received = 0
+    try:
+        async for chunk in upstream.content.iter_chunked(MEDIA_CHUNK_SIZE):
+            received += len(chunk)
+            if tee:
+                await anyio.to_thread.run_sync(tee.write, chunk)
+            BYTES_SERVED.inc(len(chunk), source="relay")
+            yield chunk
+            
+        if tee:
+            tee.close()
+            if upstream.content_length is None or received == upstream.content_length:
+                cache_store(video_id, media_type, tee_path, "relay", RELAY_CACHE_FORMAT)
+    finally:
+        if tee:
+            tee.close()
+
+async def relay_media(request: Request, video_id: str, media_type: str, content_type: str, disposition: str, tee: bool = False):
+    """Stream the upstream file straight through, forwarding Range"""
+    if not BACKEND.online:
+        return None  # replayed recordings have no live URL to pipe, use the normal path
+    range_header = request.headers.get("range")
+    
+    for attempt in range(2):
+        resolved = await resolve_relay_url(video_id, media_type)
+        if not resolved:
+            return None
+            
+        headers = dict(resolved["headers"])
+        headers.pop("Accept-Encoding", None)
+        if range_header:
+            headers["Range"] = range_header
+            
+        upstream = await get_relay_session().get(resolved["url"], headers=headers, proxy=resolved["proxy"])
+        if upstream.status in (403, 410) and attempt == 0:
+            # Expired or IP-mismatched URL: resolve again once
+            upstream.release()
+            forget_relay_url(video_id, media_type)
+            continue
+        break
+        
+    if upstream.status not in (200, 206, 416):
+        upstream.release()
+        raise HTTPException(502, f"Upstream answered {upstream.status}")
+        
+    response_headers = {"Content-Disposition": disposition, "Accept-Ranges": "bytes", "Cache-Control": "no-store"}
+    for name in ("Content-Length", "Content-Range"):
+        if name in upstream.headers:
+            response_headers[name] = upstream.headers[name]
+            
+    # Only a complete audio body can become a cache entry
+    whole = re.fullmatch(r"bytes 0-(\d+)/(\d+)", upstream.headers.get("Content-Range", ""))
+    complete = upstream.status == 200 or (whole and int(whole.group(1)) + 1 == int(whole.group(2)))
+    tee_path = None
+    if tee and complete and media_type == "audio" and resolved["format_id"] == "140" and video_id not in RELAY_TEES:
+        tee_path = tee_path_for(video_id, media_type, "relay", "m4a")
+        RELAY_TEES.add(video_id)
+        
+    def close_relay():
+        # Runs even if the client left before the body generator started
+        upstream.release()
+        if tee_path:
+            RELAY_TEES.discard(video_id)
+            if os.path.exists(tee_path):
+                os.remove(tee_path)
+                
+
+    logger.info(f"🔁 Relay {upstream.status}: {video_id} ({media_type}, itag {resolved['format_id']}{', tee' if tee_path else ''})")
+    return ManagedStreamingResponse(
+        _relay_body(upstream, tee_path, video_id, media_type),
+        on_close=close_relay,
+        status_code=upstream.status,
+        media_type=content_type,
+        headers=response_headers
+    )
+
+@app.get("/relay/{video_id}")
+async def relay(
+    request: Request,
+    video_id: str,
+    type: str = Query("audio", description="Relay type: audio or video"),
+    cache: Optional[bool] = Query(None, description="Also store the bytes in the cache (audio only)")
+):
+    """Play without touching disk: pipe the upstream media through"""
+    if type not in ["audio", "video"]:
+        raise HTTPException(400, "Type must be 'audio' or 'video'")
+    video_id = extract_video_id(video_id)
+    content_type = "audio/mp4" if type == "audio" else "video/mp4"
+    disposition = f'inline; filename="{video_id}.{"m4a" if type == "audio" else "mp4"}"'
+    
+    # Already on disk: serving the file is cheaper than the network
+    cached_path = cache_lookup(video_id, type) or cache_lookup(video_id, type, RELAY_CACHE_FORMAT)
+    if cached_path:
+        return media_file_response(request, cached_path, content_type, disposition)
+        
+    try:
+        response = await relay_media(request, video_id, type, content_type, disposition, RELAY_TEE if cache is None else cache)
+    except yt_dlp.utils.DownloadError as e:
+        raise HTTPException(404, f"Video unavailable: {str(e)[:100]}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise HTTPException(502, f"Upstream error: {str(e)[:100]}")
+        
+    if response is None:
+        # No plain format to pipe (or only adaptive streams): fall back to the normal path
+        return await serve_media(request, video_id, type, content_type, disposition, f"Could not relay {type}")
+    return response
+
+# =============== AUDIO RENDITIONS ===============
+# /audio/{id}?codec=opus&bitrate=96k pipes the cached source through a
+# streaming ffmpeg straight into the response and writes the same bytes to a
+# cache entry for that rendition ({id}.audio.opus_96k.ogg), so the next request
+# for it is a plain file serve. Transcoders run in their own scheduler lane,
+# which caps how many run at once and sheds the rest with 429/503.
+
+RENDITION_BITRATES = ["48k", "64k", "96k", "128k", "160k", "192k"]
+RENDITION_CODECS = {
+    # codec: (ffmpeg encoder args, container, file extension, content type)
+    "opus": (["-c:a", "libopus", "-ar", "48000", "-application", "audio"], "ogg", "ogg", "audio/ogg"),
+    "aac": (["-c:a", "aac"], "adts", "aac", "audio/aac"),
+    "mp3": (["-c:a", "libmp3lame"], "mp3", "mp3", "audio/mpeg"),
+}
+TRANSCODE_CHUNK_SIZE = 64 * 1024
+
+TRANSCODES_IN_PROGRESS: Set[str] = set()  # rendition cache keys being teed right now
+
+async def _transcode_body(proc: asyncio.subprocess.Process, tee_path: Optional[str], video_id: str, fmt: str):
+    """Relay ffmpeg's stdout to the client and (optionally) into the cache.
+    The response itself stops ffmpeg, frees the lane and drops an unfinished copy."""
+    key = cache_key_for(video_id, "audio", fmt)
+    stderr_lines: deque = deque(maxlen=20)
+    stderr_pump = asyncio.create_task(_pump_lines(proc.stderr, stderr_lines, "stderr", None))
+    tee = open(tee_path, "wb") if tee_path else None
+    start_time = time.time()
+    try:
+        while chunk := await proc.stdout.read(TRANSCODE_CHUNK_SIZE):
+            if tee:
+                await anyio.to_thread.run_sync(tee.write, chunk)
+            BYTES_SERVED.inc(len(chunk), source="transcode")
+            yield chunk
+            
+        await proc.wait()
+        await stderr_pump
+        if proc.returncode != 0:
+            logger.error(f"❌ Transcode {key} failed: {(list(stderr_lines) or ['no output'])[-1][:150]}")
+        elif tee:
+            tee.close()
+            cache_store(video_id, "audio", tee_path, "transcode", fmt=fmt)
+            logger.info(f"🎚️ Cached rendition {key}")
+    finally:
+        record_span("transcode", start_time, time.time(), format=fmt, exit_code=proc.returncode)
+        stderr_pump.cancel()
+        if tee:
+            tee.close()
+
+async def serve_rendition(request: Request, video_id: str, codec: str, bitrate: str):
+    """Serve an audio rendition from cache, or transcode it on the fly"""
+    if codec not in RENDITION_CODECS or bitrate not in RENDITION_BITRATES:
+        raise HTTPException(400, f"codec must be one of {list(RENDITION_CODECS)} and bitrate one of {RENDITION_BITRATES}")
+    encoder_args, container, ext, content_type = RENDITION_CODECS[codec]
+    fmt = f"{codec}_{bitrate}"
+    disposition = f'attachment; filename="{video_id}.{ext}"'
+    
+    cached_path = cache_lookup(video_id, "audio", fmt)
+    if cached_path:
+        logger.info(f"⚡ Cache hit: {video_id} (audio {fmt})")
+        return media_file_response(request, cached_path, content_type, disposition)
+        
+    # The source is the normal cached audio (downloaded first if needed)
+    source = cache_lookup(video_id, "audio")
+    if not source:
+        try:
+            source = await await_download(video_id, "audio", start_download(video_id, "audio", priority=PRIORITY_DOWNLOAD), request)
+        except ClientDisconnected:
+            return Response(status_code=499)
+    if not source or not os.path.exists(source):
+        raise HTTPException(500, "Audio download failed")
+        
+    lane = LANES["transcode"]
+    await lane.acquire(PRIORITY_INTERACTIVE)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *FFMPEG_COMMAND, "-nostdin", "-hide_banner", "-loglevel", "error",
+            "-i", source, "-map", "0:a:0", "-vn",
+            *encoder_args, "-b:a", bitrate,
+            "-f", container, "pipe:1",
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+    except BaseException:
+        lane.release()
+        raise
+    RUNNING_PROCESSES[proc.pid] = {"workload": "transcode", "cmd": FFMPEG_COMMAND[0], "started": time.time()}
+    
+    # One request per rendition writes the cache copy; concurrent ones just stream
+    key = cache_key_for(video_id, "audio", fmt)
+    tee_path = None
+    if key not in TRANSCODES_IN_PROGRESS:
+        TRANSCODES_IN_PROGRESS.add(key)
+        tee_path = tee_path_for(video_id, "audio", f"transcode_{fmt}", ext)
+        
+    async def close_transcode():
+        # Runs even if the client left before the body generator started
+        try:
+            await _kill_process_group(proc)
+        finally:
+            RUNNING_PROCESSES.pop(proc.pid, None)
+            lane.release()
+            if tee_path:
+                TRANSCODES_IN_PROGRESS.discard(key)
+                if os.path.exists(tee_path):
+                    os.remove(tee_path)
+                    
+    logger.info(f"🎚️ Transcoding {video_id} → {fmt}{' (caching)' if tee_path else ''}")
+    return ManagedStreamingResponse(
+        _transcode_body(proc, tee_path, video_id, fmt),
+        on_close=close_transcode,
+        media_type=content_type,
+        headers={"Content-Disposition": disposition, "Accept-Ranges": "none", "Cache-Control": "public, max-age=3600"}
     )
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+        
+    lines += gauge_lines("ytapi_running_processes", "Supervised child processes", [
+        ({"workload": workload}, sum(1 for p in RUNNING_PROCESSES.values() if p["workload"] == workload))
+        for workload in [*SUBPROCESS_LIMITS, "transcode"]
+    ])
+    lines += gauge_lines("ytapi_inflight_downloads", "Downloads in flight", [({}, len(INFLIGHT_DOWNLOADS))])
+    lines += gauge_lines("ytapi_extract_queue_depth", "Extractions waiting for an executor thread", [({}, EXTRACT_QUEUE["waiting"])])
+    lines += gauge_lines("ytapi_lane_active", "Busy slots per scheduler lane", [({"lane": name}, lane.active) for name, lane in LANES.items()])
+    lines += gauge_lines("ytapi_lane_queued", "Queued jobs per scheduler lane", [({"lane": name}, len(lane.waiting)) for name, lane in LANES.items()])
+    lines += gauge_lines("ytapi_cache_bytes", "Bytes in the media cache", [({}, CACHE_STATS["bytes"])])
+    lines += gauge_lines("ytapi_cache_reserved_bytes", "Cache bytes reserved by downloads in progress", [({}, CACHE_STATS["reserved"])])
+    lines += gauge_lines("ytapi_cache_budget_bytes", "Current media cache budget", [({}, cache_budget_bytes())])
+    lines += gauge_lines("ytapi_cache_entries", "Entries in the media cache", [({}, len(DOWNLOAD_CACHE))])
+    lines += counter_lines("ytapi_cache_evictions_total", "Cache evictions", [({}, CACHE_STATS["evictions"])])
+    lines += counter_lines("ytapi_cache_evicted_bytes_total", "Bytes evicted from the cache", [({}, CACHE_STATS["evicted_bytes"])])
+    lines += counter_lines("ytapi_hedges_total", "Hedged downloads", [({"result": "started"}, ACTIVE_HEDGES["started"]), ({"result": "won"}, ACTIVE_HEDGES["won"])])
+    lines += gauge_lines("ytapi_proxy_healthy", "1 if the proxy is in rotation", [({"proxy": s.label}, int(s.healthy())) for s in PROXY_POOL.values()])
+    lines += gauge_lines("ytapi_proxy_success_rate", "Moving-average proxy success rate", [({"proxy": s.label}, round(s.success_rate, 4)) for s in PROXY_POOL.values()])
+    lines += gauge_lines("ytapi_proxy_active_jobs", "Jobs currently using the proxy", [({"proxy": s.label}, s.active) for s in PROXY_POOL.values()])
+    
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/traces")
+async def debug_traces(
+    path: Optional[str] = Query(None, description="Only paths starting with this"),
+    min_duration: float = Query(0, description="Only requests slower than this many seconds"),
+    limit: int = Query(50, le=500)
+):
+    """Most recent request traces, newest first"""
+    matches = [
+        t for t in reversed(TRACES)
+        if (not path or t["path"].startswith(path)) and (t["duration_ms"] or 0) >= min_duration * 1000
+    ]
+    return {"count": len(matches), "traces": matches[:limit]}
+
+@app.get("/debug/traces/{trace_id}")
+async def debug_trace(trace_id: str):
+    """One trace by id"""
+    for trace in reversed(TRACES):
+        if trace["trace_id"] == trace_id:
+            return trace
+    raise HTTPException(404, "Trace not found (it may have rotated out)")
+
 @app.get("/status")
 async def api_status():
     """API status endpoint"""
@@ -2064,11 +4926,36 @@ async def api_status():
         "timestamp": datetime.now().isoformat(),
         "endpoints": {
             "metadata": "/api/metadata?url=YOUTUBE_URL",
+            "metadata_batch": "POST /api/metadata/batch",
+            "prefetch": "POST /prefetch",
+            "jobs": "POST /jobs",
+            "relay": "/relay/{video_id}?type=audio",
+            "metrics": "/metrics",
+            "traces": "/debug/traces",
             "home": "/",
             "status": "/status"
         },
         "performance": {
             "cache_size": len(DOWNLOAD_CACHE),
+            "cache_bytes": CACHE_STATS["bytes"],
+            "cache_reserved_bytes": CACHE_STATS["reserved"],
+            "cache_budget_bytes": cache_budget_bytes(),
+            "cache_evictions": CACHE_STATS["evictions"],
+            "metadata_cache_size": len(METADATA_CACHE),
+            "inflight_downloads": len(INFLIGHT_DOWNLOADS),
+            "running_jobs": sum(1 for job in DOWNLOAD_JOBS.values() if job["status"] == "running"),
+            "prefetch_pending": sum(1 for job in PREFETCH_JOBS.values() if job["status"] in ("queued", "running", "deferred")),
+            "relay_urls": len(RELAY_URLS),
+            "strategies": strategy_stats(),
+            "hedges": dict(ACTIVE_HEDGES),
+            "video_pipelines": dict(VIDEO_PIPELINE_STATS),
+            "extraction_backend": BACKEND.stats(),
+            "lanes": {name: lane.stats() for name, lane in LANES.items()},
+            "proxies": [state.stats() for state in PROXY_POOL.values()],
+            "running_processes": {
+                workload: sum(1 for p in RUNNING_PROCESSES.values() if p["workload"] == workload)
+                for workload in [*SUBPROCESS_LIMITS, "transcode"]
+            },
             "active_tokens": len(download_tokens),
             "cache_dir_size": sum(os.path.getsize(os.path.join(CACHE_DIR, f)) for f in os.listdir(CACHE_DIR) if os.path.isfile(os.path.join(CACHE_DIR, f))) / 1024 / 1024
         }
@@ -2080,19 +4967,11 @@ async def test_download(video_id: str):
     video_id = extract_video_id(video_id)
     
     # Quick availability check
-    cmd = [
-        "yt-dlp",
-        "--no-warnings",
-        "--skip-download",
-        "--get-title",
-        f"https://youtu.be/{video_id}"
-    ]
-    
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+        info = await extract_info(video_id, timeout=15)
+        title = (info.get("title") or "").strip()[:100]
         
-        if result.returncode == 0 and result.stdout.strip():
-            title = result.stdout.strip()[:100]
+        if title:
             return JSONResponse(content={
                 "video_id": video_id,
                 "status": "available",
@@ -2103,11 +4982,18 @@ async def test_download(video_id: str):
             return JSONResponse(content={
                 "video_id": video_id,
                 "status": "unavailable",
-                "error": result.stderr[:200] if result.stderr else "Unknown error",
+                "error": "Unknown error",
                 "timestamp": datetime.now().isoformat()
             }, status_code=404)
             
-    except subprocess.TimeoutExpired:
+    except yt_dlp.utils.DownloadError as e:
+        return JSONResponse(content={
+            "video_id": video_id,
+            "status": "unavailable",
+            "error": str(e)[:200],
+            "timestamp": datetime.now().isoformat()
+        }, status_code=404)
+    except asyncio.TimeoutError:
         return JSONResponse(content={
             "video_id": video_id,
             "status": "timeout",
@@ -2128,27 +5014,22 @@ def get_railway_port():
 
 # Cleanup tasks
 async def cleanup_cache():
-    """Clean old cache files"""
+    """Keep the cache inside its byte budget (covers disk filling up from other causes)"""
     while True:
-        await asyncio.sleep(1800)
+        await asyncio.sleep(60)
         try:
-            now = time.time()
-            cleaned = 0
-            for file in os.listdir(CACHE_DIR):
-                file_path = os.path.join(CACHE_DIR, file)
-                if os.path.isfile(file_path):
-                    if now - os.path.getmtime(file_path) > 21600:
-                        os.remove(file_path)
-                        cleaned += 1
-            
-            if cleaned > 0:
-                logger.info(f"🧹 Cleaned {cleaned} old cache files")
-                
+            flush_cache_access()
+            prune_info_cache()
+            prune_relay_urls()
+            pruned = await prune_metadata_rows()
+            if pruned:
+                logger.info(f"🗑️ Pruned {pruned} expired metadata rows")
+            enforce_cache_budget()
         except Exception as e:
             logger.error(f"Cache cleanup error: {e}")
 
 async def clean_expired_tokens():
-    """Clean expired tokens"""
+    """Clean expired tokens and finished jobs"""
     while True:
         await asyncio.sleep(300)
         now = datetime.now()
@@ -2157,22 +5038,43 @@ async def clean_expired_tokens():
             del download_tokens[token]
         if expired:
             logger.info(f"🗑️ Cleaned {len(expired)} expired tokens")
+            
+        finished = [j for j, job in DOWNLOAD_JOBS.items() if job["finished_at"] and time.time() - job["finished_at"] > JOB_TTL]
+        for job_id in finished:
+            del DOWNLOAD_JOBS[job_id]
 
 @app.on_event("startup")
 async def startup_event():
     """Startup tasks"""
+    init_cache_index()
     asyncio.create_task(clean_expired_tokens())
     asyncio.create_task(cleanup_cache())
+    if PROXY_POOL and BACKEND.online:
+        asyncio.create_task(probe_proxies())
+    prefetched = load_prefetch_list(PREFETCH_LIST_FILE)
+    if prefetched:
+        logger.info(f"🔥 Queued {prefetched} prefetch jobs from {PREFETCH_LIST_FILE}")
     
     # Log system status
     logger.info("🚀 Premium YouTube API Started - METADATA ONLY MODE")
     logger.info(f"📁 Cookies: {'✅ AVAILABLE' if HAS_COOKIES else '❌ NOT FOUND'}")
+    logger.info(f"🌐 Proxies: {len(PROXY_POOL)} in pool" if PROXY_POOL else "🌐 Proxies: disabled (direct connection)")
+    logger.info(f"🎞️ Extraction backend: {BACKEND.name}" + (f" ({FIXTURE_DIR})" if BACKEND.name != "live" else ""))
     logger.info(f"🔧 Port: {get_railway_port()}")
     logger.info("⚡ Frontend: Metadata fetch only (download endpoints hidden)")
     logger.info("🔧 Backend: All download functions still active")
     logger.info("📊 Added: Video metadata extraction endpoint")
     logger.info("✅ Live URLs Supported: https://www.youtube.com/live/VIDEO_ID")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Don't leave yt-dlp/aria2c/ffmpeg children running"""
+    await kill_running_processes()
+    if relay_session is not None:
+        await relay_session.close()
+    flush_cache_access()
+    await asyncio.to_thread(cache_db_writer.shutdown)
+
 if __name__ == "__main__":
     import uvicorn
     port = get_railway_port()
@@ -0,0 +1,44 @@
+"""Compare two bench/run.py results.
+
+    python bench/compare.py before.json after.json
+
+Prints throughput, p50/p95 latency and p95 time-to-first-byte per scenario
+with the relative change (negative latency change = faster).
+"""
+import json
+import sys
+from typing import Any, Dict, Optional
+
+METRICS = [
+    ("req/s", lambda s: s.get("throughput_rps")),
+    ("p50 ms", lambda s: s["latency_ms"]["p50"]),
+    ("p95 ms", lambda s: s["latency_ms"]["p95"]),
+    ("ttfb p95", lambda s: s["ttfb_ms"]["p95"]),
+    ("rss peak", lambda s: s["rss_mb"]["peak"]),
+    ("errors", lambda s: s.get("errors")),
+]
+
+def change(before: Optional[float], after: Optional[float]) -> str:
+    if before is None or after is None:
+        return ""
+    if not before:
+        return "" if before == after else "new"
+    return f"{(after - before) / before * 100:+.0f}%"
+
+def main(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before: Dict[str, Any] = json.load(f)
+    with open(after_path) as f:
+        after: Dict[str, Any] = json.load(f)
+        
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    for name in [n for n in after["scenarios"] if n in before["scenarios"]]:
+        print(name)
+        for label, get in METRICS:
+            old, new = get(before["scenarios"][name]), get(after["scenarios"][name])
+            print(f"  {label:<10}{str(old):>12}{str(new):>12}  {change(old, new)}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2])
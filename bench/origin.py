@@ -0,0 +1,99 @@
+"""Local media origin for the benchmark: serves fixture media with Range support.
+
+    python bench/origin.py --port 8766 [--audio-bytes N] [--video-bytes N] [--rate BYTES_PER_S] [--latency S]
+
+GET /media/audio.m4a and /media/video.mp4 (any query string is ignored, so
+per-video URLs stay unique without storing anything per video). The fixtures
+are deterministic filler bytes unless --audio-file/--video-file point at real
+media. --rate throttles each connection to mimic a CDN.
+"""
+import argparse
+import asyncio
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from aiohttp import web
+
+CHUNK_SIZE = 64 * 1024
+
+def make_fixture(size: int, seed: int) -> bytes:
+    """Deterministic filler bytes of the given size"""
+    block = bytes((i * 131 + seed) % 256 for i in range(4096))
+    return (block * (size // len(block) + 1))[:size]
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Single "bytes=a-b" range -> (start, end inclusive)"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header or "")
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if not match.group(1):
+        return max(size - int(match.group(2)), 0), size - 1
+    start = int(match.group(1))
+    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    return (start, end) if start <= end else None
+
+def create_app(fixtures: Dict[str, bytes], rate: float, latency: float) -> web.Application:
+    """aiohttp app serving the fixtures"""
+    
+    async def media(request: web.Request) -> web.StreamResponse:
+        data = fixtures.get(request.match_info["name"])
+        if data is None:
+            raise web.HTTPNotFound()
+        if latency:
+            await asyncio.sleep(latency)
+            
+        size = len(data)
+        byte_range = parse_range(request.headers.get("Range"), size)
+        start, end = byte_range or (0, size - 1)
+        response = web.StreamResponse(status=206 if byte_range else 200, headers={
+            "Content-Type": "audio/mp4" if request.match_info["name"].endswith(".m4a") else "video/mp4",
+            "Content-Length": str(end - start + 1),
+            "Accept-Ranges": "bytes",
+        })
+        if byte_range:
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        await response.prepare(request)
+        if request.method == "HEAD":
+            return response
+            
+        position = start
+        while position <= end:
+            chunk = data[position:min(position + CHUNK_SIZE, end + 1)]
+            await response.write(chunk)
+            position += len(chunk)
+            if rate:
+                await asyncio.sleep(len(chunk) / rate)
+        await response.write_eof()
+        return response
+        
+    app = web.Application()
+    app.router.add_get("/media/{name}", media)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--audio-bytes", type=int, default=4 * 1024 ** 2)
+    parser.add_argument("--video-bytes", type=int, default=24 * 1024 ** 2)
+    parser.add_argument("--audio-file", help="Serve this file as audio.m4a instead of filler bytes")
+    parser.add_argument("--video-file", help="Serve this file as video.mp4 instead of filler bytes")
+    parser.add_argument("--rate", type=float, default=0, help="Per-connection bytes/s, 0 = unthrottled")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds before the response starts")
+    args = parser.parse_args()
+    
+    def load(path: Optional[str], size: int, seed: int) -> bytes:
+        if path:
+            with open(path, "rb") as f:
+                return f.read()
+        return make_fixture(size, seed)
+        
+    fixtures = {
+        "audio.m4a": load(args.audio_file, args.audio_bytes, 1),
+        "video.mp4": load(args.video_file, args.video_bytes, 2),
+    }
+    print(f"origin on 127.0.0.1:{args.port} (pid {os.getpid()})", flush=True)
+    web.run_app(create_app(fixtures, args.rate, args.latency), host="127.0.0.1", port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Offline load benchmark for /api/metadata, /audio, /video and /stream.
+
+    python bench/run.py [--requests 50] [--concurrency 10] [--herd 50] [--output results.json]
+
+Starts the bench origin and an offline Api.py (bench/server.py, in a scratch
+cache directory), then runs each scenario and prints one JSON document:
+
+    *_cold  distinct video ids, nothing cached
+    *_warm  the same ids again, served from cache
+    *_herd  --herd concurrent clients asking for one uncached video
+
+Per scenario: request/error/status counts, throughput (requests/s and
+MB/s), latency and time-to-first-byte percentiles (p50/p95/p99/max) and the
+server's RSS. Compare two runs with bench/compare.py.
+
+With --fixtures DIR the server replays recordings made with
+EXTRACT_BACKEND=record instead of using the fake extractor and stub yt-dlp;
+ids without a recording are answered from the first one (REPLAY_FALLBACK_ID).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# name -> request path; cold and warm scenarios of a group use the same ids
+SCENARIOS = {
+    "metadata_cold": "/api/metadata?url={id}",
+    "metadata_warm": "/api/metadata?url={id}",
+    "metadata_herd": "/api/metadata?url={id}",
+    "audio_cold": "/audio/{id}",
+    "audio_warm": "/audio/{id}",
+    "audio_herd": "/audio/{id}",
+    "video_cold": "/video/{id}",
+    "video_warm": "/video/{id}",
+    "video_herd": "/video/{id}",
+    "stream_cold": "/stream/{id}?type=audio",
+    "stream_warm": "/stream/{id}?type=audio",
+    "stream_herd": "/stream/{id}?type=audio",
+}
+
+def video_ids(group: str, count: int) -> List[str]:
+    """Distinct, valid 11 character ids per scenario group"""
+    return [f"{group[:4]}{i:07d}" for i in range(count)]
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max in milliseconds (nearest rank)"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    rank = lambda p: ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+    return {name: round(rank(p) * 1000, 1) for name, p in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))}
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of a process (Linux /proc), None elsewhere"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+async def fetch(session: aiohttp.ClientSession, url: str) -> Dict[str, Any]:
+    """One request, timed to first body byte and to the end"""
+    started = time.perf_counter()
+    ttfb = None
+    size = 0
+    try:
+        async with session.get(url) as response:
+            async for chunk in response.content.iter_any():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                size += len(chunk)
+            status = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = type(e).__name__
+    return {"status": status, "latency": time.perf_counter() - started, "ttfb": ttfb, "bytes": size}
+
+async def run_scenario(base_url: str, path: str, ids: List[str], concurrency: int, server_pid: int, timeout: float) -> Dict[str, Any]:
+    """Fire one request per id with bounded concurrency and summarise"""
+    semaphore = asyncio.Semaphore(concurrency)
+    rss_samples = [rss_bytes(server_pid)]
+    done = asyncio.Event()
+    
+    async def sample_rss():
+        while not done.is_set():
+            rss_samples.append(rss_bytes(server_pid))
+            await asyncio.sleep(0.2)
+            
+    async def one(video_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await fetch(session, base_url + path.format(id=video_id))
+            
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        results = await asyncio.gather(*(one(v) for v in ids))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await sampler
+    rss_samples.append(rss_bytes(server_pid))
+    
+    ok = [r for r in results if r["status"] == 200 or r["status"] == 206]
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    total_bytes = sum(r["bytes"] for r in ok)
+    known_rss = [s for s in rss_samples if s is not None]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "status": statuses,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "throughput_mbps": round(total_bytes / elapsed / 1024 ** 2, 2) if elapsed else None,
+        "bytes": total_bytes,
+        "latency_ms": percentiles([r["latency"] for r in ok]),
+        "ttfb_ms": percentiles([r["ttfb"] for r in ok if r["ttfb"] is not None]),
+        "rss_mb": {
+            "start": round(known_rss[0] / 1024 ** 2, 1) if known_rss else None,
+            "peak": round(max(known_rss) / 1024 ** 2, 1) if known_rss else None,
+            "end": round(known_rss[-1] / 1024 ** 2, 1) if known_rss else None,
+        },
+    }
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    """Poll until the server answers or give up"""
+    deadline = time.time() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{process.args} exited with {process.returncode}")
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+    if args.fixtures:
+        recordings = sorted(n[:-len(".json")] for n in os.listdir(os.path.join(args.fixtures, "info")) if n.endswith(".json"))
+        if not recordings:
+            raise SystemExit(f"no recordings in {args.fixtures}/info")
+        env.update(EXTRACT_BACKEND="replay", FIXTURE_DIR=os.path.abspath(args.fixtures))
+        env.setdefault("REPLAY_FALLBACK_ID", recordings[0])
+    origin_url = f"http://127.0.0.1:{args.origin_port}"
+    base_url = f"http://127.0.0.1:{args.port}"
+    sizes = ["--audio-bytes", str(args.audio_bytes), "--video-bytes", str(args.video_bytes)]
+    log = open(os.path.join(workdir, "server.log"), "w")
+    origin = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "origin.py"), "--port", str(args.origin_port), "--rate", str(args.origin_rate)] + sizes,
+        stdout=log, stderr=subprocess.STDOUT, env=env
+    )
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "server.py"), "--port", str(args.port), "--origin", origin_url] + sizes,
+        stdout=log, stderr=subprocess.STDOUT, env=env, cwd=workdir
+    )
+    try:
+        await wait_ready(f"{origin_url}/media/audio.m4a", origin)
+        await wait_ready(f"{base_url}/status", server)
+        
+        scenarios = {}
+        for name in args.scenarios:
+            group, kind = name.rsplit("_", 1)
+            if kind == "herd":
+                ids = video_ids(f"h{group}", 1) * args.herd
+                concurrency = args.herd
+            else:
+                ids = video_ids(group, args.requests)
+                concurrency = args.concurrency
+            scenarios[name] = await run_scenario(base_url, SCENARIOS[name], ids, concurrency, server.pid, args.timeout)
+            print(f"{name}: {scenarios[name]['throughput_rps']} req/s, p95 {scenarios[name]['latency_ms']['p95']} ms, "
+                  f"{scenarios[name]['errors']} errors", file=sys.stderr)
+    finally:
+        for process in (server, origin):
+            process.terminate()
+        for process in (server, origin):
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log.close()
+        if args.keep:
+            print(f"scratch dir kept: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+            
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "herd": args.herd,
+            "audio_bytes": args.audio_bytes,
+            "video_bytes": args.video_bytes,
+            "origin_rate": args.origin_rate,
+            "fixtures": args.fixtures,
+            "env": {k: v for k, v in os.environ.items() if k.startswith(("BENCH_", "REPLAY_"))},
+        },
+        "scenarios": scenarios,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50, help="Distinct videos per cold/warm scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--herd", type=int, default=50, help="Concurrent clients in the herd scenarios")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS), metavar="NAME")
+    parser.add_argument("--audio-bytes", type=int, default=4 * 1024 ** 2)
+    parser.add_argument("--video-bytes", type=int, default=24 * 1024 ** 2)
+    parser.add_argument("--origin-rate", type=float, default=0, help="Origin bytes/s per connection, 0 = unthrottled")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--origin-port", type=int, default=8766)
+    parser.add_argument("--fixtures", help="Replay recordings from this fixture dir (EXTRACT_BACKEND=replay)")
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch dir (cache + server.log)")
+    args = parser.parse_args()
+    
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
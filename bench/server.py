@@ -0,0 +1,85 @@
+"""Run Api.py offline for the benchmark.
+
+    python bench/server.py --port 8767 --origin http://127.0.0.1:8766
+
+By default extraction goes through a fake backend that builds info dicts
+pointing at the bench origin (one m4a audio format, one progressive H.264/AAC
+MP4), and downloads go through bench/stub_ytdlp.py via YTDLP_COMMAND. With
+EXTRACT_BACKEND=replay the server's own replay backend answers from recorded
+fixtures instead. Run from a scratch directory: the cache lives under the
+working directory. Knobs for the fake backend:
+
+    BENCH_EXTRACT_LATENCY    seconds per extraction
+    BENCH_EXTRACT_FAIL_RATE  probability an extraction raises DownloadError
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+from typing import Any, Dict, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+def fake_info(video_id: str, origin: str, audio_bytes: int, video_bytes: int) -> Dict[str, Any]:
+    """A YouTube-shaped info dict whose media lives on the bench origin"""
+    return {
+        "id": video_id,
+        "title": f"Bench video {video_id}",
+        "duration": 212,
+        "duration_string": "3:32",
+        "uploader": "bench",
+        "view_count": 1000,
+        "like_count": 10,
+        "thumbnail": f"{origin}/thumb/{video_id}.jpg",
+        "description": "Synthetic video for offline benchmarks",
+        "categories": ["Music"],
+        "tags": ["bench"],
+        "upload_date": "20240101",
+        "extractor": "youtube",
+        "extractor_key": "Youtube",
+        "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        "formats": [
+            {"format_id": "140", "ext": "m4a", "protocol": "https", "acodec": "mp4a.40.2", "vcodec": "none",
+             "abr": 129, "filesize": audio_bytes, "url": f"{origin}/media/audio.m4a?v={video_id}"},
+            {"format_id": "18", "ext": "mp4", "protocol": "https", "acodec": "mp4a.40.2", "vcodec": "avc1.42001E",
+             "height": 360, "tbr": 600, "filesize": video_bytes, "url": f"{origin}/media/video.mp4?v={video_id}"},
+        ],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--origin", default="http://127.0.0.1:8766")
+    parser.add_argument("--audio-bytes", type=int, default=4 * 1024 ** 2)
+    parser.add_argument("--video-bytes", type=int, default=24 * 1024 ** 2)
+    args = parser.parse_args()
+    
+    os.environ.setdefault("YTDLP_COMMAND", f"{sys.executable} {os.path.join(BENCH_DIR, 'stub_ytdlp.py')}")
+    os.environ.setdefault("USE_PROXIES", "0")
+    
+    import uvicorn
+    import yt_dlp
+    import Api
+    
+    latency = float(os.getenv("BENCH_EXTRACT_LATENCY", "0.5"))
+    fail_rate = float(os.getenv("BENCH_EXTRACT_FAIL_RATE", "0"))
+    
+    class BenchBackend(Api.LiveBackend):
+        """Fake extraction against the bench origin; downloads run the stub yt-dlp"""
+        
+        name = "bench"
+        
+        async def extract(self, video_id: str, timeout: float, proxy: Optional[str]) -> Dict[str, Any]:
+            await asyncio.sleep(latency)
+            if random.random() < fail_rate:
+                raise yt_dlp.utils.DownloadError(f"ERROR: [youtube] {video_id}: Video unavailable")
+            return fake_info(video_id, args.origin, args.audio_bytes, args.video_bytes)
+            
+    if Api.BACKEND.name == "live":
+        Api.BACKEND = BenchBackend()
+    uvicorn.run(Api.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Stand-in for the yt-dlp CLI, used as YTDLP_COMMAND by the benchmark.
+
+Understands what Api.py passes its download children: --load-info-json, -f
+(format ids, "a+b" merges, "x/y" fallbacks and best/bestaudio/bestvideo
+selectors), -o, --no-part, --fixup, the postprocessor flags and the progress
+template. Media is fetched from the URLs in the info dict (the bench origin),
+so aria2c/--downloader flags are accepted and ignored. Behaviour knobs, read
+from the environment:
+
+    BENCH_YTDLP_LATENCY      seconds of start-up before downloading (yt-dlp's import + setup)
+    BENCH_YTDLP_FAIL_RATE    probability of exiting 1 with a generic error
+    BENCH_YTDLP_429_RATE     probability of exiting 1 with an HTTP 429
+    BENCH_YTDLP_POSTPROCESS  seconds each postprocessor (merge/extract/recode/fixup) takes
+    BENCH_YTDLP_FIXUP        "detect" (default): like yt-dlp, rewrite m4a_dash downloads into a
+                             new file (new inode) unless --fixup never; "always": do it regardless
+"""
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+CHUNK_SIZE = 256 * 1024
+
+def option(argv: List[str], name: str) -> Optional[str]:
+    """Value following the last occurrence of a flag"""
+    values = [argv[i + 1] for i, arg in enumerate(argv[:-1]) if arg == name]
+    return values[-1] if values else None
+
+def is_audio_only(f: Dict[str, Any]) -> bool:
+    return f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")
+
+def is_video_only(f: Dict[str, Any]) -> bool:
+    return f.get("acodec") == "none" and f.get("vcodec") not in (None, "none")
+
+def select(formats: List[Dict[str, Any]], selector: str) -> Optional[List[Dict[str, Any]]]:
+    """Resolve a (simplified) yt-dlp format selector to the formats to download"""
+    for alternative in selector.split("/"):
+        chosen = []
+        for part in alternative.split("+"):
+            name, _, condition = part.partition("[")
+            candidates = {
+                "bestaudio": [f for f in formats if is_audio_only(f)],
+                "bestvideo": [f for f in formats if is_video_only(f)],
+                "best": [f for f in formats if not is_audio_only(f) and not is_video_only(f)],
+            }.get(name, [f for f in formats if str(f.get("format_id")) == name])
+            if condition.startswith("ext="):
+                candidates = [f for f in candidates if f.get("ext") == condition[4:].rstrip("]")]
+            elif condition.startswith("height<="):
+                candidates = [f for f in candidates if (f.get("height") or 0) <= int(condition[8:].rstrip("]"))]
+            if not candidates:
+                break
+            chosen.append(max(candidates, key=lambda f: (f.get("height") or 0, f.get("tbr") or 0)))
+        else:
+            return chosen
+    return None
+
+def fetch(url: str, out, downloaded: int, total: int, started: float) -> int:
+    """Append one URL to an open file, printing yt-dlp style progress lines"""
+    with urllib.request.urlopen(url, timeout=30) as response:
+        while chunk := response.read(CHUNK_SIZE):
+            out.write(chunk)
+            out.flush()
+            downloaded += len(chunk)
+            elapsed = max(time.time() - started, 1e-6)
+            speed = downloaded / elapsed
+            print(f"[progress] {downloaded} {total or 'NA'} NA {speed:.0f} {int((total - downloaded) / speed) if total else 'NA'}", flush=True)
+    return downloaded
+
+def postprocess(name: str, seconds: float):
+    print(f"[postprocess] started {name}", flush=True)
+    time.sleep(seconds)
+    print(f"[postprocess] finished {name}", flush=True)
+
+def main(argv: List[str]) -> int:
+    time.sleep(float(os.getenv("BENCH_YTDLP_LATENCY", "0.3")))
+    if random.random() < float(os.getenv("BENCH_YTDLP_429_RATE", "0")):
+        print("ERROR: [youtube] stub: Unable to download webpage: HTTP Error 429: Too Many Requests", file=sys.stderr)
+        return 1
+    if random.random() < float(os.getenv("BENCH_YTDLP_FAIL_RATE", "0")):
+        print("ERROR: [youtube] stub: Requested format is not available", file=sys.stderr)
+        return 1
+        
+    info_path, selector, output = option(argv, "--load-info-json"), option(argv, "-f") or "best", option(argv, "-o")
+    if not info_path or not output:
+        print("ERROR: stub yt-dlp needs --load-info-json and -o", file=sys.stderr)
+        return 2
+    with open(info_path) as f:
+        info = json.load(f)
+        
+    formats = select(info.get("formats") or [], selector)
+    if not formats:
+        print(f"ERROR: [youtube] {info.get('id')}: Requested format is not available", file=sys.stderr)
+        return 1
+    output = output.replace("%(ext)s", formats[0].get("ext") or "mp4").replace("%(id)s", info.get("id", ""))
+    target = output if "--no-part" in argv else output + ".part"
+    
+    total = sum(f.get("filesize") or 0 for f in formats)
+    started = time.time()
+    downloaded = 0
+    try:
+        with open(target, "wb") as out:
+            for f in formats:
+                downloaded = fetch(f["url"], out, downloaded, total, started)
+    except OSError as e:
+        print(f"ERROR: unable to download video data: {e}", file=sys.stderr)
+        return 1
+    if target != output:
+        os.replace(target, output)
+        
+    postprocess_seconds = float(os.getenv("BENCH_YTDLP_POSTPROCESS", "0.2"))
+    fixup = os.getenv("BENCH_YTDLP_FIXUP", "detect")
+    dash = len(formats) == 1 and formats[0].get("container") == "m4a_dash" and option(argv, "--fixup") != "never"
+    if fixup == "always" or (fixup == "detect" and dash):
+        # FFmpegFixupM4aPP: remux into a temporary file, then os.replace it over the output
+        postprocess("FixupM4a", postprocess_seconds)
+        fixed = output + ".temp"
+        with open(output, "rb") as src, open(fixed, "wb") as dst:
+            dst.write(src.read())
+        os.replace(fixed, output)
+    if len(formats) > 1:
+        postprocess("Merger", postprocess_seconds)
+    if "--extract-audio" in argv:
+        postprocess("ExtractAudio", postprocess_seconds)
+    if "--recode-video" in argv:
+        postprocess("VideoConvertor", postprocess_seconds)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
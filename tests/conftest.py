@@ -0,0 +1,184 @@
+"""Shared fixtures: Api.py imported offline, in a scratch working directory.
+
+Extraction answers with bench/server.py's info dicts pointing at an
+in-process bench origin, and downloads run bench/stub_ytdlp.py through
+YTDLP_COMMAND, so nothing here touches the network. Everything async runs
+on one event loop for the whole session, like the server itself.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.join(REPO_DIR, "tests")
+WORK_DIR = tempfile.mkdtemp(prefix="ytapi-tests-")
+
+# Api.py creates its cache under the working directory and reads its
+# configuration at import time
+os.chdir(WORK_DIR)
+os.environ.update({
+    "USE_PROXIES": "0",
+    "YTDLP_COMMAND": f"{sys.executable} {os.path.join(REPO_DIR, 'bench', 'stub_ytdlp.py')}",
+    "FFMPEG_COMMAND": f"{sys.executable} {os.path.join(TESTS_DIR, 'fake_ffmpeg.py')}",
+    "BENCH_YTDLP_LATENCY": "0",
+    "BENCH_YTDLP_POSTPROCESS": "0",
+})
+sys.path.insert(0, REPO_DIR)
+
+from aiohttp import web  # noqa: E402
+
+import Api  # noqa: E402
+from bench.origin import create_app, make_fixture  # noqa: E402
+from bench.server import fake_info  # noqa: E402
+
+AUDIO_BYTES = 1024 * 1024
+VIDEO_BYTES = 2 * 1024 * 1024
+SLOW_RATE = 512 * 1024  # bytes/s: a 1 MiB download takes about two seconds
+FIXTURES = {"audio.m4a": make_fixture(AUDIO_BYTES, 1), "video.mp4": make_fixture(VIDEO_BYTES, 2)}
+
+class FakeBackend(Api.LiveBackend):
+    """Extraction answered from fake info dicts; downloads run the stub yt-dlp"""
+    
+    name = "test"
+    
+    def __init__(self, origin: str):
+        self.origin = origin
+        self.latency = 0.0
+        self.extractions = 0
+        self.audio_container: Optional[str] = None  # e.g. "m4a_dash", like YouTube's itag 140
+        
+    async def extract(self, video_id: str, timeout: float, proxy: Optional[str]) -> Dict[str, Any]:
+        self.extractions += 1
+        await asyncio.sleep(self.latency)
+        info = fake_info(video_id, self.origin, AUDIO_BYTES, VIDEO_BYTES)
+        if self.audio_container:
+            info["formats"][0]["container"] = self.audio_container
+        return info
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    pending = [t for t in asyncio.all_tasks(loop) if not t.done()]
+    for task in pending:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    if Api.relay_session is not None:
+        loop.run_until_complete(Api.relay_session.close())
+    loop.close()
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def run(loop):
+    """Run a coroutine to completion on the session loop"""
+    return loop.run_until_complete
+
+@pytest.fixture(scope="session")
+def origins(loop, run) -> Dict[str, str]:
+    """Bench origins on ephemeral ports: "fast" (unthrottled) and "slow" (SLOW_RATE)"""
+    runners = []
+    urls = {}
+    for name, rate in (("fast", 0), ("slow", SLOW_RATE)):
+        runner = web.AppRunner(create_app(FIXTURES, rate, 0))
+        run(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        run(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        urls[name] = f"http://127.0.0.1:{port}"
+        runners.append(runner)
+    Api.init_cache_index()
+    yield urls
+    for runner in runners:
+        run(runner.cleanup())
+
+@pytest.fixture(autouse=True)
+def backend(origins, run, monkeypatch):
+    """A fresh fake backend per test; in-flight downloads are drained afterwards.
+    Strategy order starts from the priors every time, without exploration."""
+    monkeypatch.setattr(Api, "STRATEGY_STATS", {})
+    monkeypatch.setattr(Api, "STRATEGY_EXPLORE", 0)
+    previous = Api.BACKEND
+    Api.BACKEND = FakeBackend(origins["fast"])
+    yield Api.BACKEND
+    
+    async def drain():
+        tasks = list(Api.INFLIGHT_DOWNLOADS.values())
+        if tasks:
+            await asyncio.wait(tasks, timeout=30)
+        await asyncio.sleep(0)
+        
+    run(drain())
+    Api.BACKEND = previous
+
+@pytest.fixture
+def video_id() -> str:
+    """A video id no other test uses"""
+    return uuid.uuid4().hex[:11]
+
+class ClientGone(OSError):
+    """Raised by the test client's send() to simulate a dropped connection"""
+
+async def asgi_get(path: str, headers: Optional[Dict[str, str]] = None, fail_on_start: bool = False,
+                   client: str = "127.0.0.1") -> Tuple[Optional[int], Dict[str, str], bytes]:
+    """GET through the ASGI app. With fail_on_start the client vanishes as the
+    response starts, before a single body byte is produced."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": (client, 50000),
+        "server": ("testserver", 80),
+    }
+    requested = False
+    gone = asyncio.Event()
+    status = None
+    response_headers: Dict[str, str] = {}
+    body: List[bytes] = []
+    
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+        
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            if fail_on_start:
+                gone.set()
+                raise ClientGone("client went away")
+            status = message["status"]
+            response_headers.update((k.decode(), v.decode()) for k, v in message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+            
+    try:
+        await Api.app(scope, receive, send)
+    except Exception:
+        # The error middleware re-raises (possibly wrapped in an ExceptionGroup)
+        if not fail_on_start:
+            raise
+    finally:
+        gone.set()
+    return status, response_headers, b"".join(body)
+
+@pytest.fixture
+def http():
+    return asgi_get
@@ -0,0 +1,31 @@
+"""Stand-in for ffmpeg (FFMPEG_COMMAND in the tests).
+
+Copies the -i input to the output (the last argument; pipe:1 is stdout),
+prefixed with FAKE_FFMPEG_HEADER so tests can tell remuxed/transcoded
+output from the source. Output is written in chunks with FAKE_FFMPEG_DELAY
+seconds between them, so a "transcode" can be caught in progress.
+"""
+import os
+import sys
+import time
+
+HEADER = b"FAKEFFMPEG"
+CHUNK_SIZE = 64 * 1024
+
+def main(argv):
+    source = argv[argv.index("-i") + 1]
+    target = argv[-1]
+    delay = float(os.getenv("FAKE_FFMPEG_DELAY", "0"))
+    with open(source, "rb") as src:
+        data = HEADER + src.read()
+    out = sys.stdout.buffer if target == "pipe:1" else open(target, "wb")
+    for i in range(0, len(data), CHUNK_SIZE):
+        out.write(data[i:i + CHUNK_SIZE])
+        out.flush()
+        time.sleep(delay)
+    if out is not sys.stdout.buffer:
+        out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,79 @@
+import collections
+import os
+import time
+import uuid
+
+import pytest
+
+import Api
+
+@pytest.fixture
+def empty_cache():
+    for key in list(Api.DOWNLOAD_CACHE):
+        Api.cache_drop(key)
+    yield
+    for key in list(Api.DOWNLOAD_CACHE):
+        Api.cache_drop(key)
+
+def store(size: int) -> str:
+    video_id = uuid.uuid4().hex[:11]
+    path = os.path.join(Api.CACHE_DIR, f"{video_id}.audio.test{Api.WORK_FILE_MARKER}m4a")
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    Api.cache_store(video_id, "audio", path, "test")
+    return Api.cache_key_for(video_id, "audio")
+
+def test_reservation_makes_room_before_the_download(empty_cache, monkeypatch):
+    monkeypatch.setattr(Api, "CACHE_MAX_BYTES", 100_000)
+    older, newer = store(40_000), store(40_000)
+    
+    with Api.cache_reservation(30_000):
+        assert Api.CACHE_STATS["reserved"] == 30_000
+        assert older not in Api.DOWNLOAD_CACHE
+        assert newer in Api.DOWNLOAD_CACHE
+    assert Api.CACHE_STATS["reserved"] == 0
+
+def test_old_hits_decay(empty_cache, monkeypatch):
+    monkeypatch.setattr(Api, "CACHE_MAX_BYTES", 100_000)
+    once_popular, recent = store(40_000), store(40_000)
+    now = time.time()
+    Api.DOWNLOAD_CACHE[once_popular].update(hits=10, last_access=now - 5 * Api.CACHE_HIT_HALF_LIFE)
+    Api.DOWNLOAD_CACHE[recent].update(hits=1, last_access=now)
+    
+    assert Api._pick_eviction_victim(None) == once_popular
+    
+def test_expected_download_size():
+    info = {"duration": 100, "formats": [{"format_id": "140", "filesize": 1000}, {"format_id": "137", "filesize_approx": 5000}, {"format_id": "18"}]}
+    assert Api.expected_download_size(info, "137+140/18", "video") == 6000
+    assert Api.expected_download_size(info, "18/140", "audio") == 1000
+    assert Api.expected_download_size(info, "bestaudio", "audio") == 100 * Api.EXPECTED_BYTES_PER_SECOND["audio"]
+
+def test_video_download_timeout_scales_with_the_file(monkeypatch):
+    monkeypatch.setattr(Api, "VIDEO_MIN_RATE", 1000)
+    monkeypatch.setattr(Api, "VIDEO_MAX_TIMEOUT", 1000)
+    info = {"duration": 600, "formats": [{"format_id": "137", "filesize": 300_000}, {"format_id": "140", "filesize": 20_000}]}
+    assert Api.video_download_timeout(info, "137+140", "remux") == 90 + 320
+    assert Api.video_download_timeout(info, "best", "transcode") == 1000  # 180 + duration-based size + re-encode, capped
+
+def test_cache_hits_are_written_to_the_index_in_batches(empty_cache):
+    key = store(1000)
+    path = Api.cache_lookup(*key.split(".")[:2])
+    assert path and key in Api.CACHE_ACCESS_DIRTY
+    
+    assert Api.flush_cache_access() == 1
+    Api.cache_db_writer.submit(lambda: None).result()  # the writer thread has caught up
+    rows = Api._cache_db_execute("SELECT hits, last_access FROM media WHERE key = ?", (key,))
+    assert rows == [(Api.DOWNLOAD_CACHE[key]["hits"], Api.DOWNLOAD_CACHE[key]["last_access"])]
+    assert not Api.CACHE_ACCESS_DIRTY
+
+def test_bytes_a_download_already_wrote_are_not_counted_twice(empty_cache, monkeypatch, tmp_path):
+    monkeypatch.setattr(Api, "CACHE_MAX_BYTES", 10 ** 12)
+    monkeypatch.setattr(Api, "CACHE_MIN_FREE_BYTES", 0)
+    disk = {"free": 100_000}
+    monkeypatch.setattr(Api.shutil, "disk_usage", lambda path: collections.namedtuple("usage", "total used free")(0, 0, disk["free"]))
+    output = tmp_path / "download.m4a"
+    
+    with Api.cache_reservation(80_000, str(output)):
+        (tmp_path / "download.m4a.part").write_bytes(b"\0" * 60_000)
+        disk["free"] -= 60_000
+        assert Api.cache_budget_bytes() == 100_000
@@ -0,0 +1,80 @@
+import asyncio
+import concurrent.futures
+import threading
+import uuid
+
+import pytest
+import yt_dlp
+
+import Api
+
+def test_pooled_youtubedl_raises_instead_of_returning_none():
+    profile, ydl = Api._acquire_ydl(None)
+    try:
+        assert ydl.params["ignoreerrors"] is False
+        with pytest.raises(yt_dlp.utils.DownloadError):
+            ydl.extract_info("not a url", download=False)
+    finally:
+        Api._release_ydl(profile, ydl)
+
+def test_failed_extraction_is_not_cached(run, backend, video_id):
+    async def failing(video_id, timeout, proxy):
+        raise yt_dlp.utils.DownloadError(f"ERROR: [youtube] {video_id}: Video unavailable")
+        
+    backend.extract = failing
+    with pytest.raises(yt_dlp.utils.DownloadError):
+        run(Api.get_video_info_entry(video_id))
+    assert video_id not in Api.INFO_CACHE
+
+def test_info_entry_is_cached(run, backend, video_id):
+    first = run(Api.get_video_info_entry(video_id))
+    second = run(Api.get_video_info_entry(video_id))
+    assert first is second
+    assert backend.extractions == 1
+
+def test_concurrent_misses_share_one_extraction(run, backend, video_id):
+    backend.latency = 0.2
+    
+    async def herd():
+        return await asyncio.gather(*(Api.get_video_info_entry(video_id) for _ in range(10)))
+        
+    entries = run(herd())
+    assert all(entry is entries[0] for entry in entries)
+    assert backend.extractions == 1
+    assert video_id not in Api.INFO_FLIGHTS
+
+def test_info_cache_is_bounded_and_swept(run, monkeypatch):
+    monkeypatch.setattr(Api, "INFO_CACHE_MAX_ENTRIES", 2)
+    ids = [uuid.uuid4().hex[:11] for _ in range(3)]
+    for video_id in ids:
+        run(Api.get_video_info_entry(video_id))
+    assert ids[0] not in Api.INFO_CACHE and ids[1] in Api.INFO_CACHE and ids[2] in Api.INFO_CACHE
+    
+    Api.INFO_CACHE[ids[1]]["timestamp"] -= Api.INFO_CACHE_TTL
+    assert Api.prune_info_cache() == 1
+    assert ids[1] not in Api.INFO_CACHE and ids[2] in Api.INFO_CACHE
+
+def test_extract_queue_depth_counts_jobs_waiting_for_a_thread(run, monkeypatch):
+    gate = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(Api, "extract_executor", executor)
+    monkeypatch.setattr(Api, "_extract_info_sync", lambda video_id, proxy: gate.wait(5) and {"id": video_id})
+    
+    async def scenario():
+        jobs = [asyncio.ensure_future(Api.LiveBackend().extract(f"video{i}", 10, None)) for i in range(3)]
+        await asyncio.sleep(0.2)
+        assert Api.EXTRACT_QUEUE["waiting"] == 2
+        
+        jobs[2].cancel()  # abandoned while still queued
+        await asyncio.gather(jobs[2], return_exceptions=True)
+        assert Api.EXTRACT_QUEUE["waiting"] == 1
+        
+        gate.set()
+        await asyncio.gather(*jobs[:2])
+        assert Api.EXTRACT_QUEUE["waiting"] == 0
+        
+    try:
+        run(scenario())
+    finally:
+        gate.set()
+        executor.shutdown()
@@ -0,0 +1,54 @@
+import asyncio
+import os
+
+import Api
+from conftest import FIXTURES
+
+def test_concurrent_requests_join_one_flight(run, backend, video_id):
+    async def herd():
+        tasks = [Api.start_download(video_id, "audio") for _ in range(5)]
+        assert all(task is tasks[0] for task in tasks)
+        return await asyncio.gather(*(Api.await_download(video_id, "audio", task) for task in tasks))
+        
+    paths = run(herd())
+    assert len(set(paths)) == 1 and os.path.exists(paths[0])
+    assert backend.extractions == 1
+    assert (video_id, "audio") not in Api.INFLIGHT_DOWNLOADS
+    assert (video_id, "audio") not in Api.FLIGHT_WAITERS
+
+def test_cancelled_flight_is_not_joined(run, backend, origins, video_id):
+    backend.origin = origins["slow"]
+    flight_key = (video_id, "audio")
+    
+    async def scenario():
+        first = Api.start_download(video_id, "audio")
+        Api.acquire_flight(flight_key)
+        await asyncio.sleep(0.5)  # the yt-dlp child is downloading
+        Api.release_flight(flight_key, first)  # last waiter gone: cancel
+        
+        # Asked again while the first flight is still shutting down
+        assert not first.done()
+        second = Api.start_download(video_id, "audio")
+        assert second is not first
+        path = await Api.await_download(video_id, "audio", second)
+        return first, path
+        
+    first, path = run(scenario())
+    assert first.cancelled()
+    with open(path, "rb") as f:
+        assert f.read() == FIXTURES["audio.m4a"]
+    assert flight_key not in Api.INFLIGHT_DOWNLOADS and flight_key not in Api.CANCELLED_FLIGHTS
+
+def test_progressive_client_gone_before_first_byte_releases_the_flight(run, http, backend, origins, video_id):
+    backend.origin = origins["slow"]
+    flight_key = (video_id, "audio")
+    
+    run(http(f"/audio/{video_id}", fail_on_start=True))
+    
+    assert flight_key not in Api.FLIGHT_WAITERS
+    # Nobody is left for the download, so it was abandoned
+    assert flight_key not in Api.INFLIGHT_DOWNLOADS
+    task = Api.CANCELLED_FLIGHTS.get(flight_key)
+    if task:
+        run(asyncio.wait([task], timeout=10))
+        assert task.cancelled()
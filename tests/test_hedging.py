@@ -0,0 +1,20 @@
+import Api
+
+def test_no_hedge_while_extracting(run, backend, video_id, monkeypatch):
+    monkeypatch.setattr(Api, "HEDGE_DEFAULT_DELAY", 0.2)
+    monkeypatch.setattr(Api, "HEDGE_POLL_SECONDS", 0.2)
+    backend.latency = 1.5
+    started = Api.ACTIVE_HEDGES["started"]
+    
+    assert run(Api.run_download_strategies(video_id, "audio"))
+    assert Api.ACTIVE_HEDGES["started"] == started
+
+def test_stalled_download_is_hedged_and_the_hedge_released(run, video_id, monkeypatch):
+    monkeypatch.setattr(Api, "HEDGE_DEFAULT_DELAY", 0.2)
+    monkeypatch.setattr(Api, "HEDGE_POLL_SECONDS", 0.2)
+    monkeypatch.setenv("BENCH_YTDLP_LATENCY", "1.5")  # the child sits silent before downloading
+    started, count = Api.ACTIVE_HEDGES["started"], Api.ACTIVE_HEDGES["count"]
+    
+    assert run(Api.run_download_strategies(video_id, "audio"))
+    assert Api.ACTIVE_HEDGES["started"] == started + 1
+    assert Api.ACTIVE_HEDGES["count"] == count
@@ -0,0 +1,35 @@
+import time
+
+import yt_dlp
+
+import Api
+
+def test_metadata_survives_memory_eviction_and_old_rows_are_pruned(run, video_id):
+    metadata, cache = run(Api.get_video_metadata_cached(video_id))
+    assert cache == "MISS" and metadata["status"] == "available"
+    
+    # Gone from memory: answered from the SQLite copy
+    Api.METADATA_CACHE.pop(video_id)
+    assert run(Api.get_video_metadata_cached(video_id)) == (metadata, "HIT")
+    
+    old = time.time() - Api.METADATA_TTL - Api.METADATA_STALE_TTL - 60
+    run(Api._metadata_remember(video_id, metadata, old))
+    assert run(Api.prune_metadata_rows()) >= 1
+    Api.METADATA_CACHE.pop(video_id)
+    assert run(Api._metadata_lookup(video_id)) is None
+
+def test_only_unavailable_videos_are_negatively_cached(run, backend, video_id):
+    error = {"message": "ERROR: [youtube] x: HTTP Error 429: Too Many Requests"}
+    
+    async def failing(video_id, timeout, proxy):
+        raise yt_dlp.utils.DownloadError(error["message"])
+        
+    backend.extract = failing
+    metadata, _ = run(Api.get_video_metadata_cached(video_id))
+    assert metadata["status"] == "error" and metadata["reason"] == "rate_limited"
+    assert video_id not in Api.METADATA_CACHE
+    
+    error["message"] = f"ERROR: [youtube] {video_id}: Video unavailable"
+    metadata, _ = run(Api.get_video_metadata_cached(video_id))
+    assert metadata["status"] == "unavailable"
+    assert run(Api.get_video_metadata_cached(video_id)) == (metadata, "HIT")
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import Api
+from conftest import FIXTURES
+
+async def flight_finished(video_id: str, media_type: str = "audio"):
+    """Readers can finish before the flight has fixed up and cached the file"""
+    task = Api.INFLIGHT_DOWNLOADS.get((video_id, media_type))
+    if task:
+        await asyncio.wait([task], timeout=30)
+
+@pytest.fixture
+def slow_origin(backend, origins):
+    backend.origin = origins["slow"]
+
+def test_reader_survives_the_file_being_replaced_when_the_download_finishes(run, http, video_id, slow_origin, monkeypatch):
+    # The stub rewrites its output through a new inode once done, as yt-dlp's fixups do
+    monkeypatch.setenv("BENCH_YTDLP_FIXUP", "always")
+    
+    status, headers, body = run(http(f"/audio/{video_id}"))
+    
+    assert status == 200
+    assert headers["accept-ranges"] == "none"  # streamed while downloading
+    assert body == FIXTURES["audio.m4a"]
+    run(flight_finished(video_id))
+    assert Api.cache_lookup(video_id, "audio")
+
+def test_dash_m4a_is_streamed_raw_and_cached_fixed_up(run, http, backend, video_id, slow_origin):
+    backend.audio_container = "m4a_dash"
+    
+    status, headers, body = run(http(f"/audio/{video_id}"))
+    
+    assert status == 200
+    assert headers["accept-ranges"] == "none"
+    assert body == FIXTURES["audio.m4a"]
+    # The cached copy went through (fake) ffmpeg's remux
+    run(flight_finished(video_id))
+    with open(Api.cache_lookup(video_id, "audio"), "rb") as f:
+        assert f.read() == b"FAKEFFMPEG" + FIXTURES["audio.m4a"]
+
+def test_tail_reader_drains_the_rest_once_complete(run, video_id, tmp_path):
+    path = tmp_path / "growing.m4a"
+    path.write_bytes(b"a" * 10)
+    key = (video_id, "audio")
+    growing = {"path": str(path), "complete": False}
+    
+    async def scenario():
+        reader = Api.tail_follow_generator(key, growing)
+        assert await reader.__anext__() == b"a" * 10
+        with open(path, "ab") as f:
+            f.write(b"b" * 20)
+        growing["complete"] = True
+        return b"".join([chunk async for chunk in reader])
+        
+    assert run(scenario()) == b"b" * 20
+
+def test_tail_reader_stops_when_its_download_is_abandoned(run, video_id, tmp_path):
+    path = tmp_path / "growing.m4a"
+    path.write_bytes(b"a" * 10)
+    key = (video_id, "audio")
+    growing = {"path": str(path), "complete": False}
+    Api.GROWING_FILES[key] = growing
+    
+    async def scenario():
+        reader = Api.tail_follow_generator(key, growing)
+        assert await reader.__anext__() == b"a" * 10
+        Api.GROWING_FILES.pop(key)  # the strategy gave up; its flight may go on with another one
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(reader.__anext__(), 2)
+            
+    run(scenario())
@@ -0,0 +1,46 @@
+import os
+
+import Api
+from conftest import FIXTURES
+
+class SpySession:
+    """The relay session, remembering every upstream response it opened"""
+    
+    def __init__(self, session):
+        self.session = session
+        self.responses = []
+        
+    async def get(self, *args, **kwargs):
+        response = await self.session.get(*args, **kwargs)
+        self.responses.append(response)
+        return response
+
+def test_relay_tee_gets_its_own_cache_entry(run, http, video_id):
+    status, _, body = run(http(f"/relay/{video_id}?cache=true"))
+    
+    assert status == 200 and body == FIXTURES["audio.m4a"]
+    assert Api.cache_lookup(video_id, "audio") is None
+    with open(Api.cache_lookup(video_id, "audio", Api.RELAY_CACHE_FORMAT), "rb") as f:
+        assert f.read() == body
+
+def test_disconnect_before_first_byte_releases_upstream(run, http, video_id, monkeypatch):
+    spy = SpySession(Api.get_relay_session())
+    monkeypatch.setattr(Api, "get_relay_session", lambda: spy)
+    
+    run(http(f"/relay/{video_id}?cache=true", fail_on_start=True))
+    
+    assert len(spy.responses) == 1
+    assert spy.responses[0].closed and spy.responses[0].connection is None
+    assert video_id not in Api.RELAY_TEES
+    assert not [f for f in os.listdir(Api.CACHE_DIR) if f.startswith(video_id)]
+
+def test_expired_relay_urls_are_pruned(run, http, video_id):
+    assert run(http(f"/relay/{video_id}"))[0] == 200
+    key = (video_id, "audio")
+    assert key in Api.RELAY_URLS
+    
+    Api.prune_relay_urls()
+    assert key in Api.RELAY_URLS
+    Api.RELAY_URLS[key]["expires_at"] = 0
+    Api.prune_relay_urls()
+    assert key not in Api.RELAY_URLS
@@ -0,0 +1,36 @@
+import asyncio
+import os
+
+import Api
+from conftest import FIXTURES
+
+def test_rendition_is_streamed_and_cached(run, http, video_id):
+    status, _, body = run(http(f"/audio/{video_id}?codec=opus&bitrate=96k"))
+    
+    assert status == 200 and body == b"FAKEFFMPEG" + FIXTURES["audio.m4a"]
+    with open(Api.cache_lookup(video_id, "audio", "opus_96k"), "rb") as f:
+        assert f.read() == body
+
+def test_disconnect_before_first_byte_stops_the_transcode(run, http, video_id, monkeypatch):
+    assert run(http(f"/audio/{video_id}"))[0] == 200  # the source is cached
+    monkeypatch.setenv("FAKE_FFMPEG_DELAY", "0.5")
+    spawned = []
+    spawn = asyncio.create_subprocess_exec
+    
+    async def spy(*args, **kwargs):
+        proc = await spawn(*args, **kwargs)
+        spawned.append(proc)
+        return proc
+        
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", spy)
+    lane = Api.LANES["transcode"]
+    active = lane.active
+    
+    run(http(f"/audio/{video_id}?codec=opus&bitrate=96k", fail_on_start=True))
+    
+    assert len(spawned) == 1 and spawned[0].returncode is not None
+    assert lane.active == active
+    assert spawned[0].pid not in Api.RUNNING_PROCESSES
+    assert not Api.TRANSCODES_IN_PROGRESS
+    assert Api.cache_lookup(video_id, "audio", "opus_96k") is None
+    assert not [f for f in os.listdir(Api.CACHE_DIR) if f.startswith(video_id) and Api.TEE_FILE_MARKER in f]
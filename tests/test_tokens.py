@@ -0,0 +1,27 @@
+import json
+import os
+
+import Api
+
+def test_used_token_only_serves_seeks_of_its_own_session(run, http, video_id):
+    path = os.path.join(Api.CACHE_DIR, f"{video_id}.audio.test{Api.WORK_FILE_MARKER}m4a")
+    with open(path, "wb") as f:
+        f.write(b"\1" * 10_000)
+    Api.cache_store(video_id, "audio", path, "test")
+    
+    status, _, body = run(http(f"/download?url={video_id}&type=audio"))
+    token = json.loads(body)["download_token"]
+    stream = f"/stream/{video_id}?type=audio&token={token}"
+    
+    status, _, body = run(http(stream))
+    assert status == 200 and len(body) == 10_000
+    # Refetching from the start, or from another client, is a new download
+    assert run(http(stream, headers={"Range": "bytes=0-"}))[0] == 401
+    assert run(http(stream))[0] == 401
+    assert run(http(stream, headers={"Range": "bytes=5000-"}, client="10.0.0.2"))[0] == 401
+    # The player seeking is fine
+    status, _, body = run(http(stream, headers={"Range": "bytes=5000-"}))
+    assert status == 206 and len(body) == 5_000
+    # ...but not once the session has gone quiet
+    Api.download_tokens[token]["last_used_at"] -= Api.timedelta(seconds=Api.TOKEN_SEEK_WINDOW + 1)
+    assert run(http(stream, headers={"Range": "bytes=5000-"}))[0] == 401